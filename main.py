@@ -1,5 +1,6 @@
 import flet as ft
-from views import EasyScanView
+from views import EasyScanView, SettingsView
+from services import scan_service
 
 # --- Constants ---
 def main(page: ft.Page):
@@ -13,11 +14,23 @@ def main(page: ft.Page):
     page.dark_theme = ft.Theme(color_scheme_seed="blue")
     page.theme_mode = ft.ThemeMode.DARK
 
+    # スキャンサービスに接続（起動していなければプロセス内で起動）
+    service_url = scan_service.ensure_service()
+
     # 各ビューのインスタンスを作成
-    scan_view = EasyScanView(page)
+    scan_view = EasyScanView(page, service_url)
+    settings_view = SettingsView(page)
 
-    # メインコンテナ
-    main_container = ft.Container(content=scan_view, expand=True, padding=ft.padding.all(20))
+    # メインコンテナ（スキャン / 設定の切り替え）
+    view_tabs = ft.Tabs(
+        selected_index=0,
+        tabs=[
+            ft.Tab(text="Scan", content=ft.Container(content=scan_view, padding=ft.padding.only(top=10))),
+            ft.Tab(text="Settings", content=ft.Container(content=settings_view, padding=ft.padding.only(top=10))),
+        ],
+        expand=True,
+    )
+    main_container = ft.Container(content=view_tabs, expand=True, padding=ft.padding.all(20))
 
     # ページ全体のレイアウト
     page.add(main_container)
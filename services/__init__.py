@@ -1 +1,16 @@
 from . import scan_logic
+from . import stateless
+from . import resolver
+from . import distributed
+from . import rate_limit
+from . import scan_service
+from . import scan_client
+from . import exporters
+from . import progress
+from . import engines
+from . import tuning
+from . import host_cache
+from . import fast_parse
+from . import link
+from . import fanout
+from . import watch
@@ -0,0 +1,454 @@
+from . import scan_logic
+from .resolver import resolve_in_background
+import ipaddress
+import json
+import multiprocessing
+import socket
+import socketserver
+import threading
+import time
+import uuid
+
+'''分散スキャン（コーディネータ / ワーカー）
+コーディネータはスキャン（ターゲット × ポート × プロトコル）をシャードに分割し、
+TCP上の改行区切りJSONでワーカーに配布する。ワーカーは scan_logic.scan_ports でシャードを処理し、
+結果を得られた順に送り返す。切断またはハートビートの途絶したワーカーのシャードは、受信済みの結果を残して
+未完了のポートだけ再割り当てされる。
+
+ホスト名のターゲットはバックグラウンドで解決し、解決できたものからシャードを追加する
+（IPアドレスのターゲットのスキャンは名前解決を待たずに始まる）。
+
+1台のLinuxで複数のローカルワーカープロセスを起動して動作確認できる（start_local_workers）。
+'''
+
+
+# --- Constants ---
+COORDINATOR_HOST_DEFAULT = "127.0.0.1"
+COORDINATOR_PORT_DEFAULT = 47100
+SHARD_PORT_COUNT = 256 # 1シャードあたりのポート数
+LEASE_TIMEOUT = 30 # ハートビートが途絶えてからシャードを再割り当てするまでの秒数
+HEARTBEAT_INTERVAL = 5
+WORKER_IDLE_WAIT = 1 # 割り当て可能なシャードが無い場合の再問い合わせ間隔（秒）
+WORKER_CONNECT_RETRIES = 10
+
+
+# --- Message Helpers ---
+def _send_message(wfile, message: dict, lock=None):
+    data = (json.dumps(message) + "\n").encode()
+    if lock:
+        with lock:
+            wfile.write(data)
+            wfile.flush()
+    else:
+        wfile.write(data)
+        wfile.flush()
+
+
+def _read_message(rfile) -> dict | None:
+    line = rfile.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+# --- Sharding ---
+def make_shards(targets: list[str], tcp_ports: list[int] = None, udp_ports: list[int] = None,
+                shard_size: int = SHARD_PORT_COUNT, stateless: bool = False, first_id: int = 0) -> list[dict]:
+    """ターゲット × プロトコル × ポート区間 のシャードに分割する
+    Args:
+        stateless (bool): TrueでTCPのシャードをステートレスSYNスキャンで実行させる
+        first_id (int): 最初のシャードID（後から追加するシャードのIDを既存のものと重ねない）
+    Returns:
+        shards (list[dict]) e.g.: [{'id': 0, 'target': '10.0.0.1', 'protocol': 'tcp', 'ports': [1, 2, ...],
+                                    'stateless': False}]
+    """
+    shards = []
+    for target in targets:
+        for protocol, ports in (('tcp', tcp_ports), ('udp', udp_ports)):
+            if not ports:
+                continue
+            for start in range(0, len(ports), shard_size):
+                shards.append({
+                    'id': first_id + len(shards),
+                    'target': target,
+                    'protocol': protocol,
+                    'ports': list(ports[start:start + shard_size]),
+                    'stateless': stateless and protocol == 'tcp',
+                })
+    return shards
+
+
+def _is_address(target: str) -> bool:
+    try:
+        ipaddress.ip_address(target)
+        return True
+    except ValueError:
+        return False
+
+
+# --- Coordinator ---
+class _CoordinatorServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ScanCoordinator:
+    """シャードの配布・再割り当てと結果のマージを行うコーディネータ"""
+
+    def __init__(self, shards: list[dict], host: str = COORDINATOR_HOST_DEFAULT,
+                 port: int = COORDINATOR_PORT_DEFAULT, on_result=None, sealed: bool = True):
+        """
+        Args:
+            shards (list[dict]): make_shards で作成したシャード
+            host (str): 待ち受けアドレス
+            port (int): 待ち受けポート（0で自動割り当て）
+            on_result (callable, optional): マージ済みの結果を受け取るコールバック
+            sealed (bool): Falseの場合は add_shards でシャードが追加され得るため、seal() まで完了にしない
+        """
+        self.shards = {shard['id']: shard for shard in shards}
+        self.on_result = on_result
+        self._pending = list(self.shards) # 未割り当てシャードID
+        self._leases = {} # shard_id -> (worker_id, last_heartbeat)
+        self._partial = {} # (shard_id, worker_id) -> 結果バッファ
+        self._completed = set()
+        self._sealed = sealed
+        self._results = {} # (host, port, type) -> result
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._server = None
+        self.address = (host, port)
+
+    # --- Shard State ---
+    def add_shards(self, shards: list[dict]):
+        """シャードを追加する（IDは make_shards の first_id=next_shard_id() で重ならないようにする）"""
+        with self._lock:
+            for shard in shards:
+                self.shards[shard['id']] = shard
+                self._pending.append(shard['id'])
+
+    def next_shard_id(self) -> int:
+        with self._lock:
+            return max(self.shards, default=-1) + 1
+
+    def seal(self):
+        """これ以上シャードを追加しないことを通知する 全シャードが完了済みであればここで完了になる"""
+        with self._lock:
+            self._sealed = True
+            self._check_done_locked()
+
+    def _check_done_locked(self):
+        if self._sealed and len(self._completed) == len(self.shards):
+            self._done.set()
+
+    def _lease(self, worker_id: str) -> dict | None:
+        with self._lock:
+            if not self._pending:
+                return None
+            shard_id = self._pending.pop(0)
+            self._leases[shard_id] = (worker_id, time.monotonic())
+            self._partial[(shard_id, worker_id)] = []
+            return self.shards[shard_id]
+
+    def _heartbeat(self, worker_id: str):
+        now = time.monotonic()
+        with self._lock:
+            for shard_id, (owner, _) in list(self._leases.items()):
+                if owner == worker_id:
+                    self._leases[shard_id] = (owner, now)
+
+    def _add_partial(self, worker_id: str, shard_id: int, result: dict):
+        with self._lock:
+            buffer = self._partial.get((shard_id, worker_id))
+            # 再割り当て済み（期限切れ）のリースからの結果は破棄
+            if buffer is not None:
+                buffer.append(result)
+
+    def _merge_locked(self, buffer: list[dict]) -> list[dict]:
+        """結果をマージし、新しく追加したものを返す（ロック保持中に呼ぶ）"""
+        merged = []
+        for result in buffer:
+            key = (result.get('host'), result['port'], result.get('type'))
+            if key not in self._results:
+                self._results[key] = result
+                merged.append(result)
+        return merged
+
+    def _emit(self, merged: list[dict]):
+        if self.on_result:
+            for result in merged:
+                self.on_result(result)
+
+    def _complete(self, worker_id: str, shard_id: int):
+        with self._lock:
+            buffer = self._partial.pop((shard_id, worker_id), None)
+            lease = self._leases.get(shard_id)
+            if buffer is None or lease is None or lease[0] != worker_id or shard_id in self._completed:
+                return
+            del self._leases[shard_id]
+            self._completed.add(shard_id)
+            merged = self._merge_locked(buffer)
+            self._check_done_locked()
+        self._emit(merged)
+
+    def _requeue(self, worker_id: str | None = None, expired_before: float | None = None):
+        """切断したワーカー、またはリース期限切れのシャードを未割り当てに戻す
+        それまでに受信した結果はマージし、シャードは未完了のポートだけにして再割り当てする。
+        """
+        merged = []
+        with self._lock:
+            for shard_id, (owner, last_seen) in list(self._leases.items()):
+                if (worker_id is not None and owner == worker_id) or \
+                   (expired_before is not None and last_seen < expired_before):
+                    del self._leases[shard_id]
+                    buffer = self._partial.pop((shard_id, owner), None) or []
+                    merged.extend(self._merge_locked(buffer))
+                    shard = self.shards[shard_id]
+                    finished = {result['port'] for result in buffer}
+                    remaining = [port for port in shard['ports'] if port not in finished]
+                    if not remaining:
+                        self._completed.add(shard_id)
+                        self._check_done_locked()
+                        continue
+                    self.shards[shard_id] = dict(shard, ports=remaining)
+                    self._pending.append(shard_id)
+                    print(f"Reassigning shard {shard_id} (worker {owner} lost, {len(remaining)} ports left)")
+        self._emit(merged)
+
+    def _reaper(self):
+        while not self._done.wait(HEARTBEAT_INTERVAL):
+            self._requeue(expired_before=time.monotonic() - LEASE_TIMEOUT)
+
+    # --- Server ---
+    def _make_handler(self):
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                worker_id = None
+                try:
+                    while True:
+                        message = _read_message(self.rfile)
+                        if message is None:
+                            break
+                        op = message.get('op')
+                        if op == 'hello':
+                            worker_id = message.get('worker') or uuid.uuid4().hex
+                        elif op == 'lease':
+                            shard = coordinator._lease(worker_id)
+                            if shard:
+                                _send_message(self.wfile, {'op': 'shard', 'shard': shard})
+                            elif coordinator._done.is_set():
+                                _send_message(self.wfile, {'op': 'done'})
+                                break
+                            else:
+                                _send_message(self.wfile, {'op': 'wait'})
+                        elif op == 'heartbeat':
+                            coordinator._heartbeat(worker_id)
+                        elif op == 'result':
+                            coordinator._heartbeat(worker_id)
+                            coordinator._add_partial(worker_id, message['shard_id'], message['result'])
+                        elif op == 'complete':
+                            coordinator._complete(worker_id, message['shard_id'])
+                except (ConnectionError, json.JSONDecodeError) as e:
+                    print(f"Worker {worker_id} connection error: {e}")
+                finally:
+                    # 切断したワーカーのシャードを再割り当て
+                    if worker_id:
+                        coordinator._requeue(worker_id=worker_id)
+
+        return Handler
+
+    def start(self):
+        """コーディネータのサーバーをバックグラウンドで起動する"""
+        self._server = _CoordinatorServer(self.address, self._make_handler())
+        self.address = self._server.server_address
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._reaper, daemon=True).start()
+        with self._lock:
+            self._check_done_locked()
+
+    def wait(self, timeout: float | None = None) -> list[dict]:
+        """全シャードの完了を待ち、マージした結果を返す"""
+        self._done.wait(timeout)
+        return self.results()
+
+    def results(self) -> list[dict]:
+        with self._lock:
+            merged = list(self._results.values())
+        merged.sort(key=lambda x: (x.get('host', ''), x['port'], x.get('type', '')))
+        return merged
+
+    def shutdown(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+# --- Worker ---
+def run_worker(host: str = COORDINATOR_HOST_DEFAULT, port: int = COORDINATOR_PORT_DEFAULT, worker_id: str | None = None,
+               receivers: int | None = None):
+    """ワーカー本体 コーディネータからシャードを受け取り、scan_ports で処理して結果を返す
+    Args:
+        receivers (int, optional): ステートレスなシャードの受信プロセス数（ワーカーのCPU数に合わせて指定する）
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+    sock = None
+    for _ in range(WORKER_CONNECT_RETRIES):
+        try:
+            sock = socket.create_connection((host, port))
+            break
+        except ConnectionRefusedError:
+            time.sleep(WORKER_IDLE_WAIT)
+    if sock is None:
+        print(f"Worker {worker_id}: coordinator {host}:{port} not reachable")
+        return
+
+    rfile = sock.makefile('rb')
+    wfile = sock.makefile('wb')
+    write_lock = threading.Lock()
+    _send_message(wfile, {'op': 'hello', 'worker': worker_id}, write_lock)
+
+    try:
+        while True:
+            _send_message(wfile, {'op': 'lease'}, write_lock)
+            message = _read_message(rfile)
+            if message is None or message['op'] == 'done':
+                break
+            if message['op'] == 'wait':
+                time.sleep(WORKER_IDLE_WAIT)
+                continue
+
+            shard = message['shard']
+            scanning = threading.Event()
+            scanning.set()
+
+            # スキャン中のハートビート
+            def heartbeat():
+                while scanning.is_set():
+                    time.sleep(HEARTBEAT_INTERVAL)
+                    if scanning.is_set():
+                        _send_message(wfile, {'op': 'heartbeat'}, write_lock)
+
+            # 結果は得られた順に送る（リースが途中で失われても、送信済みの結果はコーディネータに残る）
+            def send_result(result: dict, shard_id: int = shard['id']):
+                _send_message(wfile, {'op': 'result', 'shard_id': shard_id, 'result': result}, write_lock)
+
+            threading.Thread(target=heartbeat, daemon=True).start()
+            try:
+                scan_logic.scan_ports(
+                    target_ip=shard['target'],
+                    tcp_ports=shard['ports'] if shard['protocol'] == 'tcp' else None,
+                    udp_ports=shard['ports'] if shard['protocol'] == 'udp' else None,
+                    stateless=shard.get('stateless', False),
+                    receivers=receivers,
+                    on_result=send_result,
+                    collect=False, # 結果は逐次コーディネーターへ送るのでワーカーには溜めない
+                )
+            finally:
+                scanning.clear()
+
+            _send_message(wfile, {'op': 'complete', 'shard_id': shard['id']}, write_lock)
+    except (ConnectionError, OSError) as e:
+        print(f"Worker {worker_id}: {e}")
+    finally:
+        sock.close()
+
+
+def start_local_workers(count: int, host: str = COORDINATOR_HOST_DEFAULT, port: int = COORDINATOR_PORT_DEFAULT,
+                        receivers: int | None = None) -> list:
+    """ノードの代わりにローカルのワーカープロセスを起動する"""
+    processes = []
+    for i in range(count):
+        process = multiprocessing.Process(target=run_worker, args=(host, port, f"local-{i}", receivers), daemon=False)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def distributed_scan(targets: list[str], tcp_ports: list[int] = None, udp_ports: list[int] = None,
+                     local_workers: int = 0, host: str = COORDINATOR_HOST_DEFAULT,
+                     port: int = COORDINATOR_PORT_DEFAULT, on_result=None, stateless: bool = False,
+                     receivers: int | None = None) -> list[dict]:
+    """コーディネータを起動し、全シャードの完了まで待って結果を返す
+    Args:
+        targets (list[str]): スキャン対象のIPアドレスまたはホスト名のリスト
+            ホスト名はバックグラウンドで解決し、解決できたものから先頭のアドレスのシャードを追加する
+        tcp_ports (list[int], optional): TCPポートのリスト
+        udp_ports (list[int], optional): UDPポートのリスト
+        local_workers (int): 起動するローカルワーカー数（0の場合は外部ワーカーの接続を待つ）
+        host (str), port (int): コーディネータの待ち受けアドレス
+        on_result (callable, optional): マージ済みの結果を受け取るコールバック
+        stateless (bool): TrueでTCPをステートレスSYNスキャンで実行
+        receivers (int, optional): ローカルワーカーの受信プロセス数（stateless_syn_scan を参照）
+    Returns:
+        all_results (list[dict]): ホスト・ポート順にソートした全結果
+    """
+    addresses = [target for target in targets if _is_address(target)]
+    names = [target for target in targets if not _is_address(target)]
+    coordinator = ScanCoordinator(make_shards(addresses, tcp_ports, udp_ports, stateless=stateless), host, port,
+                                  on_result, sealed=not names)
+    coordinator.start()
+    processes = start_local_workers(local_workers, *coordinator.address, receivers=receivers)
+
+    # ホスト名は解決できたものから順にシャードを追加する（解決待ちの間もIPアドレスのシャードはスキャンする）
+    def on_resolved(name: str, resolved: list[str]):
+        if not resolved:
+            print(f"Error: could not resolve {name}")
+            return
+        print(f"Resolved {name} -> {resolved[0]}")
+        coordinator.add_shards(make_shards([resolved[0]], tcp_ports, udp_ports, stateless=stateless,
+                                           first_id=coordinator.next_shard_id()))
+
+    if names:
+        resolve_in_background(names, on_resolved, on_complete=coordinator.seal)
+    try:
+        return coordinator.wait()
+    finally:
+        coordinator.shutdown()
+        for process in processes:
+            process.join()
+
+
+# --- Entry Point ---
+if __name__ == "__main__":
+    import argparse
+    from utils import parse_port_range
+
+    parser = argparse.ArgumentParser(description="Distributed EasyScan coordinator / worker")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    coordinator_parser = subparsers.add_parser("coordinator")
+    coordinator_parser.add_argument("targets", nargs="+")
+    coordinator_parser.add_argument("--tcp", default="")
+    coordinator_parser.add_argument("--udp", default="")
+    coordinator_parser.add_argument("--local-workers", type=int, default=0)
+    coordinator_parser.add_argument("--stateless", action="store_true", help="run TCP shards as stateless SYN scans")
+    coordinator_parser.add_argument("--receivers", type=int, default=None,
+                                    help="receiver processes per local worker for stateless shards")
+    coordinator_parser.add_argument("--listen", default=COORDINATOR_HOST_DEFAULT)
+    coordinator_parser.add_argument("--port", type=int, default=COORDINATOR_PORT_DEFAULT)
+
+    worker_parser = subparsers.add_parser("worker")
+    worker_parser.add_argument("--coordinator", default=COORDINATOR_HOST_DEFAULT)
+    worker_parser.add_argument("--port", type=int, default=COORDINATOR_PORT_DEFAULT)
+    worker_parser.add_argument("--receivers", type=int, default=None,
+                               help="receiver processes for stateless shards (default: 1 per target)")
+
+    args = parser.parse_args()
+    if args.mode == "worker":
+        run_worker(args.coordinator, args.port, receivers=args.receivers)
+    else:
+        all_results = distributed_scan(
+            args.targets,
+            tcp_ports=parse_port_range(args.tcp) if args.tcp else None,
+            udp_ports=parse_port_range(args.udp, protocol='udp') if args.udp else None,
+            local_workers=args.local_workers,
+            stateless=args.stateless,
+            receivers=args.receivers,
+            host=args.listen,
+            port=args.port,
+        )
+        for res in all_results:
+            if res['status'] != 'closed':
+                print(f"{res.get('host')} {res['port']}/{res.get('type')} {res['status']}")
@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import errno
+import functools
+import os
+import platform
+import socket
+import time
+
+'''スキャンエンジンのインターフェースとレジストリ
+各エンジンは1ポートを調べる probe() と、能力・コストのメタデータを持つ。
+scan_ports はプロトコルごとに、実行権限で利用可能なエンジンのうち最もコストの低いものを自動選択する
+（auto_select=False のエンジンは名前を指定した場合だけ使う）。
+'''
+
+
+# --- Constants ---
+CAP_NET_RAW = 13 # linux/capability.h
+CONNECT_MAX_WORKERS = 20
+PROCESS_WORKERS_LIMIT = 16 # 調整値で指定できる同時実行数の上限
+THREAD_WORKERS_LIMIT = 256
+ENGINE_AUTO = "auto"
+
+# --- Connect error codes ---
+CONNECT_REFUSED_CODES = (errno.ECONNREFUSED, 10061) # 10061: WSAECONNREFUSED (Windows)
+
+
+# --- Engine Interface ---
+class ScanEngine:
+    """スキャンエンジンの基底クラス
+    Attributes:
+        name (str): レジストリ上の名前
+        protocol (str): 'tcp' / 'udp'
+        description (str): 表示用の説明
+        requires_raw (bool): rawソケット（root / CAP_NET_RAW / Npcap）が必要か
+        cost (float): 1プローブあたりの相対コスト（小さいほど高速）
+        executor (str): 'process' / 'thread' プローブを実行するプールの種類
+        max_workers (int): 同時実行数
+        chunked (bool): Trueの場合、ポートをまとめて probe_many でプールに渡す（プロセス間通信の削減）
+        packets_per_port (int): 1ポートあたりに送るパケット数（送信予算はパケット単位で消費する）
+        auto_select (bool): Falseの場合は自動選択の対象にしない（名前を指定した場合だけ使う）
+    """
+    name = ""
+    protocol = "tcp"
+    description = ""
+    requires_raw = False
+    cost = 1.0
+    executor = "thread"
+    max_workers = 1
+    chunked = False
+    packets_per_port = 1
+    auto_select = True
+
+    def probe(self, target_ip: str, port: int, timeout: float) -> dict:
+        """1ポートを調べる Returns: e.g. {'port': 80, 'status': 'open', 'rtt': 0.004}（rtt は応答があった場合のみ）"""
+        raise NotImplementedError
+
+    def probe_many(self, target_ip: str, ports: list[int], timeout: float) -> list[dict]:
+        """複数ポートを調べる 既定では probe を順に呼ぶ（まとめて送受信できるエンジンは上書きする）"""
+        return [self.probe(target_ip, port, timeout) for port in ports]
+
+    def worker_count(self, max_workers: int | None = None) -> int:
+        """実際の同時実行数 max_workers はプールの種類ごとの上限で制限する"""
+        limit = PROCESS_WORKERS_LIMIT if self.executor == "process" else THREAD_WORKERS_LIMIT
+        return min(max_workers or self.max_workers, limit)
+
+    def make_executor(self, max_workers: int | None = None):
+        """プローブを実行するプールを作成する"""
+        pool_class = ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+        return pool_class(max_workers=self.worker_count(max_workers))
+
+    def info(self) -> dict:
+        return {
+            'name': self.name,
+            'protocol': self.protocol,
+            'description': self.description,
+            'requires_raw': self.requires_raw,
+            'cost': self.cost,
+            'auto_select': self.auto_select,
+        }
+
+
+class ConnectEngine(ScanEngine):
+    """OSのconnect()による3wayハンドシェイクスキャン 特権不要"""
+    name = "connect"
+    protocol = "tcp"
+    description = "TCP connect (no privileges)"
+    requires_raw = False
+    cost = 2.0 # ハンドシェイク完了とクローズの分だけSYNより重い
+    executor = "thread"
+    max_workers = CONNECT_MAX_WORKERS
+
+    def probe(self, target_ip: str, port: int, timeout: float) -> dict:
+        family = socket.AF_INET6 if ':' in target_ip else socket.AF_INET
+        sock = None
+        try:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            started = time.perf_counter()
+            result = sock.connect_ex((target_ip, port))
+            rtt = round(time.perf_counter() - started, 6)
+            # 接続成功
+            if result == 0:
+                return {'port': port, 'status': 'open', 'rtt': rtt}
+            # 接続拒否（RST）
+            elif result in CONNECT_REFUSED_CODES:
+                return {'port': port, 'status': 'closed', 'rtt': rtt}
+            # 到達不能・応答なし
+            else:
+                return {'port': port, 'status': 'filtered'}
+        # タイムアウトした場合
+        except socket.timeout:
+            return {'port': port, 'status': 'filtered'}
+        # OSErrorを個別に捕捉
+        except OSError as oe:
+            return {'port': port, 'status': f'oserror: {oe}'}
+        finally:
+            if sock:
+                sock.close()
+
+
+# --- Registry ---
+_ENGINES = {}
+
+
+def register_engine(engine: ScanEngine):
+    """エンジンを登録する（同名は上書き）"""
+    _ENGINES[engine.name] = engine
+
+
+def get_engine(name: str) -> ScanEngine:
+    try:
+        return _ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown scan engine: {name}") from None
+
+
+def list_engines(protocol: str | None = None) -> list[ScanEngine]:
+    """登録済みのエンジン（コスト順）"""
+    engines = [engine for engine in _ENGINES.values() if protocol is None or engine.protocol == protocol]
+    return sorted(engines, key=lambda engine: engine.cost)
+
+
+@functools.lru_cache(maxsize=1)
+def has_raw_privileges() -> bool:
+    """rawソケットを扱える権限があるか（root / CAP_NET_RAW / Windowsの管理者）"""
+    if platform.system() == "Windows":
+        try:
+            import ctypes
+            return bool(ctypes.windll.shell32.IsUserAnAdmin())
+        except (AttributeError, OSError):
+            return False
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        return True
+    # Linux: 実効ケーパビリティに CAP_NET_RAW が含まれるか
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("CapEff:"):
+                    return bool(int(line.split()[1], 16) & (1 << CAP_NET_RAW))
+    except (OSError, ValueError):
+        pass
+    return False
+
+
+def available_engines(protocol: str | None = None) -> list[ScanEngine]:
+    """現在の権限で利用可能なエンジン（コスト順）"""
+    raw_ok = has_raw_privileges()
+    return [engine for engine in list_engines(protocol) if raw_ok or not engine.requires_raw]
+
+
+def select_engine(protocol: str, name: str | None = None) -> ScanEngine | None:
+    """エンジンを選択する name が None / 'auto' の場合は利用可能な最速のエンジン"""
+    if name and name != ENGINE_AUTO:
+        return get_engine(name)
+    # 利用可能なものが無い場合は最速の登録エンジンを使う（権限エラーは結果に記録される）
+    # auto_select=False のエンジンはコストに関わらず選ばない
+    engines = [engine for engine in available_engines(protocol) if engine.auto_select] or \
+        [engine for engine in list_engines(protocol) if engine.auto_select]
+    return engines[0] if engines else None
+
+
+register_engine(ConnectEngine())
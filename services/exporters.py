@@ -0,0 +1,217 @@
+from utils import lookup_service
+from xml.sax.saxutils import quoteattr
+import csv
+import gzip
+import json
+import threading
+import time
+
+'''スキャン結果のストリーミング出力
+結果を受け取るたびに書き込み、FLUSH_BATCH_SIZE 件ごとにフラッシュする。
+JSONL / CSV は結果を保持せず、結果の件数に関わらずメモリ使用量は一定。
+nmap XML は DTD の要素順とホストごとのまとまりのため、出力する <port> 要素（closed を除く）と
+ホスト・プロトコルごとの closed の件数を溜めて close() で書き出す（NmapXmlExporter を参照）。
+各エクスポーターは呼び出し可能なので scan_ports の on_result にそのまま渡せる。
+'''
+
+
+# --- Constants ---
+FLUSH_BATCH_SIZE = 500
+CSV_FIELDS = ['host', 'port', 'protocol', 'state', 'service', 'description']
+EXPORT_FORMATS = ('jsonl', 'csv', 'xml')
+
+# --- nmap XML mapping ---
+NMAP_STATES = ('open', 'closed', 'filtered', 'unfiltered', 'open|filtered', 'closed|filtered')
+NMAP_REASONS = {
+    ('tcp', 'open'): 'syn-ack',
+    ('tcp', 'closed'): 'reset',
+    ('tcp', 'filtered'): 'no-response',
+    ('udp', 'open'): 'udp-response',
+    ('udp', 'closed'): 'port-unreach',
+    ('udp', 'filtered'): 'admin-prohibited',
+    ('udp', 'open|filtered'): 'no-response',
+}
+
+
+class ResultExporter:
+    """エクスポーターの基底クラス"""
+
+    def __init__(self, path: str, compress: bool | None = None, batch_size: int = FLUSH_BATCH_SIZE,
+                 port_services: dict | None = None):
+        """
+        Args:
+            path (str): 出力先ファイル
+            compress (bool | None): gzip圧縮 Noneの場合は拡張子 .gz で判定
+            batch_size (int): フラッシュ間隔（件数）
+            port_services (dict | None): サービス名の定義（services_name.json）
+        """
+        self.path = path
+        self.compress = path.endswith('.gz') if compress is None else compress
+        self.batch_size = batch_size
+        self.port_services = port_services or {}
+        self.count = 0
+        self._lock = threading.Lock()
+        if self.compress:
+            self._file = gzip.open(path, 'wt', encoding='utf-8', newline='')
+        else:
+            self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._closed = False
+        self._write_header()
+
+    def __call__(self, result: dict):
+        self.write(result)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, result: dict):
+        """結果を1件書き込む（スレッドセーフ）"""
+        with self._lock:
+            if self._closed:
+                return
+            self._write_record(result)
+            self.count += 1
+            if self.count % self.batch_size == 0:
+                self._file.flush()
+
+    def write_many(self, results):
+        for result in results:
+            self.write(result)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._write_footer()
+            self._file.close()
+            self._closed = True
+
+    def _service(self, result: dict) -> tuple[str, str]:
+        return lookup_service(self.port_services, result['port'], result.get('type', ''))
+
+    def _write_header(self):
+        pass
+
+    def _write_record(self, result: dict):
+        raise NotImplementedError
+
+    def _write_footer(self):
+        pass
+
+
+class JsonlExporter(ResultExporter):
+    """JSON Lines 1行1結果"""
+
+    def _write_record(self, result: dict):
+        self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+class CsvExporter(ResultExporter):
+    """CSV ヘッダ付き"""
+
+    def _write_header(self):
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(CSV_FIELDS)
+
+    def _write_record(self, result: dict):
+        service_name, description = self._service(result)
+        self._writer.writerow([
+            result.get('host', ''),
+            result['port'],
+            result.get('type', ''),
+            result['status'],
+            service_name,
+            description,
+        ])
+
+
+class NmapXmlExporter(ResultExporter):
+    """nmap 互換の XML（ndiff / nmap XML パーサで読み込める形式）
+    nmap の DTD（<ports> は extraports* の後に port*）に合わせ、ホストごとに出力を溜めて close() でまとめて書き出す。
+    ホストの順序が混ざった結果でも1ホストにつき1つの <host> 要素になる。
+    溜めるのは出力する <port> 要素（closed 以外、include_closed=True の場合は closed も）と closed の件数のみ。
+    closed は include_closed=False の場合 <extraports> に件数だけ出力する。
+    """
+
+    def __init__(self, path: str, compress: bool | None = None, batch_size: int = FLUSH_BATCH_SIZE,
+                 port_services: dict | None = None, include_closed: bool = False, args: str = "easyscan"):
+        self.include_closed = include_closed
+        self.args = args
+        self.start_time = int(time.time())
+        self._hosts = {} # host -> {'starttime': int, 'ports': [<port> 要素], 'closed': {protocol: 件数}}
+        super().__init__(path, compress, batch_size, port_services)
+
+    def _write_header(self):
+        self._file.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE nmaprun>\n')
+        self._file.write(
+            f'<nmaprun scanner="nmap" args={quoteattr(self.args)} start="{self.start_time}" '
+            f'startstr={quoteattr(time.ctime(self.start_time))} version="7.94" xmloutputversion="1.05">\n'
+        )
+        self._file.write('<verbose level="0"/>\n<debugging level="0"/>\n')
+
+    def _write_record(self, result: dict):
+        host = self._hosts.setdefault(result.get('host', ''), {'starttime': int(time.time()), 'ports': [], 'closed': {}})
+        status = result['status']
+        protocol = result.get('type', 'tcp')
+        if status == 'closed' and not self.include_closed:
+            host['closed'][protocol] = host['closed'].get(protocol, 0) + 1
+            return
+
+        state = status if status in NMAP_STATES else 'filtered'
+        reason = NMAP_REASONS.get((protocol, state), 'no-response')
+        service_name, _ = self._service(result)
+        element = (
+            f'<port protocol={quoteattr(protocol)} portid="{result["port"]}">'
+            f'<state state={quoteattr(state)} reason="{reason}" reason_ttl="0"/>'
+        )
+        if service_name:
+            element += f'<service name={quoteattr(service_name)} method="table" conf="3"/>'
+        host['ports'].append(element + '</port>\n')
+
+    def _write_host(self, address: str, host: dict):
+        addrtype = 'ipv6' if ':' in address else 'ipv4'
+        self._file.write(f'<host starttime="{host["starttime"]}">')
+        self._file.write('<status state="up" reason="user-set" reason_ttl="0"/>\n')
+        self._file.write(f'<address addr={quoteattr(address)} addrtype="{addrtype}"/>\n<hostnames>\n</hostnames>\n<ports>')
+        closed_count = sum(host['closed'].values())
+        if closed_count:
+            self._file.write(f'<extraports state="closed" count="{closed_count}">\n')
+            for protocol, count in sorted(host['closed'].items()):
+                reason = NMAP_REASONS.get((protocol, 'closed'), 'reset')
+                self._file.write(f'<extrareasons reason="{reason}" count="{count}" proto={quoteattr(protocol)}/>\n')
+            self._file.write('</extraports>\n')
+        self._file.writelines(host['ports'])
+        self._file.write('</ports>\n<times srtt="0" rttvar="0" to="0"/>\n</host>\n')
+
+    def _write_footer(self):
+        for address, host in self._hosts.items():
+            self._write_host(address, host)
+        end_time = int(time.time())
+        host_count = len(self._hosts)
+        self._file.write(
+            f'<runstats><finished time="{end_time}" timestr={quoteattr(time.ctime(end_time))} '
+            f'elapsed="{end_time - self.start_time}" summary="EasyScan done; {host_count} IP address(es) scanned" exit="success"/>'
+            f'<hosts up="{host_count}" down="0" total="{host_count}"/>\n</runstats>\n</nmaprun>\n'
+        )
+
+
+EXPORTERS = {
+    'jsonl': JsonlExporter,
+    'csv': CsvExporter,
+    'xml': NmapXmlExporter,
+}
+
+
+def open_exporter(path: str, export_format: str | None = None, **kwargs) -> ResultExporter:
+    """拡張子（.jsonl / .csv / .xml、任意で .gz）または export_format からエクスポーターを作成する"""
+    if export_format is None:
+        name = path[:-3] if path.endswith('.gz') else path
+        export_format = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+        if export_format == 'json':
+            export_format = 'jsonl'
+    if export_format not in EXPORTERS:
+        raise ValueError(f"Unsupported export format: {export_format} (supported: {', '.join(EXPORT_FORMATS)})")
+    return EXPORTERS[export_format](path, **kwargs)
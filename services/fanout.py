@@ -0,0 +1,294 @@
+from multiprocessing import shared_memory
+import ctypes
+import itertools
+import multiprocessing
+import os
+import socket
+import struct
+import threading
+import time
+
+'''PACKET_FANOUT による複数プロセスの受信（Linux）
+受信プロセスごとに AF_PACKET ソケットを開いて同じ fanout グループ（フローのハッシュで振り分け）に参加させ、
+スキャンの応答だけを通す BPF フィルタをカーネル側で適用する。各プロセスは受信したバイト列を分類し、
+結果を共有メモリ上のリングバッファ（単一生産者・単一消費者、ロック無し）に書き込む。
+集計側（親プロセス）のスレッドがリングから結果を読み出して handler に渡す。
+'''
+
+
+# --- Constants ---
+FANOUT_RECEIVERS_MAX = 8
+FANOUT_RING_SLOTS = 65536 # 受信プロセスあたりのリングの結果数 溢れた結果は dropped として数える
+FANOUT_POLL_INTERVAL = 0.005 # 集計スレッドがリングを確認する間隔（秒）
+FANOUT_RECV_TIMEOUT = 0.2 # 受信プロセスが停止を確認する間隔（秒）
+FANOUT_RECV_BUFFER = 65535
+ETH_P_IP = 0x0800
+
+# --- Socket options (linux/if_packet.h, asm-generic/socket.h) ---
+SOL_PACKET = 263
+PACKET_FANOUT = 18
+PACKET_FANOUT_HASH = 0
+PACKET_FANOUT_FLAG_DEFRAG = 0x8000
+SO_ATTACH_FILTER = 26
+
+# --- Classic BPF (linux/filter.h) ---
+BPF_LD_W_ABS = 0x20
+BPF_LD_H_ABS = 0x28
+BPF_LD_B_ABS = 0x30
+BPF_LD_H_IND = 0x48
+BPF_LDX_B_MSH = 0xb1
+BPF_JEQ_K = 0x15
+BPF_JGE_K = 0x35
+BPF_JSET_K = 0x45
+BPF_RET_K = 0x06
+SKF_AD_PKTTYPE = 0xfffff000 + 4 # SKF_AD_OFF + SKF_AD_PKTTYPE
+BPF_ACCEPT_BYTES = 0x40000
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+ETH_HEADER_LEN = 14
+IP_FRAGMENT_MASK = 0x1FFF
+
+# --- Result encoding ---
+_RING_HEADER = struct.Struct("=QQQ") # head（生産者が更新）, tail（消費者が更新）, dropped
+_RING_RECORD = struct.Struct("=4sHBB") # host, port, status, type
+_U64 = struct.Struct("=Q")
+_U32 = struct.Struct("=I")
+_U32_BE = struct.Struct("!I")
+RESULT_STATUSES = ('open', 'closed', 'filtered', 'unknown')
+RESULT_TYPES = ('tcp', 'udp')
+
+_group_ids = itertools.count()
+
+
+# --- BPF ---
+def tcp_reply_filter(dport_min: int, dport_max: int) -> list[tuple[int, int, int, int]]:
+    """スキャンの応答だけを通す BPF プログラム（SOCK_DGRAM 用、オフセットはIPヘッダ先頭から）
+    自分が送信したパケットを除き、ICMP と、宛先ポートが [dport_min, dport_max) の非フラグメントのTCPを通す。
+    Returns:
+        (list[tuple]) (code, jt, jf, k) の命令列
+    """
+    return [
+        (BPF_LD_W_ABS, 0, 0, SKF_AD_PKTTYPE),        # 0: A = pkt_type
+        (BPF_JEQ_K, 10, 0, socket.PACKET_OUTGOING),  # 1: 送信したパケット -> reject
+        (BPF_LD_B_ABS, 0, 0, 9),                     # 2: A = IPプロトコル
+        (BPF_JEQ_K, 7, 0, IPPROTO_ICMP),             # 3: ICMP -> accept
+        (BPF_JEQ_K, 0, 7, IPPROTO_TCP),              # 4: TCP 以外 -> reject
+        (BPF_LD_H_ABS, 0, 0, 6),                     # 5: A = フラグ / フラグメントオフセット
+        (BPF_JSET_K, 5, 0, IP_FRAGMENT_MASK),        # 6: 後続のフラグメント -> reject
+        (BPF_LDX_B_MSH, 0, 0, 0),                    # 7: X = IPヘッダ長
+        (BPF_LD_H_IND, 0, 0, 2),                     # 8: A = TCP宛先ポート
+        (BPF_JGE_K, 0, 2, dport_min),                # 9: dport < dport_min -> reject
+        (BPF_JGE_K, 1, 0, dport_max),                # 10: dport >= dport_max -> reject
+        (BPF_RET_K, 0, 0, BPF_ACCEPT_BYTES),         # 11: accept
+        (BPF_RET_K, 0, 0, 0),                        # 12: reject
+    ]
+
+
+def l2_reply_filter(local_ip: str) -> list[tuple[int, int, int, int]]:
+    """送信用L2ソケット（link._SocketPool）で応答だけを受信する BPF プログラム（SOCK_RAW 用、オフセットはEthernetヘッダ先頭から）
+    自分が送信したフレームを除き、local_ip 宛ての IPv4 の TCP / UDP / ICMP を通す。
+    Args:
+        local_ip (str): プローブの送信元アドレス（応答の宛先）
+    Returns:
+        (list[tuple]) (code, jt, jf, k) の命令列
+    """
+    local_addr = _U32_BE.unpack(socket.inet_aton(local_ip))[0]
+    return [
+        (BPF_LD_W_ABS, 0, 0, SKF_AD_PKTTYPE),               # 0: A = pkt_type
+        (BPF_JEQ_K, 9, 0, socket.PACKET_OUTGOING),         # 1: 送信したフレーム -> reject
+        (BPF_LD_H_ABS, 0, 0, 12),                          # 2: A = EtherType
+        (BPF_JEQ_K, 0, 7, ETH_P_IP),                       # 3: IPv4 以外 -> reject
+        (BPF_LD_W_ABS, 0, 0, ETH_HEADER_LEN + 16),         # 4: A = 宛先IPアドレス
+        (BPF_JEQ_K, 0, 5, local_addr),                     # 5: 自分宛て以外 -> reject
+        (BPF_LD_B_ABS, 0, 0, ETH_HEADER_LEN + 9),          # 6: A = IPプロトコル
+        (BPF_JEQ_K, 2, 0, IPPROTO_TCP),                    # 7: TCP -> accept
+        (BPF_JEQ_K, 1, 0, IPPROTO_UDP),                    # 8: UDP -> accept
+        (BPF_JEQ_K, 0, 1, IPPROTO_ICMP),                   # 9: ICMP 以外 -> reject
+        (BPF_RET_K, 0, 0, BPF_ACCEPT_BYTES),               # 10: accept
+        (BPF_RET_K, 0, 0, 0),                              # 11: reject
+    ]
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [("code", ctypes.c_uint16), ("jt", ctypes.c_uint8), ("jf", ctypes.c_uint8), ("k", ctypes.c_uint32)]
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_uint16), ("filter", ctypes.POINTER(_SockFilter))]
+
+
+def attach_bpf(sock: socket.socket, program: list[tuple[int, int, int, int]]):
+    """BPF プログラムをソケットに設定する（libpcap / tcpdump 不要）"""
+    instructions = (_SockFilter * len(program))(*[_SockFilter(*instruction) for instruction in program])
+    fprog = _SockFprog(len(program), ctypes.cast(instructions, ctypes.POINTER(_SockFilter)))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, bytes(fprog))
+
+
+# --- Shared Memory Ring ---
+class _ResultRing:
+    """共有メモリ上の単一生産者・単一消費者リングバッファ
+    head は生産者（受信プロセス）だけが、tail は消費者（集計スレッド）だけが書き込む。
+    """
+
+    def __init__(self, slots: int = FANOUT_RING_SLOTS):
+        self.slots = slots
+        self.shm = shared_memory.SharedMemory(create=True, size=_RING_HEADER.size + slots * _RING_RECORD.size)
+        self.buf = self.shm.buf
+        _RING_HEADER.pack_into(self.buf, 0, 0, 0, 0)
+
+    def push(self, result: dict) -> bool:
+        head, tail, dropped = _RING_HEADER.unpack_from(self.buf, 0)
+        if head - tail >= self.slots:
+            _U64.pack_into(self.buf, 16, dropped + 1)
+            return False
+        _RING_RECORD.pack_into(self.buf, _RING_HEADER.size + (head % self.slots) * _RING_RECORD.size,
+                               socket.inet_aton(result['host']), result['port'],
+                               RESULT_STATUSES.index(result['status']), RESULT_TYPES.index(result['type']))
+        # レコードを書き終えてから head を進める（消費者はここまでしか読まない）
+        _U64.pack_into(self.buf, 0, head + 1)
+        return True
+
+    def pop_all(self) -> list[dict]:
+        head, tail, _ = _RING_HEADER.unpack_from(self.buf, 0)
+        results = []
+        for index in range(tail, head):
+            host, port, status, result_type = _RING_RECORD.unpack_from(
+                self.buf, _RING_HEADER.size + (index % self.slots) * _RING_RECORD.size)
+            results.append({'host': socket.inet_ntoa(host), 'port': port,
+                            'status': RESULT_STATUSES[status], 'type': RESULT_TYPES[result_type]})
+        _U64.pack_into(self.buf, 8, head)
+        return results
+
+    @property
+    def dropped(self) -> int:
+        return _RING_HEADER.unpack_from(self.buf, 0)[2]
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+# --- Receiver Processes ---
+def _open_fanout_socket(iface_name: str, group_id: int, program) -> socket.socket:
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM, socket.htons(ETH_P_IP))
+    try:
+        attach_bpf(sock, program)
+        sock.bind((iface_name, ETH_P_IP))
+        fanout_arg = group_id | ((PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG) << 16)
+        # DEFRAG フラグで最上位ビットが立つため、int ではなく符号なし32bitのバイト列で渡す
+        sock.setsockopt(SOL_PACKET, PACKET_FANOUT, _U32.pack(fanout_arg))
+        sock.settimeout(FANOUT_RECV_TIMEOUT)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _receive_loop(sock: socket.socket, classify, ring: _ResultRing, stop_event):
+    """受信プロセス本体 分類できた結果だけをリングに書き込む"""
+    buffer = bytearray(FANOUT_RECV_BUFFER)
+    view = memoryview(buffer)
+    while not stop_event.is_set():
+        try:
+            size = sock.recv_into(buffer)
+        except socket.timeout:
+            continue
+        except OSError:
+            break
+        result = classify(view[:size])
+        if result:
+            ring.push(result)
+    sock.close()
+
+
+class FanoutReceiver:
+    """PACKET_FANOUT グループで受信を複数プロセスに分散し、分類結果を handler に渡す
+    _RawReceiver（stateless）と同じ start() / stop() で使う。
+    """
+
+    def __init__(self, iface_name: str, classify, handler, count: int, program):
+        """
+        Args:
+            iface_name (str): 受信するインターフェース名
+            classify (callable): 受信プロセスで呼ばれる 受信したバイト列（IPヘッダから）を
+                {'host', 'port', 'status', 'type'} に分類し、対象外は None を返す
+            handler (callable): 集計スレッドで結果ごとに呼ばれる
+            count (int): 受信プロセス数
+            program (list[tuple]): ソケットに設定する BPF プログラム
+        """
+        self.handler = handler
+        self.count = count
+        group_id = (os.getpid() + next(_group_ids)) & 0xFFFF
+        # ソケットは親で開いてグループに参加させる（エラーは呼び出し側で扱い、受信プロセスには fork で渡す）
+        self._sockets = []
+        try:
+            for _ in range(count):
+                self._sockets.append(_open_fanout_socket(iface_name, group_id, program))
+        except OSError:
+            for sock in self._sockets:
+                sock.close()
+            raise
+        self._rings = [_ResultRing() for _ in range(count)]
+        self._context = multiprocessing.get_context("fork")
+        self._stop_event = self._context.Event()
+        self._processes = [
+            self._context.Process(target=_receive_loop, args=(sock, classify, ring, self._stop_event), daemon=True)
+            for sock, ring in zip(self._sockets, self._rings)
+        ]
+        self.dropped = 0 # リングが溢れて失われた結果の数（stop() 後に確定）
+        self._collecting = threading.Event()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+
+    def start(self):
+        for process in self._processes:
+            process.start()
+        # 受信プロセスに渡したので親のソケットは閉じる
+        for sock in self._sockets:
+            sock.close()
+        self._collecting.set()
+        self._collector.start()
+
+    def stop(self):
+        self._stop_event.set()
+        for process in self._processes:
+            process.join()
+        self._collecting.clear()
+        self._collector.join()
+        self._drain()
+        self.dropped = sum(ring.dropped for ring in self._rings)
+        for ring in self._rings:
+            ring.close()
+
+    def _drain(self) -> int:
+        count = 0
+        for ring in self._rings:
+            for result in ring.pop_all():
+                self.handler(result)
+                count += 1
+        return count
+
+    def _collect(self):
+        while self._collecting.is_set():
+            if not self._drain():
+                time.sleep(FANOUT_POLL_INTERVAL)
+
+
+def default_receiver_count(host_count: int) -> int:
+    """受信プロセス数の既定値 複数ホストのスイープはCPU数（最大 FANOUT_RECEIVERS_MAX）、単一ホストは1"""
+    if host_count <= 1:
+        return 1
+    return max(1, min(os.cpu_count() or 1, FANOUT_RECEIVERS_MAX))
+
+
+def open_fanout_receiver(iface_name: str, classify, handler, count: int, program) -> FanoutReceiver | None:
+    """複数プロセスの受信を開始する PACKET_FANOUT が使えない環境（Linux以外・権限不足）では None"""
+    if not hasattr(socket, "AF_PACKET"):
+        return None
+    try:
+        receiver = FanoutReceiver(iface_name, classify, handler, min(count, FANOUT_RECEIVERS_MAX), program)
+    except OSError:
+        return None
+    receiver.start()
+    return receiver
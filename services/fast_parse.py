@@ -0,0 +1,143 @@
+from typing import NamedTuple
+import socket
+import struct
+
+'''応答パケットの高速パーサー
+受信したバイト列（IPv4ヘッダから）を struct / memoryview で直接読み、scapy のオブジェクトを作らずに分類する。
+IPv6・フラグメント・切り詰められたパケットなど想定外のものは None を返し、呼び出し側で scapy にフォールバックする。
+
+使うのは自前のソケットでバイト列を受信する経路だけ（ステートレススキャンの AF_PACKET 受信と PACKET_FANOUT の受信プロセス）。
+sr / sr1 の経路は応答の対応付けのために scapy が受信時点で解析を済ませているため、解析済みのレイヤで分類する
+（バイト列から読み直しても受信側の解析コストは変わらない）。
+'''
+
+
+# --- Constants ---
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPV4_MIN_HEADER = 20
+TCP_MIN_HEADER = 20
+UDP_HEADER = 8
+ICMP_HEADER = 8
+QUOTED_L4_BYTES = 8 # ICMPエラーが引用する元のL4ヘッダの長さ（RFC 792 の最小）
+
+# --- TCP flags ---
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+TCP_SYN_ACK = TCP_SYN | TCP_ACK
+TCP_RST_ACK = TCP_RST | TCP_ACK
+
+# --- ICMP ---
+ICMP_DEST_UNREACH = 3
+ICMP_PORT_UNREACH = 3
+ICMP_FILTERED_CODES = (1, 2, 9, 10, 13) # host/protocol unreachable、管理上の禁止
+
+_IPV4_HEADER = struct.Struct("!BBHHHBBH4s4s")
+_TCP_HEADER = struct.Struct("!HHIIBB")
+_PORTS = struct.Struct("!HH")
+_QUOTED_TCP = struct.Struct("!HHI")
+
+
+class ParsedReply(NamedTuple):
+    """パース済みの応答 ICMPエラーの場合は quoted_* に引用された元のプローブのヘッダが入る"""
+    protocol: int
+    src: str
+    dst: str
+    sport: int = 0
+    dport: int = 0
+    flags: int = 0 # TCPフラグ（NSビットを含む9ビット）
+    seq: int = 0
+    ack: int = 0
+    icmp_type: int = -1
+    icmp_code: int = -1
+    quoted_protocol: int = 0
+    quoted_dst: str = ""
+    quoted_sport: int = 0
+    quoted_dport: int = 0
+    quoted_seq: int | None = None
+
+
+def parse_ipv4(raw) -> ParsedReply | None:
+    """IPv4パケットのバイト列（bytes / memoryview）をパースする 想定外の形式は None"""
+    if len(raw) < IPV4_MIN_HEADER:
+        return None
+    version_ihl, _, total_length, _, frag, _, protocol, _, src, dst = _IPV4_HEADER.unpack_from(raw)
+    ihl = (version_ihl & 0x0F) * 4
+    # IPv4以外、不正なヘッダ長、フラグメント（MF または オフセット）
+    if version_ihl >> 4 != 4 or ihl < IPV4_MIN_HEADER or frag & 0x3FFF:
+        return None
+    end = min(total_length, len(raw)) if total_length >= ihl else len(raw)
+    src_ip, dst_ip = socket.inet_ntoa(src), socket.inet_ntoa(dst)
+
+    if protocol == IPPROTO_TCP:
+        if end - ihl < TCP_MIN_HEADER:
+            return None
+        sport, dport, seq, ack, offset_ns, flags = _TCP_HEADER.unpack_from(raw, ihl)
+        return ParsedReply(protocol, src_ip, dst_ip, sport, dport, ((offset_ns & 0x01) << 8) | flags, seq, ack)
+
+    if protocol == IPPROTO_UDP:
+        if end - ihl < UDP_HEADER:
+            return None
+        sport, dport = _PORTS.unpack_from(raw, ihl)
+        return ParsedReply(protocol, src_ip, dst_ip, sport, dport)
+
+    if protocol == IPPROTO_ICMP:
+        if end - ihl < ICMP_HEADER:
+            return None
+        icmp_type, icmp_code = raw[ihl], raw[ihl + 1]
+        quoted = _parse_quoted(raw, ihl + ICMP_HEADER, end)
+        if quoted is None:
+            return ParsedReply(protocol, src_ip, dst_ip, icmp_type=icmp_type, icmp_code=icmp_code)
+        return ParsedReply(protocol, src_ip, dst_ip, icmp_type=icmp_type, icmp_code=icmp_code, **quoted)
+
+    return ParsedReply(protocol, src_ip, dst_ip)
+
+
+def _parse_quoted(raw, start: int, end: int) -> dict | None:
+    """ICMPエラーに引用された元のIPヘッダとL4ヘッダの先頭8バイト"""
+    if end - start < IPV4_MIN_HEADER:
+        return None
+    version_ihl = raw[start]
+    ihl = (version_ihl & 0x0F) * 4
+    if version_ihl >> 4 != 4 or ihl < IPV4_MIN_HEADER or end - start < ihl + QUOTED_L4_BYTES:
+        return None
+    protocol = raw[start + 9]
+    l4 = start + ihl
+    sport, dport = _PORTS.unpack_from(raw, l4)
+    seq = _QUOTED_TCP.unpack_from(raw, l4)[2] if protocol == IPPROTO_TCP else None
+    return {
+        'quoted_protocol': protocol,
+        'quoted_dst': socket.inet_ntoa(bytes(raw[start + 16:start + 20])),
+        'quoted_sport': sport,
+        'quoted_dport': dport,
+        'quoted_seq': seq,
+    }
+
+
+# --- Classification ---
+def tcp_status(reply: ParsedReply) -> str:
+    """SYNプローブへの応答の status（scan_logic._classify_tcp_reply と同じ規則）"""
+    if reply.protocol == IPPROTO_TCP:
+        if reply.flags == TCP_SYN_ACK:
+            return 'open'
+        if reply.flags == TCP_RST_ACK:
+            return 'closed'
+        return 'filtered'
+    if reply.protocol == IPPROTO_ICMP:
+        return 'filtered'
+    return 'unknown'
+
+
+def udp_status(reply: ParsedReply) -> str:
+    """UDPプローブへの応答の status（scan_logic._classify_udp_reply と同じ規則）"""
+    if reply.protocol == IPPROTO_UDP:
+        return 'open'
+    if reply.protocol == IPPROTO_ICMP and reply.icmp_type == ICMP_DEST_UNREACH:
+        if reply.icmp_code == ICMP_PORT_UNREACH:
+            return 'closed'
+        if reply.icmp_code in ICMP_FILTERED_CODES:
+            return 'filtered'
+    return 'unknown'
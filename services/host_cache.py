@@ -0,0 +1,280 @@
+from collections import OrderedDict
+from utils.file_store import file_lock, write_json_atomic
+import json
+import threading
+import time
+
+'''ホスト単位の情報キャッシュ（生存、RTT、ICMPレート制限、前回のオープンポート）
+メモリ上のLRUとディスク（data/host_cache.json）に保持し、TTLを過ぎたものは使わない。
+scan_ports は既知のホストについてキャリブレーションを省略し、RTTからタイムアウトを決め、
+前回オープンだったポートから先にプローブする。前回どのポートも応答しなかった（alive=False）ホストは短いタイムアウトで調べる。
+'''
+
+
+# --- Constants ---
+HOST_CACHE_FILE_PATH = "data/host_cache.json"
+HOST_CACHE_TTL = 3600 # 1時間
+HOST_CACHE_MAX_ENTRIES = 4096
+
+# --- RTT estimation (RFC 6298) ---
+RTT_ALPHA = 0.125
+RTT_BETA = 0.25
+RTT_VAR_MULTIPLIER = 4 # タイムアウト = SRTT + 4 × RTTVAR
+
+# --- ICMP rate limit detection ---
+ICMP_RATE_LIMIT_MIN_PORTS = 10 # 判定に必要なUDPプローブ数
+ICMP_RATE_LIMIT_SILENT_RATIO = 0.5 # closed がありつつ無応答がこれを超える場合はレート制限とみなす
+
+# --- Answered statuses ---
+ANSWERED_STATUSES = ('open', 'closed')
+OBSERVED_STATUSES = ('open', 'closed', 'filtered', 'open|filtered')
+
+
+class HostCache:
+    """ホスト情報のTTL付きLRUキャッシュ（スレッドセーフ、ディスクへ永続化）
+    エントリ e.g.: {'alive': True, 'rtt': 0.004, 'rtt_var': 0.001, 'icmp_rate_limited': False,
+                    'open_ports': {'tcp': [22, 80], 'udp': []}, 'updated_at': 1700000000.0}
+    """
+
+    def __init__(self, filepath: str | None = HOST_CACHE_FILE_PATH, ttl: float = HOST_CACHE_TTL,
+                 max_entries: int = HOST_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            filepath (str | None): 保存先 Noneの場合はメモリ上のみ
+            ttl (float): エントリの有効期間（秒）
+            max_entries (int): 保持するホスト数の上限 超えた場合は最も古く使われたものから削除
+        """
+        self.filepath = filepath
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._deleted = set() # 次の保存でファイルからも除くホスト
+        self._cleared = False
+
+    # --- Persistence ---
+    def _load_locked(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.filepath:
+            return
+        data = self._read_file()
+        now = time.time()
+        # 古い順に並べ直してLRU順を復元
+        for host, entry in sorted(data.items(), key=lambda item: item[1].get('updated_at', 0)):
+            if now - entry.get('updated_at', 0) < self.ttl:
+                self._entries[host] = entry
+        self._evict_locked()
+
+    def _read_file(self) -> dict:
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            print(f"ホストキャッシュ '{self.filepath}' の形式が正しくありません。")
+            return {}
+
+    def save(self):
+        """有効なエントリをディスクに保存する
+        他のプロセス（分散ワーカー・GUI など）が先に保存したエントリとマージし、新しい方を残す。
+        読み込みから置き換えまでファイルロックを保持し、一意な一時ファイル経由で書き込む。
+        """
+        if not self.filepath:
+            return
+        with self._lock, file_lock(self.filepath):
+            self._load_locked()
+            self._expire_locked()
+            data = {} if self._cleared else self._read_file()
+            for host in self._deleted:
+                data.pop(host, None)
+            self._deleted.clear()
+            self._cleared = False
+            for host, entry in self._entries.items():
+                if entry.get('updated_at', 0) >= data.get(host, {}).get('updated_at', 0):
+                    data[host] = entry
+            now = time.time()
+            data = {host: entry for host, entry in data.items() if now - entry.get('updated_at', 0) < self.ttl}
+            # 上限を超える場合は古いものから除く
+            newest = sorted(data.items(), key=lambda item: item[1].get('updated_at', 0))[-self.max_entries:]
+            write_json_atomic(self.filepath, dict(newest))
+
+    # --- Entries ---
+    def _expire_locked(self):
+        now = time.time()
+        for host in [h for h, entry in self._entries.items() if now - entry['updated_at'] >= self.ttl]:
+            del self._entries[host]
+
+    def _evict_locked(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, host: str) -> dict | None:
+        """有効なエントリのコピーを返す 無い・期限切れの場合は None"""
+        with self._lock:
+            self._load_locked()
+            entry = self._entries.get(host)
+            if entry is None:
+                return None
+            if time.time() - entry['updated_at'] >= self.ttl:
+                del self._entries[host]
+                return None
+            self._entries.move_to_end(host)
+            return dict(entry)
+
+    def update(self, host: str, **facts) -> dict:
+        """エントリを更新する（指定したキーのみ上書き）"""
+        with self._lock:
+            self._load_locked()
+            entry = dict(self._entries.pop(host, {}), **facts)
+            entry['updated_at'] = time.time()
+            self._deleted.discard(host)
+            self._entries[host] = entry
+            self._evict_locked()
+            return dict(entry)
+
+    def delete(self, host: str):
+        with self._lock:
+            self._load_locked()
+            self._entries.pop(host, None)
+            self._deleted.add(host)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._deleted.clear()
+            self._loaded = True
+            self._cleared = True
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load_locked()
+            return len(self._entries)
+
+    # --- Scan Results ---
+    def record_rtt(self, host: str, samples: list[float]) -> dict | None:
+        """RTTの測定値で平滑化RTT（SRTT / RTTVAR）を更新する"""
+        if not samples:
+            return None
+        entry = self.get(host) or {}
+        srtt, rtt_var = entry.get('rtt'), entry.get('rtt_var')
+        for sample in samples:
+            if srtt is None:
+                srtt, rtt_var = sample, sample / 2
+            else:
+                rtt_var = (1 - RTT_BETA) * rtt_var + RTT_BETA * abs(srtt - sample)
+                srtt = (1 - RTT_ALPHA) * srtt + RTT_ALPHA * sample
+        return self.update(host, alive=True, rtt=round(srtt, 6), rtt_var=round(rtt_var, 6))
+
+    def record_scan(self, host: str, results: list[dict]) -> dict:
+        """scan_ports の結果からホスト情報を更新する
+        Args:
+            host (str): スキャン対象のIPアドレス
+            results (list[dict]): 'type' / 'status' / 'rtt'（応答があった場合）を含む結果
+        """
+        observation = self.observe(host)
+        for result in results:
+            observation.add(result)
+        return self.record_observation(host, observation)
+
+    def observe(self, host: str) -> 'ScanObservation':
+        """結果を逐次集計する ScanObservation を作る（結果をリストに溜めずに record_observation で反映する）"""
+        return ScanObservation(self.get(host))
+
+    def record_observation(self, host: str, observation: 'ScanObservation') -> dict:
+        """ScanObservation の集計でホスト情報を更新する"""
+        entry = self.get(host) or {}
+        open_ports = dict(entry.get('open_ports', {}))
+        # 部分的なスキャン（監視・分散のシャード・top-N など）でも範囲外の既知のオープンポートは残す
+        # 状態が確定したポートだけを更新する（エラーのポートは前回の情報を保つ）
+        for protocol in observation.observed:
+            known = set(open_ports.get(protocol, []))
+            open_ports[protocol] = sorted((known - observation.no_longer_open[protocol]) | observation.open_ports[protocol])
+
+        facts = {'open_ports': open_ports}
+        # 今回の範囲で応答が無くても、範囲外に既知のオープンポートが残るホストは停止とみなさない
+        if observation.count:
+            facts['alive'] = observation.answered > 0 or any(open_ports.values())
+
+        # ICMP port unreachable のレート制限（一部だけ closed で残りが無応答）
+        if observation.udp_count >= ICMP_RATE_LIMIT_MIN_PORTS:
+            facts['icmp_rate_limited'] = observation.udp_closed > 0 and \
+                observation.udp_silent / observation.udp_count > ICMP_RATE_LIMIT_SILENT_RATIO
+
+        if observation.rtt_samples:
+            facts.update(alive=True, rtt=round(observation.srtt, 6), rtt_var=round(observation.rtt_var, 6))
+        return self.update(host, **facts)
+
+
+class ScanObservation:
+    """1回のスキャンの結果を逐次集計する（保持する量は結果の件数に比例しない）
+    保持するのはオープンポート、前回オープンだったポートの変化、平滑化RTT、UDPの件数だけ。
+    """
+
+    def __init__(self, entry: dict | None = None):
+        """
+        Args:
+            entry (dict, optional): スキャン開始時のホストキャッシュのエントリ（前回のオープンポートとRTT）
+        """
+        entry = entry or {}
+        self._known_open = {protocol: set(ports) for protocol, ports in entry.get('open_ports', {}).items()}
+        self.open_ports = {'tcp': set(), 'udp': set()}
+        self.no_longer_open = {'tcp': set(), 'udp': set()} # 前回オープンで、今回オープン以外を観測したポート
+        self.observed = set() # 状態が確定したポートのあったプロトコル
+        self.count = 0
+        self.answered = 0
+        self.srtt, self.rtt_var = entry.get('rtt'), entry.get('rtt_var')
+        self.rtt_samples = 0
+        self.udp_count = self.udp_closed = self.udp_silent = 0
+
+    def add(self, result: dict):
+        self.count += 1
+        protocol, status, port = result.get('type'), result['status'], result['port']
+        if protocol in self.open_ports and status in OBSERVED_STATUSES:
+            self.observed.add(protocol)
+            if status == 'open':
+                self.open_ports[protocol].add(port)
+                self.no_longer_open[protocol].discard(port)
+            else:
+                self.open_ports[protocol].discard(port)
+                if port in self._known_open.get(protocol, ()):
+                    self.no_longer_open[protocol].add(port)
+        if status in ANSWERED_STATUSES:
+            self.answered += 1
+            if result.get('rtt'):
+                self._add_rtt(result['rtt'])
+        if protocol == 'udp':
+            self.udp_count += 1
+            self.udp_closed += status == 'closed'
+            self.udp_silent += status == 'open|filtered'
+
+    def _add_rtt(self, sample: float):
+        """平滑化RTT（RFC 6298）を更新する"""
+        self.rtt_samples += 1
+        if self.srtt is None:
+            self.srtt, self.rtt_var = sample, sample / 2
+        else:
+            self.rtt_var = (1 - RTT_BETA) * self.rtt_var + RTT_BETA * abs(self.srtt - sample)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * sample
+
+
+# --- Seeding ---
+def rtt_timeout(entry: dict) -> float | None:
+    """キャッシュのRTTから1プローブのタイムアウト（秒）を求める RTTが無い場合は None"""
+    if not entry or entry.get('rtt') is None:
+        return None
+    return entry['rtt'] + RTT_VAR_MULTIPLIER * entry.get('rtt_var', 0)
+
+
+def order_ports(ports: list[int], entry: dict | None, protocol: str) -> list[int]:
+    """前回オープンだったポートを先頭にした順序を返す（それ以外の順序は保つ）"""
+    known_open = set((entry or {}).get('open_ports', {}).get(protocol, []))
+    if not known_open:
+        return list(ports)
+    return [port for port in ports if port in known_open] + [port for port in ports if port not in known_open]
+
+
+HOST_CACHE = HostCache()
@@ -0,0 +1,195 @@
+from scapy.all import Ether, IP, conf, getmacbyip, get_if_hwaddr
+from scapy.interfaces import resolve_iface
+from typing import NamedTuple
+from .fanout import attach_bpf, l2_reply_filter
+import os
+import select
+import socket
+import threading
+import time
+
+'''送信路（経路・インターフェース・次ホップのMACアドレス）のキャッシュと、開いたままの送信ソケット
+sr / sr1 は呼び出しごとに経路の検索、インターフェースの選択、次ホップのMACアドレス解決を行い、
+L3ソケットを作成してクローズする。ここでは宛先ごとの送信路を有効期限付きでキャッシュし、
+ワーカー（プロセス/スレッド）ごとに1つ開いたままにしたL2ソケットから組み立て済みの Ether フレームを送受信する。
+ループバック宛て（Linux）はL2で送れないため、同じく開いたままの raw ソケット（L3）を使う。
+L2ソケット（Linux）には応答だけを通す BPF フィルタを設定し、無関係なフレームをカーネル内で捨てる。
+
+ソケットの寿命はワーカーと同じ。エンジンのプール（services/engines.py）はスキャンごとに作られるため、
+ソケットを開いてフィルタを設定する費用はスキャンごとに1回（ワーカー数分）かかり、同じスキャン内の
+全てのチャンクで使い回す。プールを閉じたワーカーのソケットは、プロセスの終了（process）または
+スレッドローカルの破棄（thread）で閉じられる。
+'''
+
+
+# --- Constants ---
+LINK_CACHE_TTL = 60 # 送信路・MACアドレスのキャッシュ有効期間（秒）
+NO_GATEWAY = "0.0.0.0"
+DRAIN_MAX_FRAMES = 4096 # 送信前に読み捨てる滞留フレーム数の上限
+DRAIN_BUFFER = 65535
+
+
+class Link(NamedTuple):
+    """宛先への送信路 dst_mac が None の場合はL3（ループバック）で送る"""
+    iface: str
+    src_ip: str
+    next_hop: str
+    src_mac: str | None
+    dst_mac: str | None
+
+    @property
+    def layer2(self) -> bool:
+        return self.dst_mac is not None
+
+
+def _is_loopback(iface_name: str) -> bool:
+    dev = resolve_iface(iface_name)
+    return conf.loopback_name in (dev.name, dev.network_name)
+
+
+class LinkCache:
+    """宛先IP → Link と (インターフェース, 次ホップ) → MACアドレス の有効期限付きキャッシュ
+    同じゲートウェイの先にある宛先は、MACアドレスの解決（ARP）を共有する。
+    """
+
+    def __init__(self, ttl: float = LINK_CACHE_TTL):
+        """
+        Args:
+            ttl (float): エントリの有効期間（秒） 経路やARPの変化はこの時間内に反映される
+        """
+        self.ttl = ttl
+        self._links = {} # target_ip -> (Link | None, expires_at)
+        self._macs = {} # (iface, next_hop) -> (mac | None, expires_at)
+        self._lock = threading.Lock()
+
+    def resolve(self, target_ip: str) -> Link | None:
+        """宛先への送信路を返す 次ホップのMACアドレスを解決できない場合は None（呼び出し側でL3にフォールバック）"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._links.get(target_ip)
+        # 解決できなかった宛先（None）も期限まではキャッシュする（ARPに応答しない宛先を毎回解決しない）
+        if cached and cached[1] > now:
+            return cached[0]
+
+        iface, src_ip, gateway = conf.route.route(target_ip)
+        next_hop = gateway if gateway and gateway != NO_GATEWAY else target_ip
+        if _is_loopback(iface):
+            link = Link(iface, src_ip, next_hop, None, None)
+        else:
+            dst_mac = self._next_hop_mac(iface, next_hop, now)
+            link = Link(iface, src_ip, next_hop, get_if_hwaddr(iface), dst_mac) if dst_mac else None
+
+        with self._lock:
+            self._links[target_ip] = (link, now + self.ttl)
+        return link
+
+    def _next_hop_mac(self, iface: str, next_hop: str, now: float) -> str | None:
+        key = (iface, next_hop)
+        with self._lock:
+            cached = self._macs.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+        mac = getmacbyip(next_hop)
+        with self._lock:
+            self._macs[key] = (mac, now + self.ttl)
+        return mac
+
+    def invalidate(self, target_ip: str | None = None):
+        """キャッシュを破棄する target_ip が None の場合はすべて"""
+        with self._lock:
+            if target_ip is None:
+                self._links.clear()
+                self._macs.clear()
+            else:
+                self._links.pop(target_ip, None)
+
+
+# --- Persistent Sockets ---
+class _SocketPool(threading.local):
+    """ワーカーごとに開いたままにする送信ソケット（スレッドローカル、fork後は作り直す）
+    寿命はワーカー（＝スキャンごとのプール）と同じ モジュールの説明を参照
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.sockets = {} # (iface, layer2, src_ip) -> SuperSocket
+
+    def get(self, link: Link):
+        if self.pid != os.getpid():
+            # fork で引き継いだソケットは親と共有されるため使わない
+            self.pid = os.getpid()
+            self.sockets = {}
+        # フィルタは応答の宛先（送信元アドレス）ごとなので、キーに含める
+        key = (link.iface, link.layer2, link.src_ip if link.layer2 else None)
+        sock = self.sockets.get(key)
+        if sock is None or sock.closed:
+            dev = resolve_iface(link.iface)
+            if link.layer2:
+                sock = dev.l2socket()(iface=dev)
+                _attach_reply_filter(sock, link.src_ip)
+            else:
+                sock = dev.l3socket(False)(iface=dev)
+            self.sockets[key] = sock
+        return sock
+
+    def close(self):
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets = {}
+
+
+def _attach_reply_filter(sock, local_ip: str):
+    """L2ソケットの受信側に応答だけを通す BPF フィルタを設定する（Linux の AF_PACKET のみ）
+    設定できない環境（Windows の pcap など）ではフィルタ無しのまま使う。
+    """
+    ins = getattr(sock, 'ins', None)
+    if not isinstance(ins, socket.socket) or ins.family != getattr(socket, 'AF_PACKET', None):
+        return
+    try:
+        attach_bpf(ins, l2_reply_filter(local_ip))
+    except OSError:
+        pass
+
+
+def _drain(sock):
+    """前回のプローブ以降に受信バッファに溜まったフレームを読み捨てる（sr で1つずつパースさせない）"""
+    ins = getattr(sock, 'ins', None)
+    try:
+        for _ in range(DRAIN_MAX_FRAMES):
+            if not select.select([ins], [], [], 0)[0]:
+                break
+            ins.recv(DRAIN_BUFFER)
+    except (OSError, ValueError, TypeError):
+        # select できないソケット（Windows の pcap など）
+        pass
+
+
+def sr_cached(target_ip: str, probe_layer, timeout: float):
+    """キャッシュした送信路と開いたままのソケットでプローブを送受信する
+    Args:
+        target_ip (str): 宛先IPアドレス
+        probe_layer: L4のプローブ（TCP(dport=[...]) など、複数ポートを含んでよい）またはそのリスト
+        timeout (float): 未応答のプローブを待つ時間（秒）
+    Returns:
+        (answered, unanswered): sr と同じ組 送信路を解決できない場合は None
+    """
+    link = LINK_CACHE.resolve(target_ip)
+    if link is None:
+        return None
+    header = IP(src=link.src_ip, dst=target_ip)
+    if link.layer2:
+        header = Ether(src=link.src_mac, dst=link.dst_mac)/header
+    # 複数のプローブは展開したパケットのリストにする（sr はリスト内の暗黙のパケットを展開しない）
+    packets = [packet for layer in probe_layer for packet in header/layer] if isinstance(probe_layer, list) else header/probe_layer
+    sock = _SOCKETS.get(link)
+    _drain(sock)
+    return sock.sr(packets, timeout=timeout, verbose=0)
+
+
+def close_sockets():
+    """現在のワーカーが開いているソケットを閉じる"""
+    _SOCKETS.close()
+
+
+LINK_CACHE = LinkCache()
+_SOCKETS = _SocketPool()
@@ -0,0 +1,73 @@
+from collections import deque
+import threading
+import time
+
+
+# --- Constants ---
+RATE_WINDOW = 5.0 # 移動平均レートの計算窓（秒）
+RATE_SAMPLE_INTERVAL = 0.2 # レート計算用サンプルの最小間隔（秒）
+
+
+class ScanProgress:
+    """スキャンの進捗（完了プローブ数、レート、オープンポート数、ETA）
+    エンジンから advance() で更新され、UIやAPIは snapshot() で読み出す。
+    """
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.done = 0
+        self.open_count = 0
+        self.started = time.monotonic()
+        self._samples = deque([(self.started, 0)]) # (時刻, 完了数)
+        self._lock = threading.Lock()
+
+    def add_total(self, count: int):
+        with self._lock:
+            self.total += count
+
+    def advance(self, result: dict | None = None, count: int = 1):
+        """プローブの完了を記録する"""
+        now = time.monotonic()
+        with self._lock:
+            self.done += count
+            if result is not None and result.get('status') == 'open':
+                self.open_count += 1
+            if now - self._samples[-1][0] >= RATE_SAMPLE_INTERVAL:
+                self._samples.append((now, self.done))
+                while len(self._samples) > 2 and now - self._samples[0][0] > RATE_WINDOW:
+                    self._samples.popleft()
+
+    def snapshot(self) -> dict:
+        """現在の進捗を返す
+        Returns:
+            (dict) e.g.: {'done': 120, 'total': 1024, 'pps': 35.2, 'open': 3, 'eta': 25.7, 'elapsed': 3.4}
+        """
+        now = time.monotonic()
+        with self._lock:
+            done = self.done
+            total = self.total
+            open_count = self.open_count
+            oldest_time, oldest_done = self._samples[0]
+        elapsed = now - self.started
+        window = now - oldest_time
+        pps = (done - oldest_done) / window if window > 0 else 0.0
+        remaining = max(total - done, 0)
+        eta = remaining / pps if pps > 0 else None
+        return {
+            'done': done,
+            'total': total,
+            'pps': pps,
+            'open': open_count,
+            'eta': eta,
+            'elapsed': elapsed,
+        }
+
+
+def format_progress(snapshot: dict) -> str:
+    """進捗を1行の文字列にする e.g.: "120/1024 (11.7%) | 35.2 pps | open: 3 | ETA 0:25" """
+    total = snapshot['total']
+    percent = snapshot['done'] / total * 100 if total else 0.0
+    eta = snapshot['eta']
+    eta_text = f"{int(eta // 60)}:{int(eta % 60):02d}" if eta is not None else "--:--"
+    return (f"{snapshot['done']}/{total} ({percent:.1f}%) | {snapshot['pps']:.1f} pps | "
+            f"open: {snapshot['open']} | ETA {eta_text}")
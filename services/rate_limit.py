@@ -0,0 +1,59 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """スレッドセーフなトークンバケット（パケット/秒の送信予算）
+    複数のスキャンジョブで1つのインスタンスを共有すると、合計の送信レートが rate 以下に抑えられる。
+    """
+
+    def __init__(self, rate: float | None, burst: float | None = None):
+        """
+        Args:
+            rate (float | None): 1秒あたりのトークン数 None または 0 以下で無制限
+            burst (float | None): バケット容量 Noneの場合 rate と同じ（最低1）
+        """
+        self.rate = rate if rate and rate > 0 else None
+        self.capacity = max(1.0, burst if burst else (self.rate or 1.0))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float | None):
+        """送信レートを変更する（実行中のジョブにも即時反映）"""
+        with self._lock:
+            self._refill()
+            self.rate = rate if rate and rate > 0 else None
+            self.capacity = max(1.0, self.rate or 1.0)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens: float = 1, cancel_event: threading.Event | None = None) -> bool:
+        """トークンを取得するまで待機する バケット容量を超える数は容量ずつ取得する
+        Returns:
+            bool: 取得できた場合 True、cancel_event がセットされた場合 False
+        """
+        while tokens > self.capacity and self.rate is not None:
+            if not self.acquire(self.capacity, cancel_event):
+                return False
+            tokens -= self.capacity
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            with self._lock:
+                if self.rate is None:
+                    return True
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if cancel_event is not None:
+                cancel_event.wait(wait)
+            else:
+                time.sleep(wait)
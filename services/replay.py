@@ -0,0 +1,370 @@
+from scapy.all import IP, TCP, UDP, ICMP, PcapReader
+from scapy.layers.inet import IPerror, TCPerror, UDPerror
+from unittest import mock
+from . import scan_logic
+from .stateless import make_scan_key, probe_cookie, _classify_stateless_reply, _classify_stateless_raw
+from .fast_parse import parse_ipv4, tcp_status, udp_status
+import argparse
+import itertools
+import time
+
+'''応答分類のオフライン再生ハーネス
+記録済み（pcap）または合成した応答パケットを、送信せずに分類処理（_classify_tcp_reply / _classify_udp_reply /
+_classify_stateless_reply）へ流す。sr1 / sr は送信したプローブに対応する記録済みの応答を返す偽物に差し替え、
+まとめて送受信する経路（_scan_many_ports / _scan_many_ports_multi）も同じ応答で検証する。
+
+    python -m services.replay check                       # 合成ケースでフラグ・ICMPコードの分岐を検証
+    python -m services.replay bench --count 1000000       # 分類スループット（応答/秒）
+    python -m services.replay bench --parser scapy        # scapy でパースした場合と比較
+    python -m services.replay pcap capture.pcap           # 記録済みの応答を分類して集計
+'''
+
+
+# --- Constants ---
+REPLAY_TARGET = "192.0.2.10" # TEST-NET-1（実際には送信しない）
+REPLAY_SOURCE = "192.0.2.1"
+REPLAY_PORT = 8080
+REPLAY_TIMEOUT = 1
+BENCH_COUNT_DEFAULT = 1_000_000
+BENCH_REPORT_INTERVAL = 100_000
+
+
+# --- Synthetic Replies ---
+def _dissect(pkt):
+    """バイト列から再度パースし、受信したパケットと同じ状態にする"""
+    reply = IP(bytes(pkt))
+    reply.time = time.time()
+    return reply
+
+
+def tcp_reply(host: str, port: int, flags: str, ack: int = 1, sport: int = 40000):
+    """プローブ (→ host:port) に対する TCP 応答"""
+    return _dissect(IP(src=host, dst=REPLAY_SOURCE)/TCP(sport=port, dport=sport, flags=flags, ack=ack))
+
+
+def udp_reply(host: str, port: int, sport: int = 40000):
+    """プローブ (→ host:port) に対する UDP 応答"""
+    return _dissect(IP(src=host, dst=REPLAY_SOURCE)/UDP(sport=port, dport=sport)/b"reply")
+
+
+def icmp_error(host: str, port: int, protocol: str, icmp_type: int = 3, code: int = 3,
+               sport: int = 40000, seq: int = 0):
+    """プローブ (→ host:port) を引用した ICMP エラー"""
+    quoted = IP(src=REPLAY_SOURCE, dst=host)
+    quoted /= TCP(sport=sport, dport=port, flags="S", seq=seq) if protocol == 'tcp' else UDP(sport=sport, dport=port)
+    return _dissect(IP(src=host, dst=REPLAY_SOURCE)/ICMP(type=icmp_type, code=code)/bytes(quoted)[:28])
+
+
+# --- Synthetic Cases ---
+# (名前, プロトコル, 応答の生成関数 (host, port) -> packet | None, 期待する status)
+SYNTHETIC_CASES = [
+    ("tcp no reply", 'tcp', lambda h, p: None, 'filtered'),
+    ("tcp SYN-ACK", 'tcp', lambda h, p: tcp_reply(h, p, "SA"), 'open'),
+    ("tcp RST-ACK", 'tcp', lambda h, p: tcp_reply(h, p, "RA"), 'closed'),
+    ("tcp RST only", 'tcp', lambda h, p: tcp_reply(h, p, "R"), 'filtered'),
+    ("tcp ACK only", 'tcp', lambda h, p: tcp_reply(h, p, "A"), 'filtered'),
+] + [
+    (f"tcp icmp 3/{code}", 'tcp', lambda h, p, code=code: icmp_error(h, p, 'tcp', 3, code), 'filtered')
+    for code in (0, 1, 2, 3, 9, 10, 13)
+] + [
+    ("tcp icmp time-exceeded", 'tcp', lambda h, p: icmp_error(h, p, 'tcp', 11, 0), 'filtered'),
+    ("udp no reply", 'udp', lambda h, p: None, 'open|filtered'),
+    ("udp reply", 'udp', lambda h, p: udp_reply(h, p), 'open'),
+    ("udp icmp 3/3", 'udp', lambda h, p: icmp_error(h, p, 'udp', 3, 3), 'closed'),
+] + [
+    (f"udp icmp 3/{code}", 'udp', lambda h, p, code=code: icmp_error(h, p, 'udp', 3, code), 'filtered')
+    for code in (1, 2, 9, 10, 13)
+] + [
+    ("udp icmp 3/0", 'udp', lambda h, p: icmp_error(h, p, 'udp', 3, 0), 'unknown'),
+    ("udp icmp time-exceeded", 'udp', lambda h, p: icmp_error(h, p, 'udp', 11, 0), 'unknown'),
+]
+
+
+# --- Multi-probe Cases ---
+# (名前, {プローブ種別: 応答の生成関数 (host, port) -> packet}, 期待する status, 期待する firewall)
+MULTI_PROBE_CASES = [
+    ("multi closed, unfiltered", {'syn': lambda h, p: tcp_reply(h, p, "RA"), 'ack': lambda h, p: tcp_reply(h, p, "R")},
+     'closed', scan_logic.FIREWALL_NONE),
+    ("multi open, stateful", {'syn': lambda h, p: tcp_reply(h, p, "SA")}, 'open', scan_logic.FIREWALL_STATEFUL),
+    ("multi closed, stateless", {'ack': lambda h, p: tcp_reply(h, p, "R"), 'fin': lambda h, p: tcp_reply(h, p, "RA")},
+     'closed', scan_logic.FIREWALL_STATELESS),
+    ("multi blocking", {}, 'filtered', scan_logic.FIREWALL_BLOCKING),
+    ("multi syn icmp", {'syn': lambda h, p: icmp_error(h, p, 'tcp', 3, 13)}, 'filtered', scan_logic.FIREWALL_REJECTING),
+    ("multi ack icmp", {'ack': lambda h, p: icmp_error(h, p, 'tcp', 3, 13)}, 'filtered', scan_logic.FIREWALL_REJECTING),
+]
+
+
+# --- Fake sr1 / sr ---
+def _reply_key(pkt) -> tuple[str, str, int] | None:
+    """応答パケットが対応するプローブ (protocol, 宛先IP, 宛先ポート)"""
+    if pkt is None or not pkt.haslayer(IP):
+        return None
+    ip_layer = pkt[IP]
+    if pkt.haslayer(TCP):
+        return 'tcp', ip_layer.src, pkt[TCP].sport
+    if pkt.haslayer(UDP):
+        return 'udp', ip_layer.src, pkt[UDP].sport
+    if pkt.haslayer(ICMP) and pkt.haslayer(IPerror):
+        quoted = pkt[IPerror]
+        if pkt.haslayer(TCPerror):
+            return 'tcp', quoted.dst, pkt[TCPerror].dport
+        if pkt.haslayer(UDPerror):
+            return 'udp', quoted.dst, pkt[UDPerror].dport
+    return None
+
+
+def _probe_kind(probe) -> str | None:
+    """TCPプローブのフラグから種別（'syn' / 'ack' / 'fin' / 'null'）を求める"""
+    flags = str(probe[TCP].flags)
+    for kind, kind_flags in scan_logic.PROBE_TCP_FLAGS.items():
+        if flags == kind_flags:
+            return kind
+    return None
+
+
+class ReplayResponder:
+    """sr1 / sr の代わりに、送信されたプローブに対応する記録済みの応答を返す（無ければ None = タイムアウト）"""
+
+    def __init__(self, replies=()):
+        self._replies = {}
+        self.calls = 0
+        for pkt in replies:
+            self.add(pkt)
+
+    def add(self, pkt, probe: str | None = None):
+        """応答を登録する
+        Args:
+            pkt: 応答パケット
+            probe (str, optional): 応答するプローブの種別（'syn' / 'ack' / 'fin' / 'null'）
+                省略した場合は同じ宛先・ポートへのどの種別のプローブにも応答する
+        """
+        key = _reply_key(pkt)
+        if key is not None:
+            self._replies.setdefault((*key, probe), pkt)
+
+    def lookup(self, probe):
+        """プローブに対応する応答 無ければ None"""
+        protocol = 'tcp' if probe.haslayer(TCP) else 'udp'
+        layer = probe[TCP] if protocol == 'tcp' else probe[UDP]
+        key = (protocol, probe[IP].dst, layer.dport)
+        kind = _probe_kind(probe) if protocol == 'tcp' else None
+        reply = self._replies.get((*key, kind)) if kind else None
+        return reply if reply is not None else self._replies.get((*key, None))
+
+    def __call__(self, probe, *args, **kwargs):
+        self.calls += 1
+        probe.sent_time = time.time()
+        return self.lookup(probe)
+
+    def sr(self, packets, *args, **kwargs):
+        """sr の代わり 送信したプローブごとに応答を対応付け、(answered, unanswered) を返す"""
+        self.calls += 1
+        answered, unanswered = [], []
+        for probe in (packets if isinstance(packets, list) else list(packets)):
+            probe.sent_time = time.time()
+            reply = self.lookup(probe)
+            if reply is None:
+                unanswered.append(probe)
+            else:
+                answered.append((probe, reply))
+        return answered, unanswered
+
+    def patch(self):
+        """scan_logic.sr1 / sr をこの応答器に差し替えるコンテキストマネージャ
+        キャッシュした送信路（sr_cached）は使わず、sr にフォールバックさせる。
+        """
+        return mock.patch.multiple(scan_logic, sr1=self, sr=self.sr, sr_cached=lambda *args, **kwargs: None)
+
+
+def replay_probe(protocol: str, reply, host: str = REPLAY_TARGET, port: int = REPLAY_PORT) -> dict:
+    """1プローブを偽の sr1 で実行し、_scan_single_*_port の結果を返す"""
+    responder = ReplayResponder([reply] if reply is not None else [])
+    probe_func = scan_logic._scan_single_tcp_port if protocol == 'tcp' else scan_logic._scan_single_udp_port
+    with responder.patch():
+        return probe_func(host, port, REPLAY_TIMEOUT)
+
+
+def replay_many(protocol: str, replies: dict, host: str = REPLAY_TARGET, probes: tuple[str, ...] | None = None,
+                cached_link: bool = False) -> dict:
+    """複数ポートを偽の sr でまとめて実行する
+    Args:
+        protocol (str): 'tcp' / 'udp'
+        replies (dict): {port: 応答 | None} または {port: {プローブ種別: 応答}}（probes 指定時）
+        probes (tuple[str], optional): 指定した場合は _scan_many_ports_multi、省略時は _scan_many_ports
+        cached_link (bool): エンジンと同じ引数で呼ぶ（sr_cached は差し替えにより sr にフォールバック）
+    Returns:
+        (dict) {port: 結果}
+    """
+    responder = ReplayResponder()
+    for port, reply in replies.items():
+        for probe, pkt in (reply.items() if isinstance(reply, dict) else [(None, reply)]):
+            if pkt is not None:
+                responder.add(pkt, probe)
+    ports = list(replies)
+    with responder.patch():
+        if probes:
+            results = scan_logic._scan_many_ports_multi(host, ports, REPLAY_TIMEOUT, probes, cached_link)
+        else:
+            results = scan_logic._scan_many_ports(host, ports, REPLAY_TIMEOUT, protocol, cached_link)
+    return {result['port']: result for result in results}
+
+
+def _classifier(protocol: str):
+    return scan_logic._classify_tcp_reply if protocol == 'tcp' else scan_logic._classify_udp_reply
+
+
+# --- Self Check ---
+def _stateless_cases() -> list[tuple[str, object, str | None]]:
+    """ステートレス受信側の検証ケース (名前, 応答, 期待する status / None は破棄)"""
+    key = make_scan_key()
+    seq, sport = probe_cookie(key, REPLAY_TARGET, REPLAY_PORT)
+    return [
+        ("stateless SYN-ACK", tcp_reply(REPLAY_TARGET, REPLAY_PORT, "SA", seq + 1, sport), 'open'),
+        ("stateless RST-ACK", tcp_reply(REPLAY_TARGET, REPLAY_PORT, "RA", seq + 1, sport), 'closed'),
+        ("stateless wrong ack", tcp_reply(REPLAY_TARGET, REPLAY_PORT, "SA", seq + 2, sport), None),
+        ("stateless wrong port", tcp_reply(REPLAY_TARGET, REPLAY_PORT, "SA", seq + 1, sport + 1), None),
+        ("stateless icmp quoted", icmp_error(REPLAY_TARGET, REPLAY_PORT, 'tcp', 3, 13, sport, seq), 'filtered'),
+        ("stateless icmp forged", icmp_error(REPLAY_TARGET, REPLAY_PORT, 'tcp', 3, 13, sport, seq + 1), None),
+    ], key
+
+
+def self_check(verbose: bool = False) -> list[str]:
+    """合成ケースを分類処理に通し、期待と異なるケースを返す（空なら全て一致）"""
+    failures = []
+
+    def check(name: str, status, expected):
+        if status != expected:
+            failures.append(f"{name}: expected {expected}, got {status}")
+        if verbose:
+            print(f"[{'OK' if status == expected else 'NG'}] {name}: {status}")
+
+    for name, protocol, make_reply, expected in SYNTHETIC_CASES:
+        reply = make_reply(REPLAY_TARGET, REPLAY_PORT)
+        # sr1 経由（scapy のレイヤによる判定）と、バイト列を受信する経路の高速パーサーの両方
+        check(name, replay_probe(protocol, reply)['status'], expected)
+        if reply is not None:
+            fast_status = tcp_status if protocol == 'tcp' else udp_status
+            check(f"{name} (raw)", fast_status(parse_ipv4(bytes(reply))), expected)
+
+    # まとめて送受信する経路 ケースごとに別のポートへ応答を割り当て、1回の sr で検証する
+    for protocol in ('tcp', 'udp'):
+        cases = [case for case in SYNTHETIC_CASES if case[1] == protocol]
+        ports = {REPLAY_PORT + i: case for i, case in enumerate(cases)}
+        results = replay_many(protocol, {port: case[2](REPLAY_TARGET, port) for port, case in ports.items()})
+        for port, (name, _, _, expected) in ports.items():
+            check(f"{name} (sr batch)", results[port]['status'], expected)
+
+    probes = scan_logic.FullMultiProbeEngine.probes
+    ports = {REPLAY_PORT + i: case for i, case in enumerate(MULTI_PROBE_CASES)}
+    results = replay_many('tcp', {port: {probe: make_reply(REPLAY_TARGET, port) for probe, make_reply in case[1].items()}
+                                  for port, case in ports.items()}, probes=probes)
+    for port, (name, _, expected_status, expected_firewall) in ports.items():
+        result = results[port]
+        check(name, (result['status'], result['firewall']), (expected_status, expected_firewall))
+
+    cases, key = _stateless_cases()
+    for name, reply, expected in cases:
+        result = _classify_stateless_reply(reply, key)
+        check(name, result['status'] if result else None, expected)
+        result = _classify_stateless_raw(memoryview(bytes(reply)), key)
+        check(f"{name} (raw)", result['status'] if result else None, expected)
+    return failures
+
+
+# --- Benchmark ---
+def benchmark(count: int = BENCH_COUNT_DEFAULT, protocol: str = 'tcp', report: bool = False,
+              parser: str = 'fast') -> dict:
+    """受信したバイト列のパースと分類のスループットを測定する（合成応答を循環）
+    parser='fast' は fast_parse でバイト列から直接、'scapy' は IP() でパースしてから分類する
+    'fast' の値はバイト列を自前で受信する経路（ステートレススキャン・PACKET_FANOUT）のもの。
+    sr / sr1 の経路は受信時に scapy が解析するため、スキャン全体のスループットは 'scapy' に近い。
+    Returns:
+        (dict) e.g.: {'packets': 1000000, 'seconds': 52.1, 'pps': 19193.8, 'statuses': {'open': 333334, ...}}
+    """
+    if protocol == 'tcp':
+        samples = [tcp_reply(REPLAY_TARGET, REPLAY_PORT, "SA"), tcp_reply(REPLAY_TARGET, REPLAY_PORT, "RA"),
+                   icmp_error(REPLAY_TARGET, REPLAY_PORT, 'tcp', 3, 13)]
+    else:
+        samples = [udp_reply(REPLAY_TARGET, REPLAY_PORT), icmp_error(REPLAY_TARGET, REPLAY_PORT, 'udp', 3, 3),
+                   icmp_error(REPLAY_TARGET, REPLAY_PORT, 'udp', 3, 13)]
+    raw_samples = [bytes(pkt) for pkt in samples]
+    if parser == 'fast':
+        fast_status = tcp_status if protocol == 'tcp' else udp_status
+        classify = lambda raw: fast_status(parse_ipv4(raw))
+    else:
+        scapy_classify = _classifier(protocol)
+        classify = lambda raw: scapy_classify(IP(raw), REPLAY_PORT)['status']
+    statuses = {}
+
+    started = time.perf_counter()
+    for i, raw in enumerate(itertools.islice(itertools.cycle(raw_samples), count), 1):
+        status = classify(raw)
+        statuses[status] = statuses.get(status, 0) + 1
+        if report and i % BENCH_REPORT_INTERVAL == 0:
+            print(f"{i}/{count} replies ({i / (time.perf_counter() - started):.0f}/sec)")
+    elapsed = time.perf_counter() - started
+    return {'packets': count, 'seconds': elapsed, 'pps': count / elapsed if elapsed > 0 else 0.0,
+            'statuses': statuses}
+
+
+def replay_pcap(filepath: str, protocol: str = 'tcp', scanner_ip: str | None = None) -> dict:
+    """pcap の応答を逐次読み込み、(host, port) ごとに分類する
+    Args:
+        filepath (str): pcap ファイル
+        protocol (str): 'tcp' / 'udp'
+        scanner_ip (str, optional): スキャンした側のIP このIPから送信されたパケット（プローブ）は無視する
+            省略時はTCPのSYNのみをプローブとみなす
+    Returns:
+        (dict) e.g.: {'packets': 120000, 'replies': 4096, 'seconds': 6.2, 'pps': 19354.8,
+                      'results': {('10.0.0.5', 22): 'open', ...}}
+    """
+    classify = _classifier(protocol)
+    results = {}
+    packets = 0
+    started = time.perf_counter()
+    with PcapReader(filepath) as reader:
+        for pkt in reader:
+            packets += 1
+            if not pkt.haslayer(IP):
+                continue
+            if scanner_ip is not None and pkt[IP].src == scanner_ip:
+                continue
+            if pkt.haslayer(TCP) and pkt[TCP].flags == "S":
+                continue
+            key = _reply_key(pkt)
+            if key is None or key[0] != protocol:
+                continue
+            results[(key[1], key[2])] = classify(pkt, key[2])['status']
+    elapsed = time.perf_counter() - started
+    return {'packets': packets, 'replies': len(results), 'seconds': elapsed,
+            'pps': packets / elapsed if elapsed > 0 else 0.0, 'results': results}
+
+
+# --- Main ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline replay harness for reply classification")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    subparsers.add_parser("check", help="run synthetic classification cases")
+    bench_parser = subparsers.add_parser("bench", help="measure classification throughput")
+    bench_parser.add_argument("--count", type=int, default=BENCH_COUNT_DEFAULT)
+    bench_parser.add_argument("--protocol", choices=('tcp', 'udp'), default='tcp')
+    bench_parser.add_argument("--parser", choices=('fast', 'scapy'), default='fast')
+    pcap_parser = subparsers.add_parser("pcap", help="classify replies recorded in a pcap file")
+    pcap_parser.add_argument("file")
+    pcap_parser.add_argument("--protocol", choices=('tcp', 'udp'), default='tcp')
+    pcap_parser.add_argument("--scanner-ip", help="source IP of the probes (ignored when replaying)")
+    args = parser.parse_args()
+
+    if args.mode == "check":
+        failures = self_check(verbose=True)
+        print(f"{len(failures)} failure(s)")
+        raise SystemExit(1 if failures else 0)
+    elif args.mode == "bench":
+        stats = benchmark(args.count, args.protocol, report=True, parser=args.parser)
+        print(f"{stats['packets']} replies in {stats['seconds']:.2f}s: {stats['pps']:.0f} replies/sec {stats['statuses']}")
+    else:
+        stats = replay_pcap(args.file, args.protocol, args.scanner_ip)
+        for (host, port), status in sorted(stats['results'].items()):
+            print(f"{host}:{port}/{args.protocol} {status}")
+        print(f"{stats['packets']} packets, {stats['replies']} replies in {stats['seconds']:.2f}s "
+              f"({stats['pps']:.0f} packets/sec)")
@@ -0,0 +1,214 @@
+import asyncio
+import socket
+import threading
+import time
+
+# dnspython が利用可能な場合はレコードのTTLを使用する（任意依存）
+try:
+    import dns.asyncresolver
+    import dns.exception
+    import dns.resolver
+    import dns.reversename
+    HAS_DNSPYTHON = True
+except ImportError:
+    HAS_DNSPYTHON = False
+
+
+# --- Constants ---
+DEFAULT_DNS_TTL = 300 # TTLが取得できない場合（getaddrinfo）のキャッシュ秒数
+NEGATIVE_DNS_TTL = 30 # 解決失敗のキャッシュ秒数
+MAX_RESOLVE_CONCURRENCY = 64
+DNS_QUERY_TIMEOUT = 5
+
+
+# --- TTL Cache ---
+class DnsCache:
+    """TTLを守るスレッドセーフなプロセス内キャッシュ"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """有効期限内のエントリを返す 無い場合は None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def put(self, key: str, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+FORWARD_CACHE = DnsCache()
+REVERSE_CACHE = DnsCache()
+
+
+# --- Forward Resolution ---
+async def _query_dnspython(name: str) -> tuple[list[str], float]:
+    """dnspythonで A / AAAA を並列に問い合わせる Returns: (アドレス, 最小TTL)"""
+    resolver = dns.asyncresolver.Resolver()
+    resolver.lifetime = DNS_QUERY_TIMEOUT
+
+    async def query(rdtype: str):
+        # 片方のレコード種別の失敗（タイムアウト等）で、もう片方の応答を捨てない
+        try:
+            return await resolver.resolve(name, rdtype)
+        except dns.exception.DNSException:
+            return None
+
+    answers = await asyncio.gather(query("A"), query("AAAA"))
+    addresses = []
+    ttls = []
+    for answer in answers:
+        if answer is None:
+            continue
+        addresses.extend(rdata.address for rdata in answer)
+        ttls.append(answer.rrset.ttl)
+    return addresses, (min(ttls) if ttls else NEGATIVE_DNS_TTL)
+
+
+async def _query_getaddrinfo(name: str) -> tuple[list[str], float]:
+    """標準ライブラリ（スレッドプール上のgetaddrinfo）で解決する TTLは既定値"""
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(name, None, type=socket.SOCK_STREAM)
+    addresses = []
+    for family, _, _, _, sockaddr in infos:
+        if family in (socket.AF_INET, socket.AF_INET6) and sockaddr[0] not in addresses:
+            addresses.append(sockaddr[0])
+    return addresses, DEFAULT_DNS_TTL
+
+
+async def resolve_host_async(name: str) -> list[str]:
+    """ホスト名を A / AAAA レコードに解決する（キャッシュ有り）
+    Args:
+        name (str): ホスト名
+    Returns:
+        addresses (list[str]): IPv4を先頭にしたアドレスのリスト 解決失敗時は空
+    """
+    cached = FORWARD_CACHE.get(name)
+    if cached is not None:
+        return cached
+
+    try:
+        if HAS_DNSPYTHON:
+            addresses, ttl = await _query_dnspython(name)
+        else:
+            addresses, ttl = await _query_getaddrinfo(name)
+    except (socket.gaierror, OSError):
+        addresses, ttl = [], NEGATIVE_DNS_TTL
+    except Exception as e:
+        if HAS_DNSPYTHON and isinstance(e, dns.exception.DNSException):
+            addresses, ttl = [], NEGATIVE_DNS_TTL
+        else:
+            raise
+
+    # IPv4優先（スキャンエンジンの既定）
+    addresses.sort(key=lambda addr: ':' in addr)
+    FORWARD_CACHE.put(name, addresses, ttl if addresses else NEGATIVE_DNS_TTL)
+    return addresses
+
+
+async def resolve_hosts_async(names: list[str], concurrency: int = MAX_RESOLVE_CONCURRENCY, on_resolved=None) -> dict:
+    """複数のホスト名を並列に解決する
+    Args:
+        names (list[str]): ホスト名のリスト
+        concurrency (int): 同時問い合わせ数
+        on_resolved (callable, optional): (name, addresses) を解決順に受け取るコールバック
+    Returns:
+        resolved (dict): {name: [address, ...]}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    resolved = {}
+
+    async def worker(name: str):
+        async with semaphore:
+            addresses = await resolve_host_async(name)
+        resolved[name] = addresses
+        if on_resolved:
+            on_resolved(name, addresses)
+
+    await asyncio.gather(*(worker(name) for name in dict.fromkeys(names)))
+    return resolved
+
+
+def resolve_hosts(names: list[str], concurrency: int = MAX_RESOLVE_CONCURRENCY) -> dict:
+    """resolve_hosts_async の同期版（スレッドから呼び出す）"""
+    return asyncio.run(resolve_hosts_async(names, concurrency))
+
+
+def resolve_in_background(names: list[str], on_resolved, concurrency: int = MAX_RESOLVE_CONCURRENCY,
+                          on_complete=None) -> threading.Thread:
+    """別スレッドのイベントループで解決し、解決したものから on_resolved に渡す
+    プローブ送信側は解決待ちでブロックせず、解決済みのターゲットから送信を開始できる（distributed_scan を参照）。
+    Args:
+        on_resolved (callable): (name, addresses) を解決順に受け取るコールバック
+        on_complete (callable, optional): 全ての名前の解決が終わった後に引数無しで呼ばれる（失敗した場合も呼ぶ）
+    """
+    def run():
+        try:
+            asyncio.run(resolve_hosts_async(names, concurrency, on_resolved))
+        finally:
+            if on_complete:
+                on_complete()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+# --- Reverse Resolution ---
+async def reverse_lookup_async(ip_address: str) -> str:
+    """IPアドレスの逆引き（PTR） 見つからない場合は空文字列"""
+    cached = REVERSE_CACHE.get(ip_address)
+    if cached is not None:
+        return cached
+
+    hostname = ""
+    ttl = NEGATIVE_DNS_TTL
+    try:
+        if HAS_DNSPYTHON:
+            resolver = dns.asyncresolver.Resolver()
+            resolver.lifetime = DNS_QUERY_TIMEOUT
+            answer = await resolver.resolve(dns.reversename.from_address(ip_address), "PTR")
+            hostname = str(answer[0].target).rstrip('.')
+            ttl = answer.rrset.ttl
+        else:
+            loop = asyncio.get_running_loop()
+            hostname = (await loop.run_in_executor(None, socket.gethostbyaddr, ip_address))[0]
+            ttl = DEFAULT_DNS_TTL
+    except (socket.herror, socket.gaierror, OSError):
+        pass
+    except Exception as e:
+        if not (HAS_DNSPYTHON and isinstance(e, dns.exception.DNSException)):
+            raise
+
+    REVERSE_CACHE.put(ip_address, hostname, ttl)
+    return hostname
+
+
+def reverse_lookup_many(ip_addresses: list[str], concurrency: int = MAX_RESOLVE_CONCURRENCY) -> dict:
+    """応答ホストの逆引きをまとめて並列に行う
+    Returns:
+        hostnames (dict): {ip_address: hostname or ""}
+    """
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def worker(ip_address: str):
+            async with semaphore:
+                return ip_address, await reverse_lookup_async(ip_address)
+
+        return dict(await asyncio.gather(*(worker(ip) for ip in dict.fromkeys(ip_addresses))))
+
+    return asyncio.run(run())
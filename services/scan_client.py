@@ -0,0 +1,67 @@
+import json
+import urllib.error
+import urllib.request
+
+
+# --- Constants ---
+CLIENT_TIMEOUT = 5
+STREAM_TIMEOUT = None # ストリームは結果が届くまで待機
+
+
+class ScanServiceClient:
+    """スキャンジョブサービス（scan_service）のHTTPクライアント"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+
+    def _request(self, method: str, path: str, payload: dict | None = None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            request.add_header("Content-Type", "application/json")
+        with urllib.request.urlopen(request, timeout=CLIENT_TIMEOUT) as response:
+            return json.loads(response.read())
+
+    def is_available(self) -> bool:
+        """サービスが応答するか確認する"""
+        try:
+            self._request("GET", "/jobs")
+            return True
+        except (urllib.error.URLError, OSError, ValueError):
+            return False
+
+    def submit(self, target: str, tcp_ports: list[int] | None = None, udp_ports: list[int] | None = None,
+               priority: int | None = None, submitter: str | None = None,
+               tcp_engine: str | None = None, udp_engine: str | None = None) -> dict:
+        """ジョブを投入する Returns: ジョブの概要 (dict)"""
+        payload = {'target': target, 'tcp_ports': tcp_ports, 'udp_ports': udp_ports,
+                   'tcp_engine': tcp_engine, 'udp_engine': udp_engine}
+        if priority is not None:
+            payload['priority'] = priority
+        if submitter is not None:
+            payload['submitter'] = submitter
+        return self._request("POST", "/jobs", payload)
+
+    def list_engines(self) -> list[dict]:
+        return self._request("GET", "/engines")
+
+    def list_jobs(self) -> list[dict]:
+        return self._request("GET", "/jobs")
+
+    def get_job(self, job_id: str) -> dict:
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def cancel(self, job_id: str) -> dict:
+        return self._request("DELETE", f"/jobs/{job_id}")
+
+    def stream(self, job_id: str, offset: int | None = None):
+        """結果を到着順に返すジェネレータ 最後に {'event': 'done', 'job': {...}} を返す
+        Args:
+            offset (int, optional): この件数目の結果から読み出す 0 の場合は保持している全結果から（エクスポート用）
+        """
+        query = f"?offset={offset}" if offset is not None else ""
+        request = urllib.request.Request(f"{self.base_url}/jobs/{job_id}/stream{query}")
+        with urllib.request.urlopen(request, timeout=STREAM_TIMEOUT) as response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
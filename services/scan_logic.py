@@ -1,15 +1,57 @@
-from scapy.all import IP, TCP, UDP, sr1, conf, ICMP
+from scapy.all import IP, TCP, UDP, sr1, sr, conf, ICMP
 import platform
 import socket
+import itertools
 import json
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import math
+import queue
+import random
+import time
+from .stateless import stateless_syn_scan
+from .engines import ScanEngine, register_engine, select_engine
+from .resolver import resolve_hosts
+from .rate_limit import TokenBucket
+from .fast_parse import TCP_RST
+from .link import sr_cached
+from .tuning import get_tuned_params, calibrate, timeouts_for_rtt
+from .host_cache import HOST_CACHE, ScanObservation, rtt_timeout, order_ports
+from utils import order_ports_by_likelihood
 
 
 # --- Constants ---
+# 調整値（services/tuning.py）が無いネットワークでのフォールバック
 DEFAULT_TIMEOUT_TCP = 2
 MAX_SCAN_WORKERS_TCP = 3
 DEFAULT_TIMEOUT_UDP = 5
 MAX_SCAN_WORKERS_UDP = 2
+DOWN_HOST_TIMEOUT_TCP = 0.5 # 前回どのポートも応答しなかったホスト（待っても応答が無い見込みのため短くする）
+DOWN_HOST_TIMEOUT_UDP = 1
+IN_FLIGHT_PER_WORKER = 2 # 投入済み・未完了のタスク数の上限（同時実行数あたり）
+
+# --- Chunked dispatch ---
+CHUNK_SIZE_MIN = 4
+CHUNK_SIZE_MAX = 256
+CHUNK_IPC_OVERHEAD_RATIO = 0.05 # タスクあたりのプロセス間通信コストを、ネットワーク待ち時間のこの割合以下にする
+CHUNK_LATENCY_SMOOTHING = 0.5 # ポートあたり所要時間の移動平均の重み
+IPC_SAMPLE_COUNT = 3
+
+# --- Port order ---
+PORT_ORDER_LIKELIHOOD = "likelihood" # オープンである頻度の高いポートから
+PORT_ORDER_ASCENDING = "ascending" # 指定された順
+
+# --- Multi-probe (firewall classification) ---
+PROBE_SYN = "syn"
+PROBE_ACK = "ack"
+PROBE_FIN = "fin"
+PROBE_NULL = "null"
+PROBE_TCP_FLAGS = {PROBE_SYN: "S", PROBE_ACK: "A", PROBE_FIN: "F", PROBE_NULL: ""}
+MULTI_PROBE_SPORT_BASE = 40000 # プローブ種別ごとに送信元ポートを変え、応答を種別に対応付ける
+MULTI_PROBE_SPORT_SPAN = 20000
+FIREWALL_NONE = "unfiltered" # SYN にも ACK にも応答する
+FIREWALL_STATEFUL = "stateful" # SYN には応答し、接続の無い ACK は捨てる
+FIREWALL_STATELESS = "stateless" # SYN だけ捨て、ACK / FIN / NULL には RST が返る
+FIREWALL_BLOCKING = "blocking" # すべて無応答（またはホスト停止）
+FIREWALL_REJECTING = "rejecting" # ICMP 到達不能で拒否
 
 
 # --- Helper for IP Validation ---
@@ -26,6 +68,232 @@ def _is_valid_ip(ip_address: str) -> bool:
             return False
 
 
+# --- Chunked Dispatch ---
+def _noop():
+    return None
+
+
+def _probe_chunk(engine: ScanEngine, target_ip: str, ports: list[int], timeout: float) -> tuple[list[dict], float]:
+    """ワーカープロセス内で複数ポートを調べる Returns: (結果のリスト, 所要時間（秒）)"""
+    started = time.perf_counter()
+    results = engine.probe_many(target_ip, ports, timeout)
+    return results, time.perf_counter() - started
+
+
+def _measure_ipc_cost(executor) -> float:
+    """空のタスク1回の往復時間（引数・結果の受け渡しとfutureの管理）"""
+    executor.submit(_noop).result() # ワーカーの起動分を除く
+    samples = []
+    for _ in range(IPC_SAMPLE_COUNT):
+        started = time.perf_counter()
+        executor.submit(_noop).result()
+        samples.append(time.perf_counter() - started)
+    return min(samples)
+
+
+class _ChunkSizer:
+    """観測したポートあたりの所要時間から、1タスクに渡すポート数を決める
+    チャンクの所要時間に対して、プロセス間通信のコストが CHUNK_IPC_OVERHEAD_RATIO 以下になる大きさにする。
+    """
+
+    def __init__(self, ipc_cost: float, size_limit: int = CHUNK_SIZE_MAX):
+        self.ipc_cost = ipc_cost
+        self.size_limit = max(CHUNK_SIZE_MIN, min(size_limit, CHUNK_SIZE_MAX))
+        self.size = CHUNK_SIZE_MIN
+        self.per_port = None # ポートあたりの所要時間（秒）
+
+    def observe(self, elapsed: float, port_count: int):
+        sample = elapsed / max(port_count, 1)
+        if self.per_port is None:
+            self.per_port = sample
+        else:
+            self.per_port = CHUNK_LATENCY_SMOOTHING * sample + (1 - CHUNK_LATENCY_SMOOTHING) * self.per_port
+        if self.per_port > 0:
+            wanted = math.ceil(self.ipc_cost / (CHUNK_IPC_OVERHEAD_RATIO * self.per_port))
+        else:
+            wanted = self.size_limit
+        self.size = max(CHUNK_SIZE_MIN, min(wanted, self.size_limit))
+
+
+# --- Task Runner ---
+def _iter_scan_tasks(engine: ScanEngine, target_ip: str, ports, timeout: int,
+                     rate_limiter=None, cancel_event=None, max_workers: int | None = None,
+                     window: int | None = None):
+    """エンジンの probe をプールで並列実行し、完了した結果から返すジェネレータ
+    同時に投入するタスクは最大 window 個で、1つ完了するごとに ports から次のポートを取り出す。
+    結果を取り出す側が遅い場合は投入も止まる（メモリは ports の数ではなく window に比例）。
+    engine.chunked のエンジンは、複数ポートを1タスクにまとめて probe_many で実行する。
+    チャンクの大きさは観測したポートあたりの所要時間に合わせて変える。
+    Args:
+        engine (ScanEngine): 使用するスキャンエンジン
+        ports (Iterable[int]): ポート リストでもジェネレータでもよい（必要になった分だけ取り出す）
+        rate_limiter (TokenBucket, optional): 共有の送信予算 送るパケットごとに1トークン消費（ポートあたり engine.packets_per_port）
+        cancel_event (threading.Event, optional): セットされると以降のプローブを投入せず中断
+        max_workers (int, optional): 同時実行数 Noneの場合はエンジンの既定値
+        window (int, optional): 投入済み・未完了のタスク数の上限 Noneの場合は 同時実行数 × IN_FLIGHT_PER_WORKER
+    Yields:
+        result (dict) e.g.: {'port': 80, 'status': 'open'}
+    """
+    completed = queue.SimpleQueue()
+    window = window or engine.worker_count(max_workers) * IN_FLIGHT_PER_WORKER
+    executor = engine.make_executor(max_workers)
+    in_flight = {} # 投入済み・未回収の future -> ポートのリスト
+    port_iter = iter(ports)
+
+    sizer = None
+    if engine.chunked:
+        # 一度に送るパケット数は送信予算のバケット容量まで
+        size_limit = int(rate_limiter.capacity // engine.packets_per_port) if rate_limiter is not None and rate_limiter.rate else CHUNK_SIZE_MAX
+        sizer = _ChunkSizer(_measure_ipc_cost(executor), size_limit)
+
+    def collect(future) -> list[dict]:
+        chunk = in_flight.pop(future)
+        if future.cancelled():
+            return []
+        try:
+            if sizer is None:
+                return [future.result()]
+            results, elapsed = future.result()
+            sizer.observe(elapsed, len(chunk))
+            return results
+        # エラーハンドリング用 ポート番号とエラーメッセージを記載
+        except Exception as e:
+            return [{'port': port_val, 'status': f'executor_error: {e}'} for port_val in chunk]
+
+    def cancelled() -> bool:
+        return cancel_event is not None and cancel_event.is_set()
+
+    try:
+        exhausted = False
+        while not exhausted or in_flight:
+            # 窓に空きがある間だけ次のポートを投入
+            while not exhausted and len(in_flight) < window:
+                chunk = list(itertools.islice(port_iter, sizer.size if sizer else 1))
+                # 共有の送信予算を取得 キャンセル時は以降を投入しない
+                if not chunk or cancelled() or (
+                        rate_limiter is not None and not rate_limiter.acquire(len(chunk) * engine.packets_per_port, cancel_event=cancel_event)):
+                    exhausted = True
+                    break
+                if sizer is None:
+                    future = executor.submit(engine.probe, target_ip, chunk[0], timeout)
+                else:
+                    future = executor.submit(_probe_chunk, engine, target_ip, chunk, timeout)
+                in_flight[future] = chunk
+                future.add_done_callback(completed.put)
+
+            # キャンセル時は未実行のタスクを取り消す（取り消したタスクのコールバックも1回ずつ届く）
+            if cancelled():
+                exhausted = True
+                for future in list(in_flight):
+                    future.cancel()
+            if not in_flight:
+                break
+
+            # 1つ完了するまで待ち、回収した結果を返す
+            for result in collect(completed.get()):
+                if result:
+                    yield result
+    finally:
+        # 途中で閉じられた場合も実行待ちのプローブは捨てる
+        for future in list(in_flight):
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _run_scan_tasks(engine: ScanEngine, target_ip: str, ports, timeout: int,
+                    rate_limiter=None, cancel_event=None, on_result=None, max_workers: int | None = None,
+                    window: int | None = None, collect: bool = True) -> list[dict]:
+    """_iter_scan_tasks の結果をリストにまとめる共通処理
+    Args:
+        on_result (callable, optional): 完了した結果ごとに呼ばれるコールバック
+        collect (bool): Falseの場合は結果をリストに溜めず on_result にだけ渡し、空のリストを返す
+        その他: _iter_scan_tasks を参照
+    Returns:
+        scan_results (list[dict])
+    """
+    scan_results = [] # 初期化
+    for result in _iter_scan_tasks(engine, target_ip, ports, timeout, rate_limiter, cancel_event,
+                                   max_workers, window):
+        if collect:
+            scan_results.append(result)
+        if on_result:
+            on_result(result)
+    return scan_results
+
+
+def iter_port_scan(protocol: str, target_ip: str, ports, timeout: float | None = None,
+                   rate_limiter=None, cancel_event=None, engine: ScanEngine | None = None,
+                   max_workers: int | None = None, window: int | None = None):
+    """1ホストのポートを順に調べ、完了した結果から返すジェネレータ（結果はリストに溜めない）
+    大量のポートやホストを扱う呼び出し側は、ports にジェネレータを渡し、結果を取り出した分だけ次を投入させる。
+    Args:
+        protocol (str): 'tcp' / 'udp'
+        target_ip (str): スキャン対象のIPアドレス
+        ports (Iterable[int]): ポート
+        timeout (float, optional): 各パケットの応答を待つタイムアウト（秒） Noneの場合は既定値
+        engine (ScanEngine, optional): 使用するエンジン Noneの場合は自動選択
+        その他: _iter_scan_tasks を参照
+    Yields:
+        result (dict) e.g.: {'port': 80, 'status': 'open'}
+    """
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT_TCP if protocol == 'tcp' else DEFAULT_TIMEOUT_UDP
+    yield from _iter_scan_tasks(engine or select_engine(protocol), target_ip, ports, timeout,
+                                rate_limiter, cancel_event, max_workers, window)
+
+
+# --- RTT Helper ---
+def _reply_rtt(sent_packet, resp) -> float | None:
+    """送信時刻と応答の受信時刻からRTT（秒）を求める"""
+    if not getattr(sent_packet, 'sent_time', None):
+        return None
+    return round(max(float(resp.time - sent_packet.sent_time), 0.0), 6)
+
+
+# --- TCP Reply Classification ---
+def _classify_tcp_reply(resp, port: int, sent_packet=None) -> dict:
+    """SYNプローブへの応答（None は無応答）を open / closed / filtered / unknown に分類する
+    Args:
+        resp: sr1 の戻り値（scapy パケット）
+        port (int): プローブしたTCPポート
+        sent_packet: 送信したプローブ（RTTの計算用）
+    Returns:
+        (dict) e.g.: {'port': 80, 'status': 'open', 'rtt': 0.004}
+    """
+    # 応答なし
+    if not resp:
+        return {'port': port, 'status': 'filtered'}
+
+    # TCP 応答（TCPレイヤが存在する場合）
+    if resp.haslayer(TCP):
+        tcp_layer = resp.getlayer(TCP)
+
+        # SYN-ACK オープン
+        if tcp_layer.flags == "SA": # SYN/ACK
+            return {'port': port, 'status': 'open', 'rtt': _reply_rtt(sent_packet, resp)}
+        # RST-ACK クローズ
+        elif tcp_layer.flags == "RA": # RST/ACK
+            return {'port': port, 'status': 'closed', 'rtt': _reply_rtt(sent_packet, resp)}
+        # その他のTCPフラグ
+        else:
+            return {'port': port, 'status': 'filtered'}
+
+    # ICMP 応答（フィルタリング）
+    elif resp.haslayer(ICMP):
+        icmp_layer = resp.getlayer(ICMP)
+
+        # ICMP Type3 (Destination Unreachable)
+        if icmp_layer.type == 3 and icmp_layer.code in [1, 2, 3, 9, 10, 13]:
+            return {'port': port, 'status': 'filtered'}
+        # ICMP Type3以外
+        else:
+            return {'port': port, 'status': 'filtered'}
+
+    # 不明な応答
+    else:
+        return {'port': port, 'status': 'unknown'}
+
+
 # --- TCP Helper ---
 def _scan_single_tcp_port(target_ip: str, port: int, timeout: int) -> dict:
     """TCP単体スキャン helper 関数
@@ -40,40 +308,7 @@ def _scan_single_tcp_port(target_ip: str, port: int, timeout: int) -> dict:
         # SYNパケット作成
         syn_packet = IP(dst=target_ip)/TCP(dport=port, flags="S")
         resp = sr1(syn_packet, timeout=timeout, verbose=0)
-
-
-        # 応答なし
-        if not resp:
-            return {'port': port, 'status': 'filtered'}
-
-        # TCP 応答（TCPレイヤが存在する場合）
-        if resp.haslayer(TCP):
-            tcp_layer = resp.getlayer(TCP)
-            
-            # SYN-ACK オープン
-            if tcp_layer.flags == "SA": # SYN/ACK
-                return {'port': port, 'status': 'open'}
-            # RST-ACK クローズ
-            elif tcp_layer.flags == "RA": # RST/ACK
-                return {'port': port, 'status': 'closed'}
-            # その他のTCPフラグ
-            else:
-                return {'port': port, 'status': 'filtered'}
-
-        # ICMP 応答（フィルタリング）
-        elif resp.haslayer(ICMP):
-            icmp_layer = resp.getlayer(ICMP)
-            
-            # ICMP Type3 (Destination Unreachable)
-            if icmp_layer.type == 3 and icmp_layer.code in [1, 2, 3, 9, 10, 13]:
-                return {'port': port, 'status': 'filtered'}
-            # ICMP Type3以外
-            else:
-                return {'port': port, 'status': 'filtered'}
-
-        # 不明な応答
-        else:
-            return {'port': port, 'status': 'unknown'}
+        return _classify_tcp_reply(resp, port, syn_packet)
 
     # OSErrorを個別に捕捉
     except OSError as oe:
@@ -86,34 +321,52 @@ def _scan_single_tcp_port(target_ip: str, port: int, timeout: int) -> dict:
 
 
 # --- TCP Submit ---
-def tcp_scan(target_ip: str, ports: list[int], timeout: int = DEFAULT_TIMEOUT_TCP):
+def tcp_scan(target_ip: str, ports: list[int], timeout: int = DEFAULT_TIMEOUT_TCP,
+             rate_limiter=None, cancel_event=None, on_result=None, engine: ScanEngine | None = None,
+             max_workers: int | None = None, collect: bool = True):
     """TCPスキャンタスク Thread submit 関数
     Args:
         target_ip (str): スキャン対象のIPアドレス
         ports (list[int]): スキャンするTCPポートのリスト
         timeout (int): 各パケットの応答を待つタイムアウト（秒）
+        rate_limiter, cancel_event, on_result, collect: _run_scan_tasks を参照
+        engine (ScanEngine, optional): 使用するエンジン Noneの場合は自動選択
+        max_workers (int, optional): 同時実行数 Noneの場合はエンジンの既定値
     Returns:
         scan_results (list[dict]) e.g.: [{'port': 80, 'status': 'open'}]
     """
-    scan_results = [] # 初期化
+    return _run_scan_tasks(engine or select_engine('tcp'), target_ip, ports, timeout,
+                           rate_limiter, cancel_event, on_result, max_workers, collect=collect)
 
-    with ProcessPoolExecutor(max_workers=MAX_SCAN_WORKERS_TCP) as executor:
-        future_to_port = {
-            executor.submit(_scan_single_tcp_port, target_ip, port, timeout): port
-            for port in ports
-        }
-        for future in as_completed(future_to_port):
-            try:
-                result = future.result()
-                if result:
-                    scan_results.append(result)
-
-            # エラーハンドリング用 ポート番号とエラーメッセージを記載                
-            except Exception as e:
-                port_val = future_to_port[future]
-                scan_results.append({'port': port_val, 'status': f'executor_error: {e}'})
 
-    return scan_results
+# --- UDP Reply Classification ---
+def _classify_udp_reply(resp, port: int, sent_packet=None) -> dict:
+    """UDPプローブへの応答（None は無応答）を open / closed / filtered / open|filtered / unknown に分類する
+    Args:
+        resp: sr1 の戻り値（scapy パケット）
+        port (int): プローブしたUDPポート
+        sent_packet: 送信したプローブ（RTTの計算用）
+    Returns:
+        (dict) e.g.: {'port': 53, 'status': 'closed', 'rtt': 0.004}
+    """
+    # 応答なし
+    if not resp:
+        # UDPの場合、応答がないことは 'open|filtered' と解釈されることが多い
+        return {'port': port, 'status': 'open|filtered'}
+
+    # UDP 応答
+    if resp.haslayer(UDP):
+        return {'port': port, 'status': 'open', 'rtt': _reply_rtt(sent_packet, resp)}
+    icmp_layer = resp.getlayer(ICMP)
+    # ICMP Port Unreachable (Type 3, Code 3) はポートがクローズされていることを示す
+    if icmp_layer is not None and icmp_layer.type == 3 and icmp_layer.code == 3:
+        return {'port': port, 'status': 'closed', 'rtt': _reply_rtt(sent_packet, resp)}
+    # その他のICMPエラー (e.g., Type 3, Code 1, 2, 9, 10, 13) はフィルタリングされている可能性
+    elif icmp_layer is not None and icmp_layer.type == 3 and icmp_layer.code in [1, 2, 9, 10, 13]:
+        return {'port': port, 'status': 'filtered'}
+    # 不明な応答
+    else:
+        return {'port': port, 'status': 'unknown'}
 
 
 # --- UDP Helper ---
@@ -131,23 +384,7 @@ def _scan_single_udp_port(target_ip: str, port: int, timeout: int) -> dict:
         udp_packet = IP(dst=target_ip)/UDP(dport=port)
         resp = sr1(udp_packet, timeout=timeout, verbose=0)
         
-        # 応答なし
-        if not resp:
-            # UDPの場合、応答がないことは 'open|filtered' と解釈されることが多い
-            return {'port': port, 'status': 'open|filtered'}
-
-        # UDP 応答
-        if resp.haslayer(UDP):
-            return {'port': port, 'status': 'open'}
-        # ICMP Port Unreachable (Type 3, Code 3) はポートがクローズされていることを示す
-        elif resp.haslayer(ICMP) and resp.getlayer(ICMP).type == 3 and resp.getlayer(ICMP).code == 3:
-            return {'port': port, 'status': 'closed'}
-        # その他のICMPエラー (e.g., Type 3, Code 1, 2, 9, 10, 13) はフィルタリングされている可能性
-        elif resp.haslayer(ICMP) and resp.getlayer(ICMP).type == 3 and resp.getlayer(ICMP).code in [1, 2, 9, 10, 13]:
-            return {'port': port, 'status': 'filtered'}
-        # 不明な応答
-        else:
-            return {'port': port, 'status': 'unknown'}
+        return _classify_udp_reply(resp, port, udp_packet)
 
     # OSErrorを個別に捕捉
     except OSError as oe:
@@ -160,34 +397,333 @@ def _scan_single_udp_port(target_ip: str, port: int, timeout: int) -> dict:
 
 
 # --- UDP Submit ---
-def udp_scan(target_ip: str, ports: list[int], timeout: int = DEFAULT_TIMEOUT_UDP):
+def udp_scan(target_ip: str, ports: list[int], timeout: int = DEFAULT_TIMEOUT_UDP,
+             rate_limiter=None, cancel_event=None, on_result=None, engine: ScanEngine | None = None,
+             max_workers: int | None = None, collect: bool = True):
     """UDPスキャンタスク Thread submit 関数
     Args:
         target_ip (str): スキャン対象のIPアドレス
         ports (list[int]): スキャンするUDPポートのリスト
         timeout (int): 各パケットの応答を待つタイムアウト（秒）
+        rate_limiter, cancel_event, on_result, collect: _run_scan_tasks を参照
+        engine (ScanEngine, optional): 使用するエンジン Noneの場合は自動選択
+        max_workers (int, optional): 同時実行数 Noneの場合はエンジンの既定値
     Returns:
         scan_results (list[dict]) e.g.: [{'port': 53, 'status': 'open'}]
     """
-    scan_results = [] # Initialize scan_results
-
-    with ProcessPoolExecutor(max_workers=MAX_SCAN_WORKERS_UDP) as executor:
-        future_to_port = {
-            executor.submit(_scan_single_udp_port, target_ip, port, timeout): port
-            for port in ports
-        }
-        for future in as_completed(future_to_port):
-            try:
-                result = future.result()
-                if result:
-                    scan_results.append(result)
+    return _run_scan_tasks(engine or select_engine('udp'), target_ip, ports, timeout,
+                           rate_limiter, cancel_event, on_result, max_workers, collect=collect)
+
+
+# --- Batch Helper ---
+def _exchange(target_ip: str, probe_layer, timeout: float, cached_link: bool = False):
+    """L4のプローブ（またはそのリスト）を送受信する Returns: sr と同じ (answered, unanswered)"""
+    exchanged = sr_cached(target_ip, probe_layer, timeout) if cached_link else None
+    if exchanged:
+        return exchanged
+    if isinstance(probe_layer, list):
+        return sr([packet for layer in probe_layer for packet in IP(dst=target_ip)/layer], timeout=timeout, verbose=0)
+    return sr(IP(dst=target_ip)/probe_layer, timeout=timeout, verbose=0)
+
+
+def _scan_many_ports(target_ip: str, ports: list[int], timeout: float, protocol: str,
+                     cached_link: bool = False) -> list[dict]:
+    """複数ポートのプローブを sr でまとめて送信し、応答を対応付けて分類する
+    全プローブの送信後、未応答のプローブについてのみ timeout まで待つ（ポートごとに待たない）。
+    cached_link が True の場合は、キャッシュした送信路と開いたままのソケット（services.link）で送受信する
+    （次ホップのMACアドレスを解決できない宛先は sr にフォールバック）。
+    Returns:
+        (list[dict]) e.g.: [{'port': 80, 'status': 'open', 'rtt': 0.004}, {'port': 81, 'status': 'closed', ...}]
+    """
+    layer, classify = (TCP, _classify_tcp_reply) if protocol == 'tcp' else (UDP, _classify_udp_reply)
+    try:
+        probe_layer = TCP(dport=ports, flags="S") if protocol == 'tcp' else UDP(dport=ports)
+        answered, unanswered = _exchange(target_ip, probe_layer, timeout, cached_link)
+        results = {}
+        for sent, resp in answered:
+            port = sent[layer].dport
+            results[port] = classify(resp, port, sent)
+        for sent in unanswered:
+            port = sent[layer].dport
+            results[port] = classify(None, port)
+        return [results.get(port) or classify(None, port) for port in ports]
 
-            # エラーハンドリング用 ポート番号とエラーメッセージを記載                
-            except Exception as e:
-                port_val = future_to_port[future]
-                scan_results.append({'port': port_val, 'status': f'executor_error: {e}'})
+    # OSErrorを個別に捕捉
+    except OSError as oe:
+        return [{'port': port, 'status': f'oserror: {oe}'} for port in ports]
+    # その他のエラー
+    except Exception as e:
+        return [{'port': port, 'status': f'error: {e}'} for port in ports]
+
+
+# --- Multi-probe Helper ---
+def _reply_kind(resp) -> str | None:
+    """プローブへの応答の種類 'rst' / 'icmp' / 'other'（None は無応答）"""
+    if not resp:
+        return None
+    if resp.haslayer(TCP):
+        flags = int(resp.getlayer(TCP).flags)
+    elif resp.haslayer(ICMP):
+        return 'icmp'
+    else:
+        return 'other'
+    return 'rst' if flags & TCP_RST else 'other'
+
+
+def _firewall_verdict(syn_result: dict, kinds: dict) -> dict:
+    """SYN の結果と、同じポートへの他のプローブの応答の種類から総合判定する
+    Args:
+        syn_result (dict): _classify_tcp_reply の結果
+        kinds (dict): プローブごとの _reply_kind の結果（SYN を含む）
+            e.g.: {'syn': 'rst', 'ack': 'rst' / 'icmp' / 'other' / None, 'fin': ..., 'null': ...}
+    Returns:
+        (dict) syn_result に 'firewall' / 'verdict' / 'probes' を加えたもの
+            e.g.: {'port': 80, 'status': 'closed', 'rtt': 0.004, 'firewall': 'unfiltered',
+                   'verdict': 'closed, unfiltered', 'probes': {'syn': 'closed', 'ack': 'rst'}}
+    """
+    result = dict(syn_result)
+    status = result['status']
+    syn_answered = status in ('open', 'closed')
+    others = {probe: kind for probe, kind in kinds.items() if probe != PROBE_SYN}
+    others_reset = any(kind == 'rst' for kind in others.values())
+    # RFC 793: FIN / NULL に RST を返すのはクローズのポート（オープンのポートは無応答）
+    fin_null_reset = any(kinds.get(probe) == 'rst' for probe in (PROBE_FIN, PROBE_NULL))
+
+    # SYN 自体への ICMP 到達不能も拒否とする
+    if any(kind == 'icmp' for kind in kinds.values()):
+        firewall = FIREWALL_REJECTING
+    elif syn_answered:
+        firewall = FIREWALL_NONE if kinds.get(PROBE_ACK) == 'rst' else FIREWALL_STATEFUL
+    elif others_reset:
+        firewall = FIREWALL_STATELESS
+        if fin_null_reset:
+            status = 'closed'
+    else:
+        firewall = FIREWALL_BLOCKING
+
+    verdicts = {
+        FIREWALL_NONE: f"{status}, unfiltered",
+        FIREWALL_STATEFUL: f"{status}, stateful filter",
+        FIREWALL_STATELESS: f"{status}, stateless SYN filter",
+        FIREWALL_BLOCKING: f"{status}, blocked (or host down)",
+        FIREWALL_REJECTING: f"{status}, rejected (ICMP)",
+    }
+    result.update({
+        'status': status,
+        'firewall': firewall,
+        'verdict': verdicts[firewall],
+        'probes': {PROBE_SYN: syn_result['status'], **others},
+    })
+    return result
+
+
+def _scan_many_ports_multi(target_ip: str, ports: list[int], timeout: float, probes: tuple[str, ...],
+                           cached_link: bool = False) -> list[dict]:
+    """各ポートに SYN と ACK（と FIN / NULL）を同じ送信パスで送り、応答を1回の受信でまとめて対応付ける
+    プローブ種別ごとに送信元ポートを分けるため、同じ宛先ポートへの複数のプローブの応答を取り違えない。
+    SYN に応答して ACK に応答しなかったポートには ACK だけをもう1回送り、それでも無応答ならステートフルと判定する。
+    Args:
+        target_ip (str): スキャン対象のIPアドレス
+        ports (list[int]): スキャンするTCPポートのリスト
+        timeout (float): 全送信後に未応答のプローブを待つ時間（秒）
+        probes (tuple[str]): 送るプローブ 'syn' を含むこと e.g.: ('syn', 'ack', 'fin', 'null')
+        cached_link (bool): _scan_many_ports を参照
+    Returns:
+        (list[dict]) _firewall_verdict の結果
+    """
+    try:
+        sport_base = MULTI_PROBE_SPORT_BASE + random.randrange(MULTI_PROBE_SPORT_SPAN - len(probes))
+        sports = {sport_base + i: probe for i, probe in enumerate(probes)}
+        probe_layers = [TCP(sport=sport, dport=ports, flags=PROBE_TCP_FLAGS[probe], seq=random.getrandbits(32),
+                            ack=random.getrandbits(32) if probe == PROBE_ACK else 0)
+                        for sport, probe in sports.items()]
+        answered, _ = _exchange(target_ip, probe_layers, timeout, cached_link)
+
+        replies = {} # (probe, port) -> (sent, resp)
+        for sent, resp in answered:
+            replies[(sports[sent[TCP].sport], sent[TCP].dport)] = (sent, resp)
+
+        syn_results = {}
+        for port in ports:
+            sent, resp = replies.get((PROBE_SYN, port), (None, None))
+            syn_results[port] = _classify_tcp_reply(resp, port, sent)
+
+        # SYN に応答があり ACK が無応答のポートは ACK を1回だけ送り直す（ACK 1つの損失でステートフルと判定しない）
+        retry_ports = [port for port, result in syn_results.items()
+                       if result['status'] in ('open', 'closed') and (PROBE_ACK, port) not in replies]
+        if PROBE_ACK in probes and retry_ports:
+            ack_sport = next(sport for sport, probe in sports.items() if probe == PROBE_ACK)
+            retry_layer = TCP(sport=ack_sport, dport=retry_ports, flags=PROBE_TCP_FLAGS[PROBE_ACK],
+                              seq=random.getrandbits(32), ack=random.getrandbits(32))
+            answered, _ = _exchange(target_ip, [retry_layer], timeout, cached_link)
+            for sent, resp in answered:
+                replies[(PROBE_ACK, sent[TCP].dport)] = (sent, resp)
+
+        results = []
+        for port in ports:
+            kinds = {probe: _reply_kind(replies.get((probe, port), (None, None))[1]) for probe in probes}
+            results.append(_firewall_verdict(syn_results[port], kinds))
+        return results
+
+    # OSErrorを個別に捕捉
+    except OSError as oe:
+        return [{'port': port, 'status': f'oserror: {oe}'} for port in ports]
+    # その他のエラー
+    except Exception as e:
+        return [{'port': port, 'status': f'error: {e}'} for port in ports]
+
+
+# --- Scapy Engines ---
+class SynEngine(ScanEngine):
+    """Scapy sr1 による SYN スキャン（rawソケットが必要）"""
+    name = "syn"
+    protocol = "tcp"
+    description = "TCP SYN (raw, scapy)"
+    requires_raw = True
+    cost = 1.0
+    executor = "process"
+    max_workers = MAX_SCAN_WORKERS_TCP
+
+    chunked = True
+
+    def probe(self, target_ip: str, port: int, timeout: float) -> dict:
+        return _scan_single_tcp_port(target_ip, port, timeout)
+
+    def probe_many(self, target_ip: str, ports: list[int], timeout: float) -> list[dict]:
+        return _scan_many_ports(target_ip, ports, timeout, 'tcp')
 
-    return scan_results
+
+class UdpEngine(ScanEngine):
+    """Scapy sr1 による UDP スキャン（rawソケットが必要）"""
+    name = "udp"
+    protocol = "udp"
+    description = "UDP (raw, scapy)"
+    requires_raw = True
+    cost = 1.0
+    executor = "process"
+    max_workers = MAX_SCAN_WORKERS_UDP
+
+    chunked = True
+
+    def probe(self, target_ip: str, port: int, timeout: float) -> dict:
+        return _scan_single_udp_port(target_ip, port, timeout)
+
+    def probe_many(self, target_ip: str, ports: list[int], timeout: float) -> list[dict]:
+        return _scan_many_ports(target_ip, ports, timeout, 'udp')
+
+
+class SynLinkEngine(SynEngine):
+    """送信路をキャッシュし、ワーカーごとに開いたままのL2ソケットで送る SYN スキャン
+    経路の検索・MACアドレスの解決・ソケットの作成をプローブごとに行わない。
+    """
+    name = "syn-l2"
+    description = "TCP SYN (raw, cached route / persistent L2 socket)"
+    cost = 0.8
+
+    def probe(self, target_ip: str, port: int, timeout: float) -> dict:
+        return self.probe_many(target_ip, [port], timeout)[0]
+
+    def probe_many(self, target_ip: str, ports: list[int], timeout: float) -> list[dict]:
+        return _scan_many_ports(target_ip, ports, timeout, 'tcp', cached_link=True)
+
+
+class UdpLinkEngine(UdpEngine):
+    """送信路をキャッシュし、ワーカーごとに開いたままのL2ソケットで送る UDP スキャン"""
+    name = "udp-l2"
+    description = "UDP (raw, cached route / persistent L2 socket)"
+    cost = 0.8
+
+    def probe(self, target_ip: str, port: int, timeout: float) -> dict:
+        return self.probe_many(target_ip, [port], timeout)[0]
+
+    def probe_many(self, target_ip: str, ports: list[int], timeout: float) -> list[dict]:
+        return _scan_many_ports(target_ip, ports, timeout, 'udp', cached_link=True)
+
+
+class MultiProbeEngine(SynEngine):
+    """各ポートに SYN と ACK を1回の送信パスで送り、ファイアウォールの種類まで判定する
+    filtered がパケットロスか、ステートフル / ステートレスなフィルタによるものかを区別する。
+    """
+    name = "syn-ack"
+    description = "TCP SYN + ACK single pass (firewall classification)"
+    cost = 1.5 # ポートあたり複数のプローブを送る
+    auto_select = False # 判定の詳しさのために送信量を増やすエンジンは明示した場合だけ使う
+    probes = (PROBE_SYN, PROBE_ACK)
+
+    @property
+    def packets_per_port(self) -> int:
+        return len(self.probes)
+
+    def probe(self, target_ip: str, port: int, timeout: float) -> dict:
+        return self.probe_many(target_ip, [port], timeout)[0]
+
+    def probe_many(self, target_ip: str, ports: list[int], timeout: float) -> list[dict]:
+        return _scan_many_ports_multi(target_ip, ports, timeout, self.probes, cached_link=True)
+
+
+class FullMultiProbeEngine(MultiProbeEngine):
+    """SYN / ACK / FIN / NULL を1回の送信パスで送る（SYN だけを捨てるフィルタの先のクローズも判定できる）"""
+    name = "syn-ack-fin-null"
+    description = "TCP SYN + ACK + FIN + NULL single pass (firewall classification)"
+    cost = 2.5
+    probes = (PROBE_SYN, PROBE_ACK, PROBE_FIN, PROBE_NULL)
+
+
+register_engine(SynEngine())
+register_engine(UdpEngine())
+register_engine(SynLinkEngine())
+register_engine(UdpLinkEngine())
+register_engine(MultiProbeEngine())
+register_engine(FullMultiProbeEngine())
+
+
+# --- Tuned Parameters ---
+def _tune_for_host(target_ip: str, host_info: dict | None, tcp_engine: str | None = None, rate_limiter=None,
+                   auto_tune: bool = True, use_host_cache: bool = True,
+                   calibrate_untuned: bool = False) -> tuple[dict, dict | None]:
+    """ネットワーク単位の調整値とホストキャッシュから、このホストのスキャンに使う調整値を求める
+    Args:
+        host_info (dict, optional): ホストキャッシュのエントリ
+        その他: scan_ports を参照
+    Returns:
+        (tuned, host_info): 調整値（tcp_timeout / udp_workers / max_pps など）と、キャリブレーションで更新したエントリ
+    """
+    tuned = {}
+    if auto_tune:
+        tuned = get_tuned_params(target_ip)
+        # キャリブレーションは指定された場合のみ 既知のホストは省略
+        if tuned is None and host_info is None and calibrate_untuned:
+            print(f"Calibrating scan parameters for {target_ip} ...")
+            tuned = calibrate(target_ip, tcp_engine, rate_limiter=rate_limiter)
+            if use_host_cache and tuned.get('rtt') is not None:
+                host_info = HOST_CACHE.record_rtt(target_ip, [tuned['rtt']])
+        tuned = dict(tuned or {})
+    # ホストのRTTが分かっている場合はネットワーク単位の値より詰めたタイムアウトを使う
+    cached_rtt = rtt_timeout(host_info)
+    if cached_rtt is not None:
+        tuned['tcp_timeout'], tuned['udp_timeout'] = timeouts_for_rtt(cached_rtt)
+    # 前回どのポートも応答しなかったホストは既定の長いタイムアウトを待たない
+    if host_info and host_info.get('alive') is False:
+        tuned['tcp_timeout'] = min(tuned.get('tcp_timeout', DEFAULT_TIMEOUT_TCP), DOWN_HOST_TIMEOUT_TCP)
+        tuned['udp_timeout'] = min(tuned.get('udp_timeout', DEFAULT_TIMEOUT_UDP), DOWN_HOST_TIMEOUT_UDP)
+    # ICMPレート制限のあるホストはUDPを逐次にする（応答の取りこぼしで closed を見逃さないため）
+    if host_info and host_info.get('icmp_rate_limited'):
+        tuned['udp_workers'] = 1
+    return tuned, host_info
+
+
+def tune_for_host(target_ip: str, tcp_engine: str | None = None, rate_limiter=None, auto_tune: bool = True,
+                  use_host_cache: bool = True, calibrate_untuned: bool = False) -> dict:
+    """scan_ports が使う調整値を先に求める（同じホストを繰り返しスキャンする呼び出し元が1回だけ呼ぶ）
+    Args:
+        target_ip (str): スキャン対象のIPアドレス（解決済みのもの）
+        その他: scan_ports を参照
+    Returns:
+        tuned (dict): scan_ports の tuned にそのまま渡せる調整値
+    """
+    host_info = HOST_CACHE.get(target_ip) if use_host_cache else None
+    return _tune_for_host(target_ip, host_info, tcp_engine, rate_limiter, auto_tune, use_host_cache,
+                          calibrate_untuned)[0]
 
 
 # --- TCP/UDP Function Call ---
@@ -195,17 +731,48 @@ def scan_ports(
     target_ip: str,
     tcp_ports: list[int] = None,
     udp_ports: list[int] = None,
-    tcp_timeout: int = DEFAULT_TIMEOUT_TCP,
-    udp_timeout: int = DEFAULT_TIMEOUT_UDP) -> list[dict]:
+    tcp_timeout: float | None = None,
+    udp_timeout: float | None = None,
+    stateless: bool = False,
+    receivers: int | None = None,
+    rate_limiter=None,
+    cancel_event=None,
+    on_result=None,
+    progress=None,
+    tcp_engine: str | None = None,
+    udp_engine: str | None = None,
+    auto_tune: bool = True,
+    calibrate_untuned: bool = False,
+    use_host_cache: bool = True,
+    port_order: str = PORT_ORDER_LIKELIHOOD,
+    collect: bool = True,
+    tuned: dict | None = None) -> list[dict]:
 
     """TCP/UDP 統合スキャン呼び出し関数 結果をマージ
     Args:
-        target_ip (str): スキャン対象のIPアドレス。
+        target_ip (str): スキャン対象のIPアドレス、またはホスト名（解決して先頭のアドレスを使用）
         tcp_ports (list[int], optional): TCPポートのリスト Noneの場合実行しない
         udp_ports (list[int], optional): UDPポートのリスト Noneの場合実行しない
-        timeout (int): 各パケットの応答を待つタイムアウト（秒）
+        tcp_timeout / udp_timeout (float, optional): 各パケットの応答を待つタイムアウト（秒） Noneの場合は調整値
+        stateless (bool): TrueでTCPをステートレスSYNスキャンで実行 無応答のポートは filtered
+        receivers (int, optional): ステートレススキャンの受信プロセス数（stateless_syn_scan を参照）
+        rate_limiter (TokenBucket, optional): 複数スキャンで共有する送信予算
+        cancel_event (threading.Event, optional): セットされると残りのプローブを投入せず終了
+        on_result (callable, optional): 結果（'type'/'host' 付き）が得られるたびに呼ばれるコールバック
+        progress (ScanProgress, optional): 進捗 プローブ総数を加算し、結果ごとに更新する
+        tcp_engine / udp_engine (str, optional): エンジン名 None / 'auto' の場合は権限に応じて最速のものを選択
+        auto_tune (bool): Trueの場合、ネットワーク単位の調整値（同時実行数・レート・タイムアウト）を使用
+        calibrate_untuned (bool): Trueの場合、未調整のネットワークの未知のホストはスキャン前にキャリブレーションする
+            （数秒かかり、data/tuning.json に保存する） Falseの場合は既定値とホストキャッシュのRTTで始める
+        use_host_cache (bool): Trueの場合、ホストキャッシュ（services/host_cache.py）を使用
+            既知のホストはキャリブレーションを省略してRTTからタイムアウトを決め、前回オープンだったポートを先にプローブする
+        port_order (str): 'likelihood' の場合はオープンである頻度の高いポートから、'ascending' の場合は指定順にプローブする
+        collect (bool): Falseの場合は結果をリストに溜めず on_result にだけ渡す（大量のポート・常駐サービス・ワーカー用）
+            ホストキャッシュは結果を逐次集計して更新する
+        tuned (dict, optional): tune_for_host で求めた調整値 指定した場合はキャリブレーションとキャッシュの参照を省略
     Returns:
-        all_results (list[dict]): 全結果をマージし、ポート番号でソートしたリスト
+        all_results (list[dict]): 全結果をマージし、ポート番号でソートしたリスト collect=False の場合は空
+            e.g.: [{'host': '127.0.0.1', 'port': 80, 'status': 'open', 'type': 'tcp'}]
     """
     all_results = []
 
@@ -216,25 +783,98 @@ def scan_ports(
     else:
         print("Using default Scapy settings.\n(e.g., run with sudo on Linux)")
 
-    # --- IP Validation ---
+    # --- IP Validation / Hostname Resolution ---
     if not _is_valid_ip(target_ip):
-        print(f"Error: Invalid target IP address provided: {target_ip}")
-        # 不正なIPの場合は、エラー情報を含む結果を返すか例外を発生させることも検討。
-        return [{'port': 0, 'status': f'invalid_ip: {target_ip}', 'type': 'n/a'}]
+        addresses = resolve_hosts([target_ip]).get(target_ip)
+        if not addresses:
+            print(f"Error: Invalid target IP address provided: {target_ip}")
+            # 不正なIPの場合は、エラー情報を含む結果を返すか例外を発生させることも検討。
+            error_result = {'port': 0, 'status': f'invalid_ip: {target_ip}', 'type': 'n/a'}
+            if on_result:
+                on_result(error_result)
+            return [error_result]
+        print(f"Resolved {target_ip} -> {addresses[0]}")
+        target_ip = addresses[0]
+
+    # --- Host Cache / Tuned Parameters ---
+    host_info = HOST_CACHE.get(target_ip) if use_host_cache else None
+    if tuned is None:
+        tuned, host_info = _tune_for_host(target_ip, host_info, tcp_engine, rate_limiter, auto_tune, use_host_cache,
+                                          calibrate_untuned)
+    else:
+        tuned = dict(tuned)
+    # プローブ順 頻度の高いポート → 前回オープンだったポートを先頭へ
+    if port_order == PORT_ORDER_LIKELIHOOD:
+        tcp_ports = order_ports_by_likelihood(tcp_ports, 'tcp') if tcp_ports else tcp_ports
+        udp_ports = order_ports_by_likelihood(udp_ports, 'udp') if udp_ports else udp_ports
+    if host_info:
+        tcp_ports = order_ports(tcp_ports, host_info, 'tcp') if tcp_ports else tcp_ports
+        udp_ports = order_ports(udp_ports, host_info, 'udp') if udp_ports else udp_ports
+    tcp_timeout = tcp_timeout if tcp_timeout is not None else tuned.get('tcp_timeout', DEFAULT_TIMEOUT_TCP)
+    udp_timeout = udp_timeout if udp_timeout is not None else tuned.get('udp_timeout', DEFAULT_TIMEOUT_UDP)
+    # 共有の送信予算が渡されていない場合は調整値のレートで制限
+    if rate_limiter is None and tuned.get('max_pps'):
+        rate_limiter = TokenBucket(tuned['max_pps'])
+
+    if progress is not None:
+        progress.add_total(len(tcp_ports or []) + len(udp_ports or []))
+
+    # ホストキャッシュ用の集計（結果をリストに溜めずに更新する）
+    observation = ScanObservation(host_info) if use_host_cache else None
+
+    # 結果に種別とホストを付与し、集計・進捗・コールバックへ渡す
+    # probes は結果1件あたりに進める完了プローブ数（送信ごとに進捗を進める経路では 0）
+    def tag_result(protocol: str, probes: int = 1):
+        def callback(res: dict):
+            res['type'] = protocol
+            res['host'] = target_ip
+            if collect:
+                all_results.append(res)
+            if observation is not None:
+                observation.add(res)
+            if progress is not None:
+                progress.advance(res, count=probes)
+            if on_result:
+                on_result(res)
+        return callback
 
     # TCPスキャン呼び出し
-    if tcp_ports:
-        tcp_res = tcp_scan(target_ip, tcp_ports, tcp_timeout)
-        for res in tcp_res:
-            res['type'] = 'tcp'
-            all_results.append(res)
+    if tcp_ports and stateless:
+        # 応答は受信した時点で、無応答（filtered）は待機の終了後に渡す 進捗は SYN の送信ごとに進める
+        tag_tcp = tag_result('tcp', probes=0)
+        # 未応答のポートを求めるためにポート番号だけを保持する（結果の dict は保持しない）
+        # 応答が on_sent より先に届くことがあるため、送信済みと応答済みは別々に記録する
+        sent_ports = set()
+        answered_ports = set()
+
+        def on_sent(host: str, port: int):
+            sent_ports.add(port)
+            if progress is not None:
+                progress.advance()
+
+        def on_answer(res: dict):
+            answered_ports.add(res['port'])
+            tag_tcp(res)
+
+        stateless_syn_scan([target_ip], tcp_ports, timeout=tcp_timeout, on_result=on_answer, receivers=receivers,
+                           rate_limiter=rate_limiter, cancel_event=cancel_event, on_sent=on_sent, collect=False)
+        # キャンセルで送信しなかったポートは結果に含めない
+        for port in tcp_ports:
+            if port in sent_ports and port not in answered_ports:
+                tag_tcp({'port': port, 'status': 'filtered'})
+    elif tcp_ports:
+        tcp_scan(target_ip, tcp_ports, tcp_timeout, rate_limiter, cancel_event, tag_result('tcp'),
+                 select_engine('tcp', tcp_engine), tuned.get('tcp_workers'), collect=False)
 
     # UDPスキャン呼び出し
-    if udp_ports:
-        udp_res = udp_scan(target_ip, udp_ports, udp_timeout)
-        for res in udp_res:
-            res['type'] = 'udp'
-            all_results.append(res)
+    if udp_ports and not (cancel_event is not None and cancel_event.is_set()):
+        udp_scan(target_ip, udp_ports, udp_timeout, rate_limiter, cancel_event, tag_result('udp'),
+                 select_engine('udp', udp_engine), tuned.get('udp_workers'), collect=False)
+
+    # ホストキャッシュの更新（中断したスキャンは部分的な結果のため記録しない）
+    if observation is not None and not (cancel_event is not None and cancel_event.is_set()):
+        HOST_CACHE.record_observation(target_ip, observation)
+        HOST_CACHE.save()
 
     # ポート番号でソート
     all_results.sort(key=lambda x: x['port'])
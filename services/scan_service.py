@@ -0,0 +1,486 @@
+from . import scan_logic
+from .rate_limit import TokenBucket
+from .progress import ScanProgress
+from .engines import available_engines, get_engine, list_engines, ENGINE_AUTO
+from utils import parse_port_range
+from array import array
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import json
+import threading
+import time
+import uuid
+
+'''スキャンジョブサービス
+常駐プロセスとしてスキャンジョブを優先度付きキューで管理し、ローカルのHTTP APIで受け付ける。
+実行中の全ジョブは1つの送信予算（pps）と同時実行数を共有する。GUIもこのAPIのクライアントの1つ。
+
+API:
+    POST   /jobs              ジョブ投入  {"target", "ports" | "tcp_ports"/"udp_ports", "profile", "priority", "submitter",
+                                           "tcp_engine", "udp_engine"}
+    GET    /jobs              ジョブ一覧
+    GET    /jobs/<id>         ジョブ詳細（進捗と、オープンなどの個別に保持している結果）
+    DELETE /jobs/<id>         ジョブのキャンセル
+    GET    /jobs/<id>/stream  結果のストリーム（JSON Lines、最後に {"event": "done"}）
+                              ?offset=N で N 件目の結果から読み出す（エクスポートは offset=0 で全結果を読み出す）
+    GET    /engines           スキャンエンジンの一覧と利用可否
+
+ジョブは結果を次の形で保持し、メモリ使用量をポート数 × 数バイトに抑える。
+  - closed / filtered / open|filtered で付加情報の無い結果: (ホスト, 種別, 状態) ごとのポート番号の配列（rtt は保持しない）
+  - それ以外（open、エラー、ファイアウォール判定付きなど）: 結果の dict
+  - 直近 STREAM_BUFFER_SIZE 件: 到着順のリングバッファ（実行中のストリーム用）
+バッファより古い offset を指定したストリームは、保持している全結果（到着順ではない）を返してから現在の結果に続く。
+読み出しの遅いストリームがバッファに追い越された場合は {"event": "dropped", "count": N} を返して続ける。
+
+終了したジョブ（結果を含む）は job_ttl 秒、または新しい順に max_finished_jobs 件まで保持し、古いものから破棄する。
+'''
+
+
+# --- Constants ---
+SERVICE_HOST_DEFAULT = "127.0.0.1"
+SERVICE_PORT_DEFAULT = 47200
+SERVICE_MAX_PPS = 200 # 全ジョブ共有の送信レート（パケット/秒）
+SERVICE_MAX_CONCURRENT_JOBS = 2
+PRIORITY_DEFAULT = 5 # 値が小さいほど優先
+SUBMITTER_DEFAULT = "anonymous"
+JOB_TTL_DEFAULT = 3600 # 終了したジョブを保持する時間（秒）
+MAX_FINISHED_JOBS_DEFAULT = 100 # 保持する終了済みジョブ数の上限
+STREAM_BUFFER_SIZE = 4096 # 実行中のストリーム用に到着順で保持する直近の結果数
+COMPACT_STATUSES = ('closed', 'filtered', 'open|filtered') # ポート番号だけで保持する状態
+COMPACT_KEYS = {'host', 'port', 'status', 'type', 'rtt'} # これ以外のキーを持つ結果は dict のまま保持する
+
+# --- Job states ---
+JOB_STATE_QUEUED = "queued"
+JOB_STATE_RUNNING = "running"
+JOB_STATE_COMPLETED = "completed"
+JOB_STATE_CANCELLED = "cancelled"
+JOB_STATE_FAILED = "failed"
+JOB_FINISHED_STATES = (JOB_STATE_COMPLETED, JOB_STATE_CANCELLED, JOB_STATE_FAILED)
+
+# --- Scan profiles ---
+PROFILE_PORTS = {
+    "both": (True, True),
+    "tcp": (True, False),
+    "udp": (False, True),
+}
+
+
+# --- Job ---
+class ScanJob:
+    """1件のスキャンジョブ 結果は圧縮して保持し、ストリーム読み出し側に通知する（モジュールの説明を参照）"""
+
+    def __init__(self, target: str, tcp_ports: list[int] | None, udp_ports: list[int] | None,
+                 priority: int = PRIORITY_DEFAULT, submitter: str = SUBMITTER_DEFAULT,
+                 tcp_engine: str = ENGINE_AUTO, udp_engine: str = ENGINE_AUTO):
+        self.id = uuid.uuid4().hex[:12]
+        self.target = target
+        self.tcp_ports = tcp_ports
+        self.udp_ports = udp_ports
+        self.tcp_engine = tcp_engine
+        self.udp_engine = udp_engine
+        self.priority = priority
+        self.submitter = submitter
+        self.state = JOB_STATE_QUEUED
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.results = [] # 個別に保持する結果（open、エラーなど）
+        self.result_count = 0 # 受け取った結果の総数（ストリームの offset の基準）
+        self._compact = {} # (host, type, status) -> array('H') ポート番号
+        self._recent = deque(maxlen=STREAM_BUFFER_SIZE) # 直近の結果（到着順）
+        self.progress = ScanProgress()
+        self.cancel_event = threading.Event()
+        self._changed = threading.Condition()
+
+    def add_result(self, result: dict):
+        with self._changed:
+            if result.get('status') in COMPACT_STATUSES and result.keys() <= COMPACT_KEYS:
+                key = (result.get('host', self.target), result.get('type', 'tcp'), result['status'])
+                self._compact.setdefault(key, array('H')).append(result['port'])
+            else:
+                self.results.append(result)
+            self._recent.append(result)
+            self.result_count += 1
+            self._changed.notify_all()
+
+    def _retained_locked(self) -> list[dict]:
+        """保持している全結果を返す（_changed 取得中に呼ぶ） 圧縮した結果は dict に戻す"""
+        retained = list(self.results)
+        for (host, protocol, status), ports in self._compact.items():
+            retained.extend({'host': host, 'port': port, 'status': status, 'type': protocol} for port in ports)
+        return retained
+
+    def status_counts(self) -> dict:
+        """圧縮して保持している結果の件数 e.g.: {'tcp/closed': 1020}"""
+        with self._changed:
+            counts = {}
+            for (_, protocol, status), ports in self._compact.items():
+                counts[f"{protocol}/{status}"] = counts.get(f"{protocol}/{status}", 0) + len(ports)
+            return counts
+
+    def set_state(self, state: str, error: str | None = None):
+        with self._changed:
+            self.state = state
+            self.error = error
+            if state == JOB_STATE_RUNNING:
+                self.started = time.time()
+            elif state in JOB_FINISHED_STATES:
+                self.finished = time.time()
+            self._changed.notify_all()
+
+    def iter_results(self, offset: int = 0, poll_interval: float = 1.0):
+        """offset 件目以降の結果を返すジェネレータ ジョブ終了で止まる
+        offset がリングバッファより古い場合は、保持している全結果を返してから続ける。
+        読み出しが遅れてバッファから消えた結果は {'event': 'dropped', 'count': N} として通知する。
+        """
+        index = offset
+        with self._changed:
+            if index < self.result_count - len(self._recent):
+                snapshot = self._retained_locked()
+                index = self.result_count
+            else:
+                snapshot = []
+        yield from snapshot
+        while True:
+            with self._changed:
+                while index >= self.result_count and self.state not in JOB_FINISHED_STATES:
+                    self._changed.wait(poll_interval)
+                buffer_start = self.result_count - len(self._recent)
+                dropped = max(buffer_start - index, 0)
+                # 新しい分だけ末尾から取り出す（バッファ全体はコピーしない）
+                new_count = self.result_count - max(index, buffer_start)
+                pending = [self._recent[-i] for i in range(new_count, 0, -1)]
+                finished = self.state in JOB_FINISHED_STATES
+            index += dropped + len(pending)
+            if dropped:
+                yield {'event': 'dropped', 'count': dropped}
+            yield from pending
+            if finished and not pending:
+                return
+
+    def summary(self) -> dict:
+        return {
+            'id': self.id,
+            'target': self.target,
+            'priority': self.priority,
+            'submitter': self.submitter,
+            'tcp_engine': self.tcp_engine,
+            'udp_engine': self.udp_engine,
+            'state': self.state,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'tcp_port_count': len(self.tcp_ports or []),
+            'udp_port_count': len(self.udp_ports or []),
+            'result_count': self.result_count,
+            'progress': self.progress.snapshot(),
+        }
+
+
+# --- Fair Priority Queue ---
+class FairJobQueue:
+    """優先度付きキュー 同じ優先度の中では投入者ごとにラウンドロビンで取り出す"""
+
+    def __init__(self):
+        self._levels = {} # priority -> {submitter: deque[ScanJob]}
+        self._rotation = {} # priority -> deque[submitter]
+        self._lock = threading.Lock()
+
+    def push(self, job: ScanJob):
+        with self._lock:
+            submitters = self._levels.setdefault(job.priority, {})
+            if job.submitter not in submitters:
+                submitters[job.submitter] = deque()
+                self._rotation.setdefault(job.priority, deque()).append(job.submitter)
+            submitters[job.submitter].append(job)
+
+    def pop(self) -> ScanJob | None:
+        """最も優先度の高いレベルから、次の投入者のジョブを取り出す（キャンセル済みは読み飛ばす）"""
+        with self._lock:
+            for priority in sorted(self._levels):
+                submitters = self._levels[priority]
+                rotation = self._rotation[priority]
+                while rotation:
+                    submitter = rotation.popleft()
+                    jobs = submitters[submitter]
+                    job = jobs.popleft()
+                    if jobs:
+                        rotation.append(submitter)
+                    else:
+                        del submitters[submitter]
+                    if job.state == JOB_STATE_QUEUED:
+                        return job
+                del self._levels[priority]
+                del self._rotation[priority]
+            return None
+
+
+# --- Service ---
+class ScanService:
+    """ジョブの受付・実行を行う常駐サービス"""
+
+    def __init__(self, max_pps: float = SERVICE_MAX_PPS, max_concurrent_jobs: int = SERVICE_MAX_CONCURRENT_JOBS,
+                 job_ttl: float = JOB_TTL_DEFAULT, max_finished_jobs: int = MAX_FINISHED_JOBS_DEFAULT):
+        """
+        Args:
+            max_pps (float): 全ジョブ共有の送信レート（パケット/秒）
+            max_concurrent_jobs (int): 同時に実行するジョブ数
+            job_ttl (float): 終了したジョブを保持する時間（秒）
+            max_finished_jobs (int): 保持する終了済みジョブ数の上限
+        """
+        self.rate_limiter = TokenBucket(max_pps)
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.job_ttl = job_ttl
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = {}
+        self._jobs_lock = threading.Lock()
+        self.queue = FairJobQueue()
+        self._slots = threading.Semaphore(max_concurrent_jobs)
+        self._wakeup = threading.Event()
+        self._server = None
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._dispatcher.start()
+
+    # --- Job API ---
+    def submit(self, target: str, tcp_ports: list[int] | None = None, udp_ports: list[int] | None = None,
+               priority: int = PRIORITY_DEFAULT, submitter: str = SUBMITTER_DEFAULT,
+               tcp_engine: str = ENGINE_AUTO, udp_engine: str = ENGINE_AUTO) -> ScanJob:
+        job = ScanJob(target, tcp_ports, udp_ports, priority, submitter, tcp_engine, udp_engine)
+        self._evict_finished()
+        with self._jobs_lock:
+            self.jobs[job.id] = job
+        self.queue.push(job)
+        self._wakeup.set()
+        return job
+
+    def cancel(self, job_id: str) -> ScanJob | None:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        if job.state == JOB_STATE_QUEUED:
+            job.set_state(JOB_STATE_CANCELLED)
+        return job
+
+    def list_jobs(self) -> list[ScanJob]:
+        """保持しているジョブを投入順に返す"""
+        with self._jobs_lock:
+            jobs = list(self.jobs.values())
+        return sorted(jobs, key=lambda j: j.created)
+
+    def _evict_finished(self):
+        """期限切れ（job_ttl）と上限（max_finished_jobs）を超えた終了済みジョブを古い順に破棄する
+        ストリームを読み出し中のジョブは参照が残るため、破棄後も最後まで読み出せる。
+        """
+        expires_before = time.time() - self.job_ttl
+        with self._jobs_lock:
+            finished = sorted((job for job in self.jobs.values() if job.state in JOB_FINISHED_STATES),
+                              key=lambda j: j.finished or j.created)
+            excess = max(len(finished) - self.max_finished_jobs, 0)
+            for index, job in enumerate(finished):
+                if index < excess or (job.finished or job.created) < expires_before:
+                    del self.jobs[job.id]
+
+    # --- Dispatcher ---
+    def _dispatch_loop(self):
+        while True:
+            self._slots.acquire()
+            job = self.queue.pop()
+            while job is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                job = self.queue.pop()
+            threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+
+    def _run_job(self, job: ScanJob):
+        job.set_state(JOB_STATE_RUNNING)
+        try:
+            scan_logic.scan_ports(
+                target_ip=job.target,
+                tcp_ports=job.tcp_ports,
+                udp_ports=job.udp_ports,
+                rate_limiter=self.rate_limiter,
+                cancel_event=job.cancel_event,
+                on_result=job.add_result,
+                progress=job.progress,
+                tcp_engine=job.tcp_engine,
+                udp_engine=job.udp_engine,
+                collect=False, # 結果はジョブ側（job.add_result）で保持する
+            )
+            job.set_state(JOB_STATE_CANCELLED if job.cancel_event.is_set() else JOB_STATE_COMPLETED)
+        except Exception as e:
+            job.set_state(JOB_STATE_FAILED, str(e))
+        finally:
+            self._slots.release()
+            self._evict_finished()
+
+    # --- HTTP Server ---
+    def serve(self, host: str = SERVICE_HOST_DEFAULT, port: int = SERVICE_PORT_DEFAULT, background: bool = False):
+        """HTTP APIを起動する background=True の場合は別スレッドで待ち受ける"""
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        if background:
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        else:
+            self._server.serve_forever()
+
+    def shutdown(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _parse_job_request(body: dict, notices: list[str] | None = None) -> dict:
+    """POST /jobs のリクエストを submit の引数に変換する ValueError は400として返す
+    top-N を頻度データのポート数に切り詰めた場合は notices にお知らせを追加する
+    """
+    if not isinstance(body, dict):
+        raise ValueError("request body must be a JSON object")
+    target = body.get('target')
+    if not target:
+        raise ValueError("target is required")
+
+    if 'ports' in body:
+        use_tcp, use_udp = PROFILE_PORTS.get(body.get('profile', 'both'), (None, None))
+        if use_tcp is None:
+            raise ValueError(f"unknown profile: {body.get('profile')}")
+        tcp_ports = parse_port_range(str(body['ports']), protocol='tcp', notices=notices) if use_tcp else None
+        udp_ports = parse_port_range(str(body['ports']), protocol='udp', notices=notices) if use_udp else None
+    else:
+        tcp_ports = [int(port) for port in body.get('tcp_ports') or []] or None
+        udp_ports = [int(port) for port in body.get('udp_ports') or []] or None
+    if not tcp_ports and not udp_ports:
+        raise ValueError("no ports to scan")
+
+    # エンジン名の検証（不明な名前は ValueError）
+    engine_names = {}
+    for key, protocol in (('tcp_engine', 'tcp'), ('udp_engine', 'udp')):
+        name = body.get(key) or ENGINE_AUTO
+        if name != ENGINE_AUTO and get_engine(name).protocol != protocol:
+            raise ValueError(f"{name} is not a {protocol} engine")
+        engine_names[key] = name
+
+    return {
+        'target': target,
+        'tcp_ports': tcp_ports,
+        'udp_ports': udp_ports,
+        **engine_names,
+        'priority': int(body.get('priority', PRIORITY_DEFAULT)),
+        'submitter': str(body.get('submitter', SUBMITTER_DEFAULT)),
+    }
+
+
+def _make_handler(service: ScanService):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _job_from_path(self) -> tuple[ScanJob | None, list[str]]:
+            parts = [part for part in self.path.split('?')[0].split('/') if part]
+            job = service.jobs.get(parts[1]) if len(parts) >= 2 and parts[0] == 'jobs' else None
+            return job, parts
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/jobs':
+                return self._send_json(404, {'error': 'not found'})
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                notices = []
+                job = service.submit(**_parse_job_request(body, notices))
+            except (ValueError, TypeError) as e:
+                return self._send_json(400, {'error': str(e)})
+            self._send_json(201, dict(job.summary(), notices=notices) if notices else job.summary())
+
+        def do_GET(self):
+            job, parts = self._job_from_path()
+            if parts == ['engines']:
+                available = {engine.name for engine in available_engines()}
+                return self._send_json(200, [dict(engine.info(), available=engine.name in available)
+                                             for engine in list_engines()])
+            if parts == ['jobs']:
+                service._evict_finished()
+                return self._send_json(200, [j.summary() for j in service.list_jobs()])
+            if job is None:
+                return self._send_json(404, {'error': 'job not found'})
+            if len(parts) == 2:
+                return self._send_json(200, dict(job.summary(), results=list(job.results), status_counts=job.status_counts()))
+            if len(parts) == 3 and parts[2] == 'stream':
+                try:
+                    offset = int(parse_qs(urlsplit(self.path).query).get('offset', ['0'])[0])
+                except ValueError:
+                    return self._send_json(400, {'error': 'offset must be an integer'})
+                return self._stream(job, max(offset, 0))
+            self._send_json(404, {'error': 'not found'})
+
+        def _stream(self, job: ScanJob, offset: int = 0):
+            # 接続終了までをボディとするJSON Lines ストリーム
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                for result in job.iter_results(offset):
+                    event = result if 'event' in result else dict(result, event='result')
+                    self.wfile.write((json.dumps(event) + "\n").encode())
+                    self.wfile.flush()
+                self.wfile.write((json.dumps({'event': 'done', 'job': job.summary()}) + "\n").encode())
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def do_DELETE(self):
+            job, parts = self._job_from_path()
+            if job is None or len(parts) != 2:
+                return self._send_json(404, {'error': 'job not found'})
+            service.cancel(job.id)
+            self._send_json(200, job.summary())
+
+    return Handler
+
+
+# --- Embedded Service ---
+_embedded_service = None
+
+
+def ensure_service(host: str = SERVICE_HOST_DEFAULT, port: int = SERVICE_PORT_DEFAULT) -> str:
+    """サービスが起動していなければプロセス内で起動する
+    Returns:
+        base_url (str): サービスのURL
+    """
+    global _embedded_service
+    from .scan_client import ScanServiceClient
+
+    base_url = f"http://{host}:{port}"
+    if _embedded_service is None and not ScanServiceClient(base_url).is_available():
+        _embedded_service = ScanService()
+        _embedded_service.serve(host, port, background=True)
+    return base_url
+
+
+# --- Entry Point ---
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="EasyScan job service")
+    parser.add_argument("--listen", default=SERVICE_HOST_DEFAULT)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT_DEFAULT)
+    parser.add_argument("--max-pps", type=float, default=SERVICE_MAX_PPS)
+    parser.add_argument("--max-jobs", type=int, default=SERVICE_MAX_CONCURRENT_JOBS)
+    parser.add_argument("--job-ttl", type=float, default=JOB_TTL_DEFAULT, help="seconds to keep finished jobs")
+    parser.add_argument("--max-finished-jobs", type=int, default=MAX_FINISHED_JOBS_DEFAULT)
+    args = parser.parse_args()
+
+    print(f"EasyScan service listening on http://{args.listen}:{args.port}")
+    ScanService(args.max_pps, args.max_jobs, args.job_ttl, args.max_finished_jobs).serve(args.listen, args.port)
@@ -0,0 +1,413 @@
+from scapy.all import IP, TCP, ICMP, AsyncSniffer, conf
+from scapy.arch.common import compile_filter
+from scapy.layers.inet import TCPerror
+from scapy.interfaces import resolve_iface
+from .fast_parse import parse_ipv4, tcp_status, IPPROTO_TCP, IPPROTO_ICMP, ICMP_DEST_UNREACH
+from .fanout import default_receiver_count, open_fanout_receiver, tcp_reply_filter
+import functools
+import hashlib
+import ipaddress
+import os
+import socket
+import threading
+import time
+
+
+# --- Constants ---
+# 送信元ポートは Linux の既定のエフェメラル範囲（ip_local_port_range = 32768-60999）の外に取る
+# ホスト自身の通信と重なると、その通信の応答を受信側が拾い、カーネルがスキャナの知らない接続を RST してしまう
+SOURCE_PORT_BASE = 61000 # 送信元ポートの下限
+SOURCE_PORT_SPAN = 4096 # 61000-65095
+LOCAL_PORT_RANGE_PATH = "/proc/sys/net/ipv4/ip_local_port_range"
+LOCAL_RESERVED_PORTS_PATH = "/proc/sys/net/ipv4/ip_local_reserved_ports"
+FEISTEL_ROUNDS = 4
+DEFAULT_TIMEOUT_STATELESS = 2 # 全送信完了後に遅延応答を待つ時間（秒）
+SNIFFER_START_WAIT = 0.5 # スニッファ起動待ち（秒）
+SNIFFER_FILTER = "tcp or icmp"
+ETH_P_IP = 0x0800
+RAW_RECV_BUFFER = 65535
+RAW_RECV_TIMEOUT = 0.2 # 停止確認の間隔（秒）
+
+
+# --- Probe Cookie ---
+def make_scan_key() -> bytes:
+    """スキャン単位のランダムな鍵を生成する"""
+    return os.urandom(16)
+
+
+def probe_cookie(key: bytes, dst_ip: str, dport: int) -> tuple[int, int]:
+    """プローブの識別情報を SYN シーケンス番号と送信元ポートにエンコードする
+    Args:
+        key (bytes): スキャン鍵
+        dst_ip (str): 宛先IPアドレス
+        dport (int): 宛先ポート
+    Returns:
+        (seq, sport) (tuple[int, int]): SYN に設定するシーケンス番号と送信元ポート
+    """
+    digest = hashlib.blake2b(f"{dst_ip}|{dport}".encode(), key=key, digest_size=8).digest()
+    value = int.from_bytes(digest, "big")
+    seq = value & 0xFFFFFFFF
+    sport = SOURCE_PORT_BASE + ((value >> 32) % SOURCE_PORT_SPAN)
+    return seq, sport
+
+
+def validate_reply(key: bytes, src_ip: str, sport: int, dport: int, ack: int) -> bool:
+    """応答パケットのヘッダだけで自分のプローブへの応答か検証する（プローブ表は持たない）
+    Args:
+        key (bytes): スキャン鍵
+        src_ip (str): 応答の送信元IP（＝プローブの宛先）
+        sport (int): 応答の送信元ポート（＝プローブの宛先ポート）
+        dport (int): 応答の宛先ポート（＝プローブの送信元ポート）
+        ack (int): 応答の ACK 番号（SYN-ACK / RST-ACK は seq + 1）
+    Returns:
+        bool: 正しい応答であれば True
+    """
+    seq, expected_sport = probe_cookie(key, src_ip, sport)
+    return dport == expected_sport and ack == (seq + 1) & 0xFFFFFFFF
+
+
+def validate_quoted_probe(key: bytes, dst_ip: str, sport: int, dport: int, seq: int) -> bool:
+    """ICMPエラーに引用された元ヘッダ（宛先/ポート/seq）が自分のプローブか検証する"""
+    expected_seq, expected_sport = probe_cookie(key, dst_ip, dport)
+    return sport == expected_sport and seq == expected_seq
+
+
+def _parse_port_list(text: str) -> list[tuple[int, int]]:
+    """'61000-65095,8080' 形式を [(61000, 65095), (8080, 8080)] にする"""
+    ranges = []
+    for part in text.replace(',', ' ').split():
+        low, _, high = part.partition('-')
+        ranges.append((int(low), int(high or low)))
+    return ranges
+
+
+def source_port_conflict(local_range: str | None = None, reserved: str | None = None) -> tuple[int, int] | None:
+    """送信元ポートの範囲がエフェメラル範囲と重なり、予約もされていない場合はその重なりを返す（Linux）
+    エフェメラル範囲を広げている場合は、重なる範囲を ip_local_reserved_ports に加えるとホストの通信に使われなくなる。
+        sysctl -w net.ipv4.ip_local_reserved_ports=61000-65095
+    Args:
+        local_range / reserved (str, optional): sysctl の値 Noneの場合は /proc から読む
+    Returns:
+        (low, high) 予約されていない重なりの範囲 重ならない（または確認できない）場合は None
+    """
+    try:
+        if local_range is None:
+            with open(LOCAL_PORT_RANGE_PATH) as f:
+                local_range = f.read()
+        if reserved is None:
+            with open(LOCAL_RESERVED_PORTS_PATH) as f:
+                reserved = f.read()
+        ephemeral_low, ephemeral_high = (int(value) for value in local_range.split())
+        reserved_ranges = _parse_port_list(reserved)
+    except (OSError, ValueError):
+        return None
+    unreserved = [port for port in range(max(SOURCE_PORT_BASE, ephemeral_low),
+                                         min(SOURCE_PORT_BASE + SOURCE_PORT_SPAN - 1, ephemeral_high) + 1)
+                  if not any(low <= port <= high for low, high in reserved_ranges)]
+    return (unreserved[0], unreserved[-1]) if unreserved else None
+
+
+# --- Target Permutation ---
+class TargetPermutation:
+    """(host, port) 空間のシード付き可逆置換
+    Feistel ネットワークとサイクルウォーキングで [0, hosts×ports) を並べ替える。
+    インデックスから (host, port) を O(1) メモリで求められるため、インデックス範囲で分割（シャーディング）できる。
+    """
+
+    def __init__(self, hosts, ports: list[int], seed: int | bytes | None = None):
+        """
+        Args:
+            hosts: IPアドレス文字列のリスト、またはCIDR文字列 / ipaddressネットワーク
+            ports (list[int]): ポートのリスト
+            seed (int | bytes | None): 置換のシード Noneの場合ランダム
+        """
+        if isinstance(hosts, str):
+            hosts = ipaddress.ip_network(hosts, strict=False)
+        self.hosts = hosts
+        self.ports = list(ports)
+        self._is_network = isinstance(hosts, (ipaddress.IPv4Network, ipaddress.IPv6Network))
+        self._host_count = hosts.num_addresses if self._is_network else len(hosts)
+        self._host_index = None # index_of 用 遅延生成
+        self._port_index = {port: i for i, port in enumerate(self.ports)}
+        self.size = self._host_count * len(self.ports)
+
+        if seed is None:
+            seed = os.urandom(16)
+        elif isinstance(seed, int):
+            seed = seed.to_bytes(16, "big", signed=False)
+        self._seed = seed
+
+        # 4^half_bits >= size となる最小のドメインを使用
+        bits = max(2, (max(self.size, 1) - 1).bit_length())
+        self._half_bits = (bits + 1) // 2
+        self._half_mask = (1 << self._half_bits) - 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _round(self, round_index: int, value: int) -> int:
+        data = round_index.to_bytes(1, "big") + value.to_bytes(16, "big")
+        digest = hashlib.blake2b(data, key=self._seed, digest_size=8).digest()
+        return int.from_bytes(digest, "big") & self._half_mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self._half_bits, value & self._half_mask
+        for i in range(FEISTEL_ROUNDS):
+            left, right = right, left ^ self._round(i, right)
+        return (left << self._half_bits) | right
+
+    def _decrypt(self, value: int) -> int:
+        left, right = value >> self._half_bits, value & self._half_mask
+        for i in reversed(range(FEISTEL_ROUNDS)):
+            left, right = right ^ self._round(i, left), left
+        return (left << self._half_bits) | right
+
+    def permute(self, index: int) -> int:
+        """置換後の位置を返す（サイクルウォーキング）"""
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def unpermute(self, value: int) -> int:
+        """permute の逆変換"""
+        if not 0 <= value < self.size:
+            raise IndexError(value)
+        index = self._decrypt(value)
+        while index >= self.size:
+            index = self._decrypt(index)
+        return index
+
+    def __getitem__(self, index: int) -> tuple[str, int]:
+        value = self.permute(index)
+        host_i, port_i = divmod(value, len(self.ports))
+        return self._host_at(host_i), self.ports[port_i]
+
+    def _host_at(self, host_i: int) -> str:
+        return str(self.hosts[host_i])
+
+    def index_of(self, host: str, port: int) -> int:
+        """(host, port) が何番目に送信されるかを返す"""
+        if self._is_network:
+            host_i = int(ipaddress.ip_address(host)) - int(self.hosts.network_address)
+        else:
+            if self._host_index is None:
+                self._host_index = {h: i for i, h in enumerate(self.hosts)}
+            host_i = self._host_index[host]
+        return self.unpermute(host_i * len(self.ports) + self._port_index[port])
+
+    def shard(self, shard_index: int, shard_count: int) -> range:
+        """shard_count 分割したときの shard_index 番目のインデックス範囲を返す"""
+        start = self.size * shard_index // shard_count
+        stop = self.size * (shard_index + 1) // shard_count
+        return range(start, stop)
+
+    def iter_range(self, indexes: range | None = None):
+        """インデックス範囲の (host, port) を置換順に返すジェネレータ"""
+        for i in indexes if indexes is not None else range(self.size):
+            yield self[i]
+
+
+# --- Stateless SYN Scan ---
+def _classify_stateless_reply(pkt, key: bytes) -> dict | None:
+    """スニッフした応答を検証・分類する 自分のプローブへの応答でなければ None"""
+    if not pkt.haslayer(IP):
+        return None
+    ip_layer = pkt[IP]
+
+    if pkt.haslayer(TCP):
+        tcp_layer = pkt[TCP]
+        if not validate_reply(key, ip_layer.src, tcp_layer.sport, tcp_layer.dport, tcp_layer.ack):
+            return None
+        if tcp_layer.flags == "SA":
+            status = 'open'
+        elif tcp_layer.flags == "RA":
+            status = 'closed'
+        else:
+            status = 'filtered'
+        return {'host': ip_layer.src, 'port': tcp_layer.sport, 'status': status, 'type': 'tcp'}
+
+    if pkt.haslayer(ICMP) and pkt[ICMP].type == 3:
+        # ICMPエラーに引用された元のIP/TCPヘッダで検証
+        # 引用部分は IPerror / TCPerror としてパースされる（haslayer(TCP) では見つからない）
+        quoted = pkt[ICMP].payload
+        if not quoted.haslayer(TCPerror):
+            return None
+        quoted_tcp = quoted[TCPerror]
+        if not validate_quoted_probe(key, quoted.dst, quoted_tcp.sport, quoted_tcp.dport, quoted_tcp.seq):
+            return None
+        return {'host': quoted.dst, 'port': quoted_tcp.dport, 'status': 'filtered', 'type': 'tcp'}
+
+    return None
+
+
+def _classify_stateless_raw(raw, key: bytes) -> dict | None:
+    """受信したバイト列を scapy のオブジェクトを作らずに検証・分類する 想定外の形式は scapy で判定"""
+    reply = parse_ipv4(raw)
+    if reply is None:
+        return _classify_stateless_reply(IP(bytes(raw)), key)
+
+    if reply.protocol == IPPROTO_TCP:
+        if not validate_reply(key, reply.src, reply.sport, reply.dport, reply.ack):
+            return None
+        return {'host': reply.src, 'port': reply.sport, 'status': tcp_status(reply), 'type': 'tcp'}
+
+    if reply.protocol == IPPROTO_ICMP and reply.icmp_type == ICMP_DEST_UNREACH and reply.quoted_protocol == IPPROTO_TCP:
+        # ICMPエラーに引用された元のIP/TCPヘッダで検証
+        if not validate_quoted_probe(key, reply.quoted_dst, reply.quoted_sport, reply.quoted_dport, reply.quoted_seq):
+            return None
+        return {'host': reply.quoted_dst, 'port': reply.quoted_dport, 'status': 'filtered', 'type': 'tcp'}
+
+    return None
+
+
+class _RawReceiver:
+    """AF_PACKET (SOCK_DGRAM) でIPパケットを受信し、バイト列（memoryview）のまま handler に渡す（Linux）
+    自分が送信したパケット（PACKET_OUTGOING）は渡さない。
+    """
+
+    def __init__(self, iface_name: str, handler):
+        self.handler = handler
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM, socket.htons(ETH_P_IP))
+        self.sock.bind((iface_name, ETH_P_IP))
+        self.sock.settimeout(RAW_RECV_TIMEOUT)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sock.close()
+
+    def _run(self):
+        buffer = bytearray(RAW_RECV_BUFFER)
+        view = memoryview(buffer)
+        while not self._stop.is_set():
+            try:
+                size, address = self.sock.recvfrom_into(buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if address[2] == socket.PACKET_OUTGOING:
+                continue
+            self.handler(view[:size])
+
+
+def _open_raw_receiver(iface, handler) -> _RawReceiver | None:
+    """高速受信を開始する AF_PACKET が使えない環境（Linux以外・権限不足）では None"""
+    if not hasattr(socket, "AF_PACKET"):
+        return None
+    try:
+        receiver = _RawReceiver(iface.network_name, handler)
+    except OSError:
+        return None
+    receiver.start()
+    return receiver
+
+
+def stateless_syn_scan(
+    targets,
+    ports: list[int],
+    seed: int | bytes | None = None,
+    shard: tuple[int, int] = (0, 1),
+    timeout: float = DEFAULT_TIMEOUT_STATELESS,
+    key: bytes | None = None,
+    on_result=None,
+    receivers: int | None = None,
+    rate_limiter=None,
+    cancel_event=None,
+    on_sent=None,
+    collect: bool = True) -> list[dict]:
+
+    """ステートレス SYN スキャン
+    プローブごとの状態を持たず、応答は ACK 番号と宛先ポートだけで検証する。
+    Args:
+        targets: IPアドレスのリスト、またはCIDR文字列 / ipaddressネットワーク
+        ports (list[int]): スキャンするTCPポートのリスト
+        seed (int | bytes | None): 送信順の置換シード 全シャードで同じ値を指定する
+        shard (tuple[int, int]): (シャード番号, シャード数)
+        timeout (float): 全送信完了後に応答を待つ時間（秒）
+        key (bytes | None): プローブ検証用の鍵 Noneの場合ランダム
+        on_result (callable, optional): 応答ごとに呼ばれるコールバック
+        receivers (int, optional): 受信プロセス数 2以上の場合は PACKET_FANOUT で受信と分類を複数コアに分散する（Linux）
+            Noneの場合は default_receiver_count（複数ホストはCPU数、単一ホストは1）
+        rate_limiter (TokenBucket, optional): 共有の送信予算 SYN ごとに1トークン消費
+        cancel_event (threading.Event, optional): セットされると以降の SYN を送らず、遅延応答の待機も打ち切る
+        on_sent (callable, optional): SYN を送信するたびに (host, port) で呼ばれる（進捗表示用）
+        collect (bool): Falseの場合は結果をリストに溜めず on_result にだけ渡す（重複排除用の (host, port) は保持する）
+    Returns:
+        scan_results (list[dict]) e.g.: [{'host': '10.0.0.1', 'port': 80, 'status': 'open', 'type': 'tcp'}]
+        応答のあったプローブのみ（無応答は含まない）
+    """
+    key = key or make_scan_key()
+    permutation = TargetPermutation(targets, ports, seed)
+    conflict = source_port_conflict()
+    if conflict:
+        print(f"Warning: stateless source ports {conflict[0]}-{conflict[1]} overlap ip_local_port_range; "
+              f"reserve them with: sysctl -w net.ipv4.ip_local_reserved_ports={conflict[0]}-{conflict[1]}")
+    scan_results = []
+    seen = set() # 再送された SYN-ACK の重複排除（応答数に比例）
+
+    def record(result: dict | None):
+        if not result:
+            return
+        ident = (result['host'], result['port'])
+        if ident in seen:
+            return
+        seen.add(ident)
+        if collect:
+            scan_results.append(result)
+        if on_result:
+            on_result(result)
+
+    # 送受信するインターフェース（先頭ターゲットへの経路） ループバックは raw ソケットになる
+    iface = resolve_iface(conf.route.route(permutation[0][0])[0] if permutation.size else conf.iface)
+
+    # 受信 複数プロセス（PACKET_FANOUT）または AF_PACKET でバイト列のまま分類し、使えない場合は scapy のスニッファ
+    receiver = None
+    if receivers is None:
+        receivers = default_receiver_count(permutation._host_count)
+    if receivers > 1:
+        receiver = open_fanout_receiver(iface.network_name, functools.partial(_classify_stateless_raw, key=key), record,
+                                        receivers, tcp_reply_filter(SOURCE_PORT_BASE, SOURCE_PORT_BASE + SOURCE_PORT_SPAN))
+    if receiver is None:
+        receiver = _open_raw_receiver(iface, lambda raw: record(_classify_stateless_raw(raw, key)))
+    if receiver is None:
+        handle = lambda pkt: record(_classify_stateless_reply(pkt, key))
+        # BPFフィルタをコンパイルできない環境（libpcap / tcpdump 無し）ではPython側で絞り込む
+        try:
+            compile_filter(SNIFFER_FILTER, iface=iface)
+            receiver = AsyncSniffer(iface=iface, filter=SNIFFER_FILTER, prn=handle, store=False)
+        except Exception:
+            receiver = AsyncSniffer(iface=iface, lfilter=lambda pkt: pkt.haslayer(TCP) or pkt.haslayer(ICMP),
+                                    prn=handle, store=False)
+        receiver.start()
+        time.sleep(SNIFFER_START_WAIT)
+
+    sock = iface.l3socket(False)(iface=iface)
+    try:
+        for host, port in permutation.iter_range(permutation.shard(*shard)):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            if rate_limiter is not None and not rate_limiter.acquire(1, cancel_event=cancel_event):
+                break
+            seq, sport = probe_cookie(key, host, port)
+            sock.send(IP(dst=host)/TCP(sport=sport, dport=port, flags="S", seq=seq))
+            if on_sent:
+                on_sent(host, port)
+        # 遅延応答の待機（キャンセル時は打ち切る）
+        if cancel_event is not None:
+            cancel_event.wait(timeout)
+        else:
+            time.sleep(timeout)
+    finally:
+        sock.close()
+        receiver.stop()
+
+    return scan_results
@@ -0,0 +1,215 @@
+from .engines import select_engine, PROCESS_WORKERS_LIMIT, THREAD_WORKERS_LIMIT
+from scapy.all import IP, TCP
+from utils.file_store import file_lock, write_json_atomic
+from concurrent.futures import ThreadPoolExecutor
+import ipaddress
+import json
+import os
+import statistics
+import time
+
+'''スキャンパラメータの自動調整
+キャリブレーションで、ローカルのCPU数・パケット生成速度と、ターゲットの RTT / 損失率を測定し、
+同時実行数・送信レート・タイムアウトを決める。結果はターゲットのネットワーク（IPv4 /24、IPv6 /64）単位で
+data/tuning.json に保存し、SettingsView から編集できる。
+キャリブレーションは SettingsView の Calibrate、または scan_ports(calibrate_untuned=True) で明示的に実行する
+（通常のスキャンは未調整のネットワークでも測定を挟まずに既定値とホストキャッシュのRTTで始める）。
+各回のプローブは並列に送り、全体を CALIBRATION_BUDGET 秒までに収める。RTTはパケットの送信・受信時刻から求める。
+'''
+
+
+# --- Constants ---
+TUNING_FILE_PATH = "data/tuning.json"
+IPV4_PREFIX = 24
+IPV6_PREFIX = 64
+CALIBRATION_PORTS = [80, 443, 22, 53, 3389] # 応答（open / closed）を得やすいポート
+CALIBRATION_TIMEOUT = 1 # 1回分（全ポートを並列にプローブ）の応答待ち（秒）
+CALIBRATION_ROUNDS = 3 # 1回目で応答したポートを残りの回で再プローブし、損失率を測る
+CALIBRATION_BUDGET = 3 # RTT / 損失率の測定全体の上限（秒） 超える回は実行しない
+CRAFT_SAMPLE_COUNT = 500 # パケット生成速度の測定数
+
+# --- Tuning limits ---
+MIN_TIMEOUT = 0.3
+MAX_TIMEOUT_TCP = 5
+MAX_TIMEOUT_UDP = 8
+TIMEOUT_RTT_MULTIPLIER = 4 # タイムアウト = RTT(最大値) × 倍率 + マージン
+TIMEOUT_MARGIN = 0.2
+UDP_TIMEOUT_FACTOR = 2 # UDPは応答が遅い（ICMPのレート制限）ため長めにする
+MIN_WORKERS = 1
+LOSSY_THRESHOLD = 0.2 # これを超える損失率ではレートと同時実行数を下げる
+MIN_PPS = 10
+
+# --- Tuned parameter keys ---
+TUNING_FIELDS = ('tcp_workers', 'udp_workers', 'tcp_timeout', 'udp_timeout', 'max_pps')
+
+
+# --- Persistence ---
+def network_key(ip_address: str) -> str:
+    """ターゲットIPの属するネットワーク（IPv4 /24、IPv6 /64）"""
+    prefix = IPV6_PREFIX if ':' in ip_address else IPV4_PREFIX
+    return str(ipaddress.ip_network(f"{ip_address}/{prefix}", strict=False))
+
+
+def load_tuning(filepath: str = TUNING_FILE_PATH) -> dict:
+    """保存済みの調整値を読み込む {network: {field: value, ...}}"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        print(f"調整ファイル '{filepath}' の形式が正しくありません。")
+        return {}
+
+
+def save_tuning(tuning: dict, filepath: str = TUNING_FILE_PATH):
+    """調整値を保存する（一意な一時ファイル経由で置き換え）"""
+    with file_lock(filepath):
+        write_json_atomic(filepath, tuning)
+
+
+def get_tuned_params(target_ip: str, filepath: str = TUNING_FILE_PATH) -> dict | None:
+    """ターゲットのネットワークの調整値を返す 未調整の場合は None"""
+    return load_tuning(filepath).get(network_key(target_ip))
+
+
+def update_tuned_params(network: str, params: dict, filepath: str = TUNING_FILE_PATH):
+    """ネットワーク単位で調整値を更新して保存する（読み込みから保存までファイルロックを保持）"""
+    with file_lock(filepath):
+        tuning = load_tuning(filepath)
+        tuning[network] = dict(tuning.get(network, {}), **params)
+        write_json_atomic(filepath, tuning)
+
+
+def delete_tuned_params(network: str, filepath: str = TUNING_FILE_PATH):
+    with file_lock(filepath):
+        tuning = load_tuning(filepath)
+        if tuning.pop(network, None) is not None:
+            write_json_atomic(filepath, tuning)
+
+
+# --- Calibration ---
+def _measure_craft_pps(target_ip: str, count: int = CRAFT_SAMPLE_COUNT) -> float:
+    """ローカルで1秒あたりに生成できるプローブ数（送信側CPUの上限の目安）"""
+    started = time.perf_counter()
+    for port in range(count):
+        bytes(IP(dst=target_ip)/TCP(dport=port + 1, flags="S"))
+    elapsed = time.perf_counter() - started
+    return count / elapsed if elapsed > 0 else float(count)
+
+
+def _probe_round(target_ip: str, engine, ports: list[int], timeout: float, rate_limiter=None) -> list[dict]:
+    """ports を並列にプローブする（1回分の所要時間は timeout 程度）"""
+    if rate_limiter is not None:
+        rate_limiter.acquire(len(ports) * engine.packets_per_port)
+    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+        return list(executor.map(lambda port: engine.probe(target_ip, port, timeout), ports))
+
+
+def _responded(result: dict) -> bool:
+    # open / closed は応答あり（filtered は無応答またはICMPエラー）
+    return result['status'] in ('open', 'closed')
+
+
+def _measure_rtt(target_ip: str, engine, ports: list[int], timeout: float, rate_limiter=None,
+                 rounds: int = CALIBRATION_ROUNDS, budget: float = CALIBRATION_BUDGET) -> tuple[list[float], float | None]:
+    """プローブの応答時間と損失率を測定する
+    RTTはエンジンが返す 'rtt'（送信したパケットの sent_time と応答の受信時刻の差）を使い、
+    パケットの生成やソケットの準備にかかった時間は含めない。
+    損失率は1回目に応答した（open / closed）ポートを再プローブしたときの無応答の割合とする。
+    1回目から無応答のポートはファイアウォールで破棄されている可能性があり、損失とはみなさない。
+    Args:
+        rate_limiter (TokenBucket, optional): 共有の送信予算 プローブごとに engine.packets_per_port トークン消費する
+        budget (float): 測定全体の上限（秒） 次の回が収まらない場合は打ち切る
+    Returns:
+        (rtts, loss): 応答のあったプローブのRTT（秒）のリストと、損失率（応答するポートが無い、または再プローブしなかった場合は None）
+    """
+    deadline = time.monotonic() + budget
+    first = _probe_round(target_ip, engine, ports, timeout, rate_limiter)
+    rtts = [result['rtt'] for result in first if _responded(result) and result.get('rtt') is not None]
+    responsive = [port for port, result in zip(ports, first) if _responded(result)]
+    if not responsive:
+        return rtts, None
+
+    reprobes = lost = 0
+    for _ in range(rounds - 1):
+        if time.monotonic() + timeout > deadline:
+            break
+        for result in _probe_round(target_ip, engine, responsive, timeout, rate_limiter):
+            reprobes += 1
+            if not _responded(result):
+                lost += 1
+            elif result.get('rtt') is not None:
+                rtts.append(result['rtt'])
+    return rtts, (lost / reprobes if reprobes else None)
+
+
+def timeouts_for_rtt(rtt_bound: float) -> tuple[float, float]:
+    """応答待ちの目安（RTTの上限側の見積もり）から TCP / UDP のタイムアウトを決める"""
+    tcp_timeout = min(max(rtt_bound + TIMEOUT_MARGIN, MIN_TIMEOUT), MAX_TIMEOUT_TCP)
+    udp_timeout = min(tcp_timeout * UDP_TIMEOUT_FACTOR, MAX_TIMEOUT_UDP)
+    return round(tcp_timeout, 2), round(udp_timeout, 2)
+
+
+def choose_params(cpu_count: int, craft_pps: float, rtts: list[float], loss: float | None, engine) -> dict:
+    """測定値から同時実行数・レート・タイムアウトを決める（loss が None の場合は損失なしとして扱う）"""
+    # タイムアウト 応答が無い場合は既定の上限を使う
+    if rtts:
+        tcp_timeout, udp_timeout = timeouts_for_rtt(max(rtts) * TIMEOUT_RTT_MULTIPLIER)
+        rtt = statistics.median(rtts)
+    else:
+        tcp_timeout = MAX_TIMEOUT_TCP / 2
+        udp_timeout = min(tcp_timeout * UDP_TIMEOUT_FACTOR, MAX_TIMEOUT_UDP)
+        rtt = None
+
+    # 送信レート 生成速度の半分を上限とし、損失が多い場合は下げる
+    max_pps = craft_pps / 2
+    if loss is not None and loss > LOSSY_THRESHOLD:
+        max_pps *= (1 - loss)
+    max_pps = max(MIN_PPS, round(max_pps))
+
+    # 同時実行数 リトルの法則（レート × 1プローブの所要時間）をCPU数で制限
+    probe_time = rtt if rtt else tcp_timeout
+    in_flight = max_pps * probe_time
+    if engine is not None and engine.executor == "thread":
+        limit = THREAD_WORKERS_LIMIT
+    else:
+        limit = min(PROCESS_WORKERS_LIMIT, cpu_count * 2)
+    tcp_workers = int(min(max(in_flight, MIN_WORKERS), limit))
+    udp_workers = max(MIN_WORKERS, tcp_workers // 2)
+
+    return {
+        'tcp_workers': tcp_workers,
+        'udp_workers': udp_workers,
+        'tcp_timeout': round(tcp_timeout, 2),
+        'udp_timeout': round(udp_timeout, 2),
+        'max_pps': max_pps,
+    }
+
+
+def calibrate(target_ip: str, engine_name: str | None = None, save: bool = True,
+              filepath: str = TUNING_FILE_PATH, rate_limiter=None) -> dict:
+    """キャリブレーションを実行し、調整値を返す（save=True でネットワーク単位に保存）
+    Args:
+        target_ip (str): 測定対象のIPアドレス
+        engine_name (str, optional): RTT測定に使うTCPエンジン Noneの場合は自動選択
+        rate_limiter (TokenBucket, optional): 共有の送信予算 測定のプローブもここから消費する
+    Returns:
+        params (dict) e.g.: {'tcp_workers': 8, 'udp_workers': 4, 'tcp_timeout': 0.5, 'udp_timeout': 1.0,
+                             'max_pps': 900, 'rtt': 0.004, 'loss': 0.0, 'cpu_count': 8, 'calibrated_at': ...}
+    """
+    engine = select_engine('tcp', engine_name)
+    cpu_count = os.cpu_count() or 1
+    craft_pps = _measure_craft_pps(target_ip)
+    rtts, loss = _measure_rtt(target_ip, engine, CALIBRATION_PORTS, CALIBRATION_TIMEOUT, rate_limiter)
+
+    params = choose_params(cpu_count, craft_pps, rtts, loss, engine)
+    params.update({
+        'rtt': round(statistics.median(rtts), 4) if rtts else None,
+        'loss': round(loss, 2) if loss is not None else None,
+        'cpu_count': cpu_count,
+        'calibrated_at': time.time(),
+    })
+    if save:
+        update_tuned_params(network_key(target_ip), params, filepath)
+    return params
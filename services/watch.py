@@ -0,0 +1,259 @@
+from . import scan_logic
+from .rate_limit import TokenBucket
+from .resolver import resolve_hosts
+import itertools
+import json
+import math
+import threading
+import time
+import urllib.error
+import urllib.request
+
+'''継続監視モード
+最初に全ポートを調べて基準とし、以降は一定間隔（interval）ごとに
+  - ホット: オープンのポート、最近状態が変わったポート、変化の確認待ちのポート
+  - コールド: それ以外のポートを cycle 秒で一巡するように分割したスライス1つ
+だけを scan_ports で再スキャンする。状態の変化は2回続けて観測した時点でイベントとして通知する。
+名前解決と調整値（タイムアウト・同時実行数・レート）は開始時に1回だけ求め、以降の再スキャンでは
+キャリブレーションやホストキャッシュの読み書きを行わない。
+
+    python -m services.watch 192.168.0.10 --tcp 1-1024 --interval 60 --cycle 3600 \
+        --webhook http://127.0.0.1:9000/easyscan
+'''
+
+
+# --- Constants ---
+WATCH_INTERVAL_DEFAULT = 60 # ホットポートの再スキャン間隔（秒）
+WATCH_CYCLE_DEFAULT = 3600 # コールドポートを一巡する周期（秒）
+RECENT_CHANGE_WINDOW = 3600 # 変化から この秒数の間はホットとして扱う
+WEBHOOK_TIMEOUT = 5
+TRACKED_STATUSES = ('open', 'closed', 'filtered', 'open|filtered') # エラー等は状態として記録しない
+
+# --- Events ---
+EVENT_PORT_CHANGED = "port_changed"
+
+
+class PortWatcher:
+    """1ホストのポート状態を継続監視し、変化をコールバック / Webhook に通知する"""
+
+    def __init__(self, target: str, tcp_ports: list[int] | None = None, udp_ports: list[int] | None = None,
+                 interval: float = WATCH_INTERVAL_DEFAULT, cycle: float = WATCH_CYCLE_DEFAULT,
+                 on_change=None, webhook_url: str | None = None, confirm: bool = True, **scan_kwargs):
+        """
+        Args:
+            target (str): 監視対象のIPアドレスまたはホスト名
+            tcp_ports / udp_ports (list[int], optional): 監視するポート
+            interval (float): 再スキャンの間隔（秒）
+            cycle (float): 全ポートを一巡する周期（秒）
+            on_change (callable, optional): 変化イベント (dict) を受け取るコールバック
+            webhook_url (str, optional): 変化イベントを JSON で POST する先（ローカルの受信口を想定）
+            confirm (bool): Trueの場合、変化を2回続けて観測してから通知する（パケットロスによる誤報の抑制）
+            scan_kwargs: scan_ports に渡す引数（tcp_engine, rate_limiter など）
+        """
+        self.target = target
+        self.address = None # 開始時に解決したアドレス
+        self.tuned = None # 開始時に求めた調整値
+        self.interval = interval
+        self.cycle = cycle
+        self.on_change = on_change
+        self.webhook_url = webhook_url
+        self.confirm = confirm
+        self.scan_kwargs = scan_kwargs
+
+        self.all_ports = [('tcp', port) for port in tcp_ports or []] + [('udp', port) for port in udp_ports or []]
+        self.state = {} # (protocol, port) -> {'status': str, 'changed_at': float}
+        self.pending = {} # (protocol, port) -> 確認待ちの新しい状態
+        self.slice_size = math.ceil(len(self.all_ports) / max(1, int(cycle // interval))) if self.all_ports else 0
+        self._cursor = 0 # コールドスイープの位置
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'ticks': 0, 'probes': 0}
+
+    # --- Scheduling ---
+    def hot_ports(self, now: float | None = None) -> set:
+        """毎回再スキャンするポート"""
+        now = now if now is not None else time.time()
+        hot = {key for key, entry in self.state.items()
+               if entry['status'] == 'open' or now - entry['changed_at'] < RECENT_CHANGE_WINDOW}
+        return hot | set(self.pending)
+
+    def _next_cold_slice(self, hot: set) -> list:
+        """コールドポートを巡回位置から slice_size 個取り出す"""
+        cold_slice = []
+        for _ in range(len(self.all_ports)):
+            if len(cold_slice) >= self.slice_size:
+                break
+            key = self.all_ports[self._cursor]
+            self._cursor = (self._cursor + 1) % len(self.all_ports)
+            if key not in hot:
+                cold_slice.append(key)
+        return cold_slice
+
+    def prepare(self):
+        """名前解決と調整値の算出を1回だけ行う（最初の tick から呼ばれる）
+        解決できなかった場合は次の tick で再試行する。
+        """
+        if self.tuned is not None:
+            return
+        if scan_logic._is_valid_ip(self.target):
+            address = self.target
+        else:
+            addresses = resolve_hosts([self.target]).get(self.target)
+            if not addresses:
+                return
+            address = addresses[0]
+        self.tuned = scan_logic.tune_for_host(
+            address,
+            tcp_engine=self.scan_kwargs.get('tcp_engine'),
+            rate_limiter=self.scan_kwargs.get('rate_limiter'),
+            auto_tune=self.scan_kwargs.get('auto_tune', True),
+            use_host_cache=self.scan_kwargs.get('use_host_cache', True),
+            calibrate_untuned=self.scan_kwargs.get('calibrate_untuned', False),
+        )
+        self.address = address
+        # 送信予算が渡されていない場合は調整値のレートで制限（tick ごとに作り直さない）
+        if self.scan_kwargs.get('rate_limiter') is None and self.tuned.get('max_pps'):
+            self.scan_kwargs['rate_limiter'] = TokenBucket(self.tuned['max_pps'])
+
+    def _scan(self, keys) -> list[dict]:
+        tcp_ports = sorted(port for protocol, port in keys if protocol == 'tcp')
+        udp_ports = sorted(port for protocol, port in keys if protocol == 'udp')
+        self.stats['probes'] += len(tcp_ports) + len(udp_ports)
+        if self.tuned is None:
+            # 未解決のホスト名 scan_ports がエラー結果を返す
+            return scan_logic.scan_ports(self.target, tcp_ports or None, udp_ports or None, **self.scan_kwargs)
+        # 開始時の調整値を使い、tick ごとの名前解決・キャリブレーション・ホストキャッシュの保存を省く
+        scan_kwargs = dict(self.scan_kwargs, tuned=self.tuned, auto_tune=False, use_host_cache=False)
+        return scan_logic.scan_ports(self.address, tcp_ports or None, udp_ports or None, **scan_kwargs)
+
+    # --- Change Detection ---
+    def tick(self) -> list[dict]:
+        """1回分の再スキャンを行い、通知した変化イベントを返す（初回は全ポートを調べて基準にする）"""
+        now = time.time()
+        self.prepare()
+        if not self.state:
+            keys = list(self.all_ports)
+        else:
+            hot = self.hot_ports(now)
+            keys = list(hot) + self._next_cold_slice(hot)
+        self.stats['ticks'] += 1
+        if not keys:
+            return []
+
+        events = []
+        for res in self._scan(keys):
+            status = res.get('status')
+            if status not in TRACKED_STATUSES:
+                continue
+            key = (res.get('type'), res['port'])
+            event = self._observe(key, status, now)
+            if event:
+                events.append(event)
+        for event in events:
+            self._emit(event)
+        return events
+
+    def _observe(self, key: tuple, status: str, now: float) -> dict | None:
+        previous = self.state.get(key)
+        if previous is None:
+            # 基準の状態
+            self.state[key] = {'status': status, 'changed_at': 0.0}
+            return None
+        if previous['status'] == status:
+            self.pending.pop(key, None)
+            return None
+        # 1回目の観測では確認待ちにして、次のホットスキャンで再確認する
+        if self.confirm and self.pending.get(key) != status:
+            self.pending[key] = status
+            return None
+        self.pending.pop(key, None)
+        self.state[key] = {'status': status, 'changed_at': now}
+        return {
+            'event': EVENT_PORT_CHANGED,
+            'host': self.target,
+            'port': key[1],
+            'type': key[0],
+            'old': previous['status'],
+            'new': status,
+            'time': now,
+        }
+
+    def _emit(self, event: dict):
+        if self.on_change:
+            self.on_change(event)
+        if self.webhook_url:
+            post_webhook(self.webhook_url, event)
+
+    # --- Loop ---
+    def run(self, max_ticks: int | None = None):
+        """stop() されるまで interval ごとに tick する
+        Args:
+            max_ticks (int, optional): この回数 tick したら終了する（最後の tick の後は待たない） Noneの場合は無制限
+        """
+        for count in itertools.count(1):
+            if self._stop.is_set():
+                break
+            started = time.monotonic()
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Watch error for {self.target}: {e}")
+            if max_ticks and count >= max_ticks:
+                break
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+
+# --- Webhook ---
+def post_webhook(url: str, event: dict) -> bool:
+    """イベントを JSON で POST する 失敗してもスキャンは止めない"""
+    request = urllib.request.Request(url, data=json.dumps(event).encode(), method="POST",
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=WEBHOOK_TIMEOUT):
+            return True
+    except (urllib.error.URLError, OSError) as e:
+        print(f"Webhook error ({url}): {e}")
+        return False
+
+
+# --- Entry Point ---
+if __name__ == "__main__":
+    import argparse
+    from utils import parse_port_range
+
+    parser = argparse.ArgumentParser(description="Watch a host for port state changes")
+    parser.add_argument("target")
+    parser.add_argument("--tcp", default="")
+    parser.add_argument("--udp", default="")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL_DEFAULT)
+    parser.add_argument("--cycle", type=float, default=WATCH_CYCLE_DEFAULT)
+    parser.add_argument("--webhook", default=None)
+    parser.add_argument("--ticks", type=int, default=0, help="stop after N rescans (0 = run forever)")
+    args = parser.parse_args()
+
+    watcher = PortWatcher(
+        args.target,
+        tcp_ports=parse_port_range(args.tcp) if args.tcp else None,
+        udp_ports=parse_port_range(args.udp, protocol='udp') if args.udp else None,
+        interval=args.interval,
+        cycle=args.cycle,
+        on_change=lambda event: print(f"{event['host']} {event['port']}/{event['type']}: {event['old']} -> {event['new']}"),
+        webhook_url=args.webhook,
+    )
+    try:
+        watcher.run(max_ticks=args.ticks or None)
+    except KeyboardInterrupt:
+        pass
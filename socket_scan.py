@@ -1,12 +1,12 @@
 import flet as ft
-import socket
-import json
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from services import scan_logic
+from utils import ThrottledUpdater, load_port_services, parse_port_range
 
 '''EasyScan(Socket)
-ScapyやNpcapに依存せず、Pythonの標準ライブラリのみで実装したGUI簡易スキャナーです。
+ScapyやNpcapの権限に依存せず、OSのconnect()で動作するGUI簡易スキャナーです。
 指定されたIPアドレスとポート範囲に対してTCP(3wayハンドシェイク)スキャンを行います。
+スキャン処理は本体と同じ scan_logic.scan_ports の connect エンジンを使用します。
 アプリの初期段階の名残として残しています。jsonファイルは本体と別のものを使用しています。
 
 PowerShellかターミナルから直接実行してください。
@@ -22,7 +22,7 @@ Caution!!
 TARGET_IP_DEFAULT = "127.0.0.1" # 安全のためデフォルトはローカルホスト
 PORT_RANGE_DEFAULT = "1-1024" 
 SOCKET_TIMEOUT = 2 # 動作の確実性を担保するために1秒指定 短くしてもよい
-MAX_WORKERS = 20
+SCAN_ENGINE = "connect" # 特権不要のエンジン
 
 # --- Scanning statuses ---
 SCANNING_STATUS_PREPARING = "準備完了"
@@ -32,14 +32,9 @@ SCANNING_STATUS_COMPLETED = "スキャン完了"
 SCANNING_STATUS_VALUE_ERROR = "不正なポート範囲"
 SCANNING_STATUS_PORTS_DONT_EXIST = "スキャン対象ポート無し"
 
-# --- Socket error codes (Windows) ---
-ERROR_CODE_CONNECTION_REFUSED = 10061
-ERROR_CODE_WOULD_BLOCK = 10035
-
 # --- Port scan display statuses ---
 DISPLAY_STATUS_OPEN = "オープン"
 DISPLAY_STATUS_CONNECTION_REFUSED = "接続拒否"
-DISPLAY_STATUS_TIMEOUT = "タイムアウト"
 DISPLAY_STATUS_NO_RESPONSE = "応答なし"
 DISPLAY_STATUS_ERROR = "エラー"
 DISPLAY_STATUS_HOST_ERROR = "ホスト解決エラー"
@@ -48,18 +43,6 @@ DISPLAY_STATUS_HOST_ERROR = "ホスト解決エラー"
 SERVICES_FILE_PATH = "data/services.json"
 PORT_SERVICES = {}
 
-def load_port_services(filepath: str) -> dict:
-    # JSONファイル検証 エラーハンドリング手法としてGeminiからの提案
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f) # 問題なければJSON読み込み
-    except FileNotFoundError:
-        print(f"定義ファイル '{filepath}' が見つかりません。")
-        return {}
-    except json.JSONDecodeError:
-        print(f"定義ファイル '{filepath}' の形式が正しくありません。")
-        return {}
-
 
 # --- Main Function ---
 def main(page: ft.Page):
@@ -81,80 +64,44 @@ def main(page: ft.Page):
     scan_button = ft.ElevatedButton(f"{SCANNING_STATUS_STARTING}", on_click=lambda _: start_scan())
     status_text = ft.Text(f"{SCANNING_STATUS_PREPARING}", size=16, color="blue")
     results_text = ft.Column([], expand=True, scroll="always")
+    # スレッドから直接 controls を操作せず、タイマーでまとめて画面更新する
+    ui_updater = ThrottledUpdater(page)
     
-    # ポート範囲指定の確認
-    def parse_port_range(port_range_str):
-        ports = []
-        parts = port_range_str.split(',')
-        for part in parts:
-            if '-' in part:
-                start, end = map(int, part.split('-'))
-                ports.extend(range(start, end + 1))
-            else:
-                ports.append(int(part))
-        return sorted(list(set(ports)))
-
     open_ports_info = [] # ソート用にオープンポート情報を格納
 
 
-    # スキャンロジック本体
-    def scan_port(target_ip, port):
-        sock = None # 初期化
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(SOCKET_TIMEOUT)
-
-            # ポート番号に対応するサービス名を取得
-            service_info = PORT_SERVICES.get(str(port))
-            port_display = f"{port}"
-            
-            # デフォルトプロトコルを設定
-            current_scan_protocol = "TCP"
-            
-            # service_infoがNoneでない(辞書である)ことをチェック
-            if service_info:
-                name = service_info.get("name", "")
-                protocol_from_json = service_info.get("protocol")
-                protocol_info = protocol_from_json if protocol_from_json else current_scan_protocol
-                port_display = f"{port} ({name}, {protocol_info})" if name else f"{port} (不明, {protocol_info})"
-            
-            result = sock.connect_ex((target_ip, port))
-
-            # ポートがオープンしている場合
-            if result == 0:
-                msg = f"{port_display}: {DISPLAY_STATUS_OPEN}"
-                open_ports_info.append((port, msg))
-                return True
-
-            # 接続が拒否された場合
-            elif result == ERROR_CODE_CONNECTION_REFUSED:
-                results_text.controls.append(ft.Text(f"{port_display}: {DISPLAY_STATUS_CONNECTION_REFUSED}", color="orange"))
-
-            # ブロックされた場合は視認性確保のため表示しない
-            elif result != ERROR_CODE_WOULD_BLOCK:
-                # 応答自体がない場合
-                results_text.controls.append(ft.Text(f"{port_display}: {DISPLAY_STATUS_NO_RESPONSE} (コード: {result})", color="orange"))
-
+    # ポート番号の表示用文字列（サービス名付き）
+    def format_port(port):
+        # ポート番号に対応するサービス名を取得
+        service_info = PORT_SERVICES.get(str(port))
+        # service_infoがNoneでない(辞書である)ことをチェック
+        if service_info:
+            name = service_info.get("name", "")
+            protocol_info = service_info.get("protocol") or "TCP"
+            return f"{port} ({name}, {protocol_info})" if name else f"{port} (不明, {protocol_info})"
+        return f"{port}"
+
+
+    # スキャン結果1件の表示 (scan_ports の on_result、エンジンのスレッドから呼ばれる)
+    def handle_result(res):
+        status = res['status']
+        port_display = format_port(res['port'])
+
+        # ポートがオープンしている場合
+        if status == 'open':
+            open_ports_info.append((res['port'], f"{port_display}: {DISPLAY_STATUS_OPEN}"))
+        # 接続が拒否された場合
+        elif status == 'closed':
+            ui_updater.add_control(results_text.controls, ft.Text(f"{port_display}: {DISPLAY_STATUS_CONNECTION_REFUSED}", color="orange"))
         # ホスト名解決エラー
-        except socket.gaierror:
-            results_text.controls.append(ft.Text(f"{DISPLAY_STATUS_HOST_ERROR}: '{target_ip}' (ポート: {port_display})", color="red"))
-            return False
-
-        # タイムアウトした場合
-        except socket.timeout:
-            results_text.controls.append(ft.Text(f"{port_display}: {DISPLAY_STATUS_TIMEOUT}", color="orange"))
-
+        elif status.startswith('invalid_ip'):
+            ui_updater.add_control(results_text.controls, ft.Text(f"{DISPLAY_STATUS_HOST_ERROR}: '{target_input.value}'", color="red"))
+        # 応答自体がない場合（タイムアウト・到達不能）
+        elif status == 'filtered':
+            ui_updater.add_control(results_text.controls, ft.Text(f"{port_display}: {DISPLAY_STATUS_NO_RESPONSE}", color="orange"))
         # その他のエラー
-        except Exception as e:
-            results_text.controls.append(ft.Text(f"{port_display}: {DISPLAY_STATUS_ERROR} - {e}", color="orange"))
-
-        # ソケットのクローズ
-        finally:
-            if sock:
-                sock.close()
-
-        # スキャン試行完了(オープンとは限らない)
-        return True 
+        else:
+            ui_updater.add_control(results_text.controls, ft.Text(f"{port_display}: {DISPLAY_STATUS_ERROR} - {status}", color="orange"))
 
 
     # スキャン開始時の処理
@@ -184,13 +131,19 @@ def main(page: ft.Page):
             page.update()
             return # 存在しない場合は終了
         
-        # スレッドプールを使用してスキャンロジックを並列実行
+        # scan_logic の connect エンジンでスキャンを実行
         def scan_worker():
-            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                futures = {executor.submit(scan_port, target_ip, port): port for port in ports_to_scan}
-
-                for future in as_completed(futures): # 完了したスキャン結果を待機
-                    future.result() # 結果を取得した状態を保持
+            ui_updater.start()
+            scan_logic.scan_ports(
+                target_ip=target_ip,
+                tcp_ports=ports_to_scan,
+                tcp_timeout=SOCKET_TIMEOUT,
+                tcp_engine=SCAN_ENGINE,
+                on_result=handle_result,
+            )
+
+            # タイマーを止めて残りの結果を反映
+            ui_updater.stop()
 
             # ポート番号順にソートして結果を表示
             for port, msg in sorted(open_ports_info):
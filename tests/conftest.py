@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+'''テスト共通の設定 リポジトリのルートを import パスとカレントディレクトリにする（data/ の相対パスのため）'''
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture(autouse=True)
+def _repo_root_cwd(monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
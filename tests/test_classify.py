@@ -0,0 +1,144 @@
+import pytest
+
+from services import fast_parse, replay, scan_logic
+from services.replay import REPLAY_PORT, REPLAY_TARGET, MULTI_PROBE_CASES, SYNTHETIC_CASES
+
+'''応答の分類（_classify_tcp_reply / _classify_udp_reply / 高速パーサー）と、偽の sr1 / sr によるスキャン経路'''
+
+
+FULL_PROBES = scan_logic.FullMultiProbeEngine.probes
+# 応答のあるケース（高速パーサーはバイト列を受信した場合だけ使う）
+ANSWERED_CASES = [case for case in SYNTHETIC_CASES if case[2](REPLAY_TARGET, REPLAY_PORT) is not None]
+
+
+@pytest.mark.parametrize("name, protocol, make_reply, expected", SYNTHETIC_CASES, ids=[case[0] for case in SYNTHETIC_CASES])
+def test_classifier(name, protocol, make_reply, expected):
+    classify = scan_logic._classify_tcp_reply if protocol == 'tcp' else scan_logic._classify_udp_reply
+    result = classify(make_reply(REPLAY_TARGET, REPLAY_PORT), REPLAY_PORT)
+    assert result['port'] == REPLAY_PORT
+    assert result['status'] == expected
+
+
+@pytest.mark.parametrize("name, protocol, make_reply, expected", ANSWERED_CASES, ids=[case[0] for case in ANSWERED_CASES])
+def test_fast_parser_matches_scapy_classifier(name, protocol, make_reply, expected):
+    # バイト列を受信する経路（ステートレス・PACKET_FANOUT）の高速パーサーも同じ分類にする
+    status = fast_parse.tcp_status if protocol == 'tcp' else fast_parse.udp_status
+    assert status(fast_parse.parse_ipv4(bytes(make_reply(REPLAY_TARGET, REPLAY_PORT)))) == expected
+
+
+@pytest.mark.parametrize("name, protocol, make_reply, expected", SYNTHETIC_CASES, ids=[case[0] for case in SYNTHETIC_CASES])
+def test_single_probe_replay(name, protocol, make_reply, expected):
+    assert replay.replay_probe(protocol, make_reply(REPLAY_TARGET, REPLAY_PORT))['status'] == expected
+
+
+def test_answered_probe_has_rtt():
+    result = replay.replay_probe('tcp', replay.tcp_reply(REPLAY_TARGET, REPLAY_PORT, "SA"))
+    assert result['rtt'] >= 0
+
+
+@pytest.mark.parametrize("protocol", ['tcp', 'udp'])
+@pytest.mark.parametrize("cached_link", [False, True], ids=["sr", "cached-link"])
+def test_scan_many_ports(protocol, cached_link):
+    cases = [case for case in SYNTHETIC_CASES if case[1] == protocol]
+    ports = {REPLAY_PORT + i: case for i, case in enumerate(cases)}
+    results = replay.replay_many(protocol, {port: case[2](REPLAY_TARGET, port) for port, case in ports.items()},
+                                 cached_link=cached_link)
+    assert {port: results[port]['status'] for port in ports} == {port: case[3] for port, case in ports.items()}
+
+
+@pytest.mark.parametrize("name, replies, expected_status, expected_firewall", MULTI_PROBE_CASES,
+                         ids=[case[0] for case in MULTI_PROBE_CASES])
+def test_scan_many_ports_multi(name, replies, expected_status, expected_firewall):
+    results = replay.replay_many('tcp', {REPLAY_PORT: {probe: make_reply(REPLAY_TARGET, REPLAY_PORT)
+                                                       for probe, make_reply in replies.items()}},
+                                 probes=FULL_PROBES)
+    result = results[REPLAY_PORT]
+    assert (result['status'], result['firewall']) == (expected_status, expected_firewall)
+    assert set(result['probes']) == set(FULL_PROBES)
+
+
+def test_scan_many_ports_multi_keeps_probe_types_apart():
+    # 同じポートへの SYN と ACK の応答を取り違えない（SYN-ACK は SYN に、RST は ACK に対応）
+    results = replay.replay_many('tcp', {REPLAY_PORT: {
+        'syn': replay.tcp_reply(REPLAY_TARGET, REPLAY_PORT, "SA"),
+        'ack': replay.tcp_reply(REPLAY_TARGET, REPLAY_PORT, "R"),
+    }}, probes=scan_logic.MultiProbeEngine.probes)
+    result = results[REPLAY_PORT]
+    assert result['status'] == 'open'
+    assert result['probes'] == {'syn': 'open', 'ack': 'rst'}
+    assert result['firewall'] == scan_logic.FIREWALL_NONE
+
+
+@pytest.mark.parametrize("status, kinds, expected_status, expected_firewall", [
+    ('closed', {'syn': 'rst', 'ack': 'rst'}, 'closed', scan_logic.FIREWALL_NONE),
+    ('open', {'syn': 'other', 'ack': None}, 'open', scan_logic.FIREWALL_STATEFUL),
+    ('filtered', {'syn': None, 'ack': 'rst'}, 'filtered', scan_logic.FIREWALL_STATELESS),
+    ('filtered', {'syn': None, 'ack': 'rst', 'fin': 'rst', 'null': None}, 'closed', scan_logic.FIREWALL_STATELESS),
+    ('filtered', {'syn': None, 'ack': None, 'fin': None, 'null': None}, 'filtered', scan_logic.FIREWALL_BLOCKING),
+    ('filtered', {'syn': 'icmp', 'ack': None}, 'filtered', scan_logic.FIREWALL_REJECTING),
+    ('filtered', {'syn': None, 'ack': 'icmp'}, 'filtered', scan_logic.FIREWALL_REJECTING),
+])
+def test_firewall_verdict(status, kinds, expected_status, expected_firewall):
+    result = scan_logic._firewall_verdict({'port': REPLAY_PORT, 'status': status}, kinds)
+    assert result['status'] == expected_status
+    assert result['firewall'] == expected_firewall
+    assert result['verdict'].startswith(f"{expected_status}, ")
+    # 'probes' の SYN は分類結果、その他は応答の種類
+    assert result['probes'][scan_logic.PROBE_SYN] == status
+    assert {probe: kind for probe, kind in result['probes'].items() if probe != scan_logic.PROBE_SYN} == \
+        {probe: kind for probe, kind in kinds.items() if probe != scan_logic.PROBE_SYN}
+
+
+def test_self_check_passes():
+    assert replay.self_check() == []
+
+
+class _LosingResponder(replay.ReplayResponder):
+    """最初の sr で ACK への応答を落とす（パケットロス）"""
+
+    def sr(self, packets, *args, **kwargs):
+        answered, unanswered = super().sr(packets, *args, **kwargs)
+        if self.calls == 1:
+            lost = [(probe, reply) for probe, reply in answered if replay._probe_kind(probe) == scan_logic.PROBE_ACK]
+            answered = [pair for pair in answered if pair not in lost]
+            unanswered += [probe for probe, _ in lost]
+        return answered, unanswered
+
+
+def _run_multi(responder, ports):
+    with responder.patch():
+        results = scan_logic._scan_many_ports_multi(REPLAY_TARGET, ports, replay.REPLAY_TIMEOUT,
+                                                    scan_logic.MultiProbeEngine.probes)
+    return {result['port']: result for result in results}
+
+
+def test_lost_ack_is_reprobed_before_stateful_verdict():
+    responder = _LosingResponder()
+    responder.add(replay.tcp_reply(REPLAY_TARGET, REPLAY_PORT, "SA"), scan_logic.PROBE_SYN)
+    responder.add(replay.tcp_reply(REPLAY_TARGET, REPLAY_PORT, "R"), scan_logic.PROBE_ACK)
+    result = _run_multi(responder, [REPLAY_PORT])[REPLAY_PORT]
+    assert responder.calls == 2
+    assert result['firewall'] == scan_logic.FIREWALL_NONE
+    assert result['probes'] == {'syn': 'open', 'ack': 'rst'}
+
+
+def test_ack_reprobe_only_for_answered_syn_without_ack():
+    responder = replay.ReplayResponder()
+    # REPLAY_PORT: SYN だけ応答（ステートフル） +1: SYN も ACK も応答 +2: 無応答
+    responder.add(replay.tcp_reply(REPLAY_TARGET, REPLAY_PORT, "SA"), scan_logic.PROBE_SYN)
+    responder.add(replay.tcp_reply(REPLAY_TARGET, REPLAY_PORT + 1, "RA"), scan_logic.PROBE_SYN)
+    responder.add(replay.tcp_reply(REPLAY_TARGET, REPLAY_PORT + 1, "R"), scan_logic.PROBE_ACK)
+    sent = []
+    sr = responder.sr
+
+    def recording_sr(packets, *args, **kwargs):
+        sent.append(sorted(packet[scan_logic.TCP].dport for packet in packets))
+        return sr(packets, *args, **kwargs)
+
+    responder.sr = recording_sr
+    results = _run_multi(responder, [REPLAY_PORT, REPLAY_PORT + 1, REPLAY_PORT + 2])
+    # 2回目は ACK 1つだけ
+    assert sent[1:] == [[REPLAY_PORT]]
+    assert results[REPLAY_PORT]['firewall'] == scan_logic.FIREWALL_STATEFUL
+    assert results[REPLAY_PORT + 1]['firewall'] == scan_logic.FIREWALL_NONE
+    assert results[REPLAY_PORT + 2]['firewall'] == scan_logic.FIREWALL_BLOCKING
@@ -0,0 +1,102 @@
+import time
+
+from services import distributed
+
+'''分散スキャンのコーディネータ（リースの期限切れ・再割り当て・部分結果のマージ）'''
+
+
+TARGET = "192.0.2.10"
+
+
+def _result(port: int, status: str = 'closed') -> dict:
+    return {'host': TARGET, 'port': port, 'status': status, 'type': 'tcp'}
+
+
+def _coordinator(ports, shard_size=4, **kwargs):
+    merged = []
+    shards = distributed.make_shards([TARGET], tcp_ports=ports, shard_size=shard_size)
+    return distributed.ScanCoordinator(shards, on_result=merged.append, **kwargs), merged
+
+
+def test_make_shards():
+    shards = distributed.make_shards(["10.0.0.1", "10.0.0.2"], tcp_ports=list(range(1, 6)), udp_ports=[53],
+                                     shard_size=2, stateless=True, first_id=10)
+    assert [shard['id'] for shard in shards] == list(range(10, 18))
+    assert [(shard['target'], shard['protocol'], shard['ports']) for shard in shards[:4]] == [
+        ("10.0.0.1", 'tcp', [1, 2]), ("10.0.0.1", 'tcp', [3, 4]), ("10.0.0.1", 'tcp', [5]), ("10.0.0.1", 'udp', [53]),
+    ]
+    # ステートレスは TCP のシャードだけ
+    assert {shard['protocol']: shard['stateless'] for shard in shards} == {'tcp': True, 'udp': False}
+
+
+def test_complete_merges_results_once():
+    coordinator, merged = _coordinator([1, 2])
+    shard = coordinator._lease("w1")
+    for port in shard['ports']:
+        coordinator._add_partial("w1", shard['id'], _result(port))
+    coordinator._add_partial("w1", shard['id'], _result(1))
+    coordinator._complete("w1", shard['id'])
+    assert coordinator._done.is_set()
+    assert [result['port'] for result in merged] == [1, 2]
+    assert [result['port'] for result in coordinator.results()] == [1, 2]
+
+
+def test_disconnect_requeues_only_unfinished_ports():
+    coordinator, merged = _coordinator([1, 2, 3, 4])
+    shard = coordinator._lease("w1")
+    coordinator._add_partial("w1", shard['id'], _result(1, 'open'))
+    coordinator._add_partial("w1", shard['id'], _result(2))
+
+    coordinator._requeue(worker_id="w1")
+    # 受信済みの結果はマージし、残りのポートだけ再割り当てする
+    assert [result['port'] for result in merged] == [1, 2]
+    retry = coordinator._lease("w2")
+    assert retry['id'] == shard['id']
+    assert retry['ports'] == [3, 4]
+
+    # 再割り当て後に元のワーカーから届いた結果は捨てる
+    coordinator._add_partial("w1", shard['id'], _result(3, 'open'))
+    coordinator._complete("w1", shard['id'])
+    assert not coordinator._done.is_set()
+
+    for port in retry['ports']:
+        coordinator._add_partial("w2", shard['id'], _result(port))
+    coordinator._complete("w2", shard['id'])
+    assert coordinator._done.is_set()
+    assert {result['port']: result['status'] for result in coordinator.results()} == \
+        {1: 'open', 2: 'closed', 3: 'closed', 4: 'closed'}
+
+
+def test_lease_expiry_requeues_silent_workers():
+    coordinator, _ = _coordinator([1, 2, 3, 4, 5], shard_size=3)
+    first = coordinator._lease("silent")
+    second = coordinator._lease("alive")
+    coordinator._leases[first['id']] = ("silent", time.monotonic() - distributed.LEASE_TIMEOUT - 1)
+
+    coordinator._requeue(expired_before=time.monotonic() - distributed.LEASE_TIMEOUT)
+    assert set(coordinator._leases) == {second['id']}
+    assert coordinator._lease("other")['id'] == first['id']
+
+
+def test_requeue_of_fully_answered_shard_completes_it():
+    coordinator, _ = _coordinator([1, 2])
+    shard = coordinator._lease("w1")
+    for port in shard['ports']:
+        coordinator._add_partial("w1", shard['id'], _result(port))
+    coordinator._requeue(worker_id="w1")
+    assert coordinator._done.is_set()
+    assert coordinator._lease("w2") is None
+
+
+def test_unsealed_coordinator_waits_for_added_shards():
+    coordinator, _ = _coordinator([], sealed=False)
+    coordinator._check_done_locked()
+    assert not coordinator._done.is_set()
+
+    coordinator.add_shards(distributed.make_shards([TARGET], tcp_ports=[1], first_id=coordinator.next_shard_id()))
+    coordinator.seal()
+    assert not coordinator._done.is_set()
+    shard = coordinator._lease("w1")
+    coordinator._add_partial("w1", shard['id'], _result(1))
+    coordinator._complete("w1", shard['id'])
+    assert coordinator._done.is_set()
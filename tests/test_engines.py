@@ -0,0 +1,24 @@
+from unittest import mock
+
+from services import engines, scan_logic
+
+'''スキャンエンジンの自動選択'''
+
+
+def test_multi_probe_engines_are_never_auto_selected():
+    multi = [scan_logic.MultiProbeEngine(), scan_logic.FullMultiProbeEngine(), scan_logic.SynEngine()]
+    multi[0].cost = 0.1 # コストが最も低くても選ばない
+    with mock.patch.object(engines, 'available_engines', return_value=multi):
+        assert engines.select_engine('tcp').name == scan_logic.SynEngine.name
+
+
+def test_excluded_engine_is_used_by_name():
+    assert engines.select_engine('tcp', scan_logic.MultiProbeEngine.name).name == scan_logic.MultiProbeEngine.name
+    assert not engines.get_engine(scan_logic.FullMultiProbeEngine.name).auto_select
+
+
+def test_falls_back_to_registered_auto_engine():
+    with mock.patch.object(engines, 'available_engines', return_value=[scan_logic.MultiProbeEngine()]):
+        selected = engines.select_engine('tcp')
+    assert selected.auto_select
+    assert selected.protocol == 'tcp'
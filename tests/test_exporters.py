@@ -0,0 +1,133 @@
+import csv
+import gzip
+import json
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from services.exporters import CSV_FIELDS, CsvExporter, JsonlExporter, NmapXmlExporter, open_exporter
+
+'''スキャン結果のストリーミング出力（JSON Lines / CSV / nmap XML）'''
+
+
+PORT_SERVICES = {"22": {"service_name": "ssh", "description": "Secure Shell", "protocol": "TCP"}}
+RESULTS = [
+    {'host': '10.0.0.1', 'port': 22, 'status': 'open', 'type': 'tcp'},
+    {'host': '10.0.0.1', 'port': 23, 'status': 'closed', 'type': 'tcp'},
+    {'host': '10.0.0.1', 'port': 53, 'status': 'open|filtered', 'type': 'udp'},
+    {'host': '10.0.0.2', 'port': 80, 'status': 'filtered', 'type': 'tcp'},
+]
+
+
+def test_jsonl(tmp_path):
+    path = tmp_path / "results.jsonl"
+    with JsonlExporter(str(path)) as exporter:
+        exporter.write_many(RESULTS)
+    assert [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()] == RESULTS
+
+
+def test_jsonl_gzip(tmp_path):
+    path = tmp_path / "results.jsonl.gz"
+    with open_exporter(str(path)) as exporter:
+        for result in RESULTS:
+            exporter(result)
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == RESULTS
+
+
+def test_csv(tmp_path):
+    path = tmp_path / "results.csv"
+    with CsvExporter(str(path), port_services=PORT_SERVICES) as exporter:
+        exporter.write_many(RESULTS)
+    with open(path, encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == CSV_FIELDS
+    assert rows[1] == ['10.0.0.1', '22', 'tcp', 'open', 'ssh', 'Secure Shell']
+    assert len(rows) == len(RESULTS) + 1
+
+
+@pytest.mark.parametrize("include_closed", [False, True])
+def test_nmap_xml(tmp_path, include_closed):
+    path = tmp_path / "results.xml"
+    with NmapXmlExporter(str(path), port_services=PORT_SERVICES, include_closed=include_closed) as exporter:
+        exporter.write_many(RESULTS)
+    root = ET.parse(path).getroot()
+    assert root.tag == 'nmaprun'
+
+    hosts = {host.find('address').get('addr'): host for host in root.findall('host')}
+    assert set(hosts) == {'10.0.0.1', '10.0.0.2'}
+    ports = {(port.get('protocol'), int(port.get('portid'))): port for port in hosts['10.0.0.1'].iter('port')}
+    assert ports[('tcp', 22)].find('state').get('state') == 'open'
+    assert ports[('tcp', 22)].find('service').get('name') == 'ssh'
+    assert ports[('udp', 53)].find('state').get('reason') == 'no-response'
+    if include_closed:
+        assert ports[('tcp', 23)].find('state').get('state') == 'closed'
+    else:
+        assert ('tcp', 23) not in ports
+        assert hosts['10.0.0.1'].find('ports/extraports').get('count') == '1'
+    assert root.find('runstats/hosts').get('total') == '2'
+
+
+def test_close_is_idempotent_and_stops_writes(tmp_path):
+    path = tmp_path / "results.jsonl"
+    exporter = JsonlExporter(str(path))
+    exporter.write(RESULTS[0])
+    exporter.close()
+    exporter.close()
+    exporter.write(RESULTS[1])
+    assert exporter.count == 1
+
+
+@pytest.mark.parametrize("filename, exporter_class", [
+    ("out.jsonl", JsonlExporter),
+    ("out.json", JsonlExporter),
+    ("out.csv.gz", CsvExporter),
+    ("out.XML", NmapXmlExporter),
+])
+def test_open_exporter_format_from_extension(tmp_path, filename, exporter_class):
+    with open_exporter(str(tmp_path / filename)) as exporter:
+        assert type(exporter) is exporter_class
+
+
+def test_open_exporter_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported export format"):
+        open_exporter(str(tmp_path / "out.txt"))
+
+
+def test_nmap_xml_extraports_precede_ports(tmp_path):
+    path = tmp_path / "results.xml"
+    with NmapXmlExporter(str(path)) as exporter:
+        exporter.write_many(RESULTS)
+    host = next(host for host in ET.parse(path).getroot().findall('host')
+                if host.find('address').get('addr') == '10.0.0.1')
+    # nmap の DTD: <ports> は extraports* → port* の順
+    assert [child.tag for child in host.find('ports')] == ['extraports', 'port', 'port']
+
+
+def test_nmap_xml_closed_reasons_per_protocol(tmp_path):
+    path = tmp_path / "results.xml"
+    with NmapXmlExporter(str(path)) as exporter:
+        exporter.write_many([
+            {'host': '10.0.0.1', 'port': 23, 'status': 'closed', 'type': 'tcp'},
+            {'host': '10.0.0.1', 'port': 24, 'status': 'closed', 'type': 'tcp'},
+            {'host': '10.0.0.1', 'port': 161, 'status': 'closed', 'type': 'udp'},
+        ])
+    extraports = ET.parse(path).getroot().find('host/ports/extraports')
+    assert extraports.get('count') == '3'
+    assert {reason.get('proto'): (reason.get('reason'), reason.get('count')) for reason in extraports} == {
+        'tcp': ('reset', '2'), 'udp': ('port-unreach', '1'),
+    }
+
+
+def test_nmap_xml_groups_interleaved_hosts(tmp_path):
+    path = tmp_path / "results.xml"
+    with NmapXmlExporter(str(path)) as exporter:
+        for port in (22, 80):
+            for host in ('10.0.0.1', '10.0.0.2'):
+                exporter.write({'host': host, 'port': port, 'status': 'open', 'type': 'tcp'})
+    root = ET.parse(path).getroot()
+    addresses = [host.find('address').get('addr') for host in root.findall('host')]
+    assert addresses == ['10.0.0.1', '10.0.0.2']
+    for host in root.findall('host'):
+        assert [port.get('portid') for port in host.iter('port')] == ['22', '80']
+    assert root.find('runstats/hosts').get('total') == '2'
@@ -0,0 +1,153 @@
+import os
+import socket
+import time
+
+import pytest
+from scapy.all import IP, TCP, UDP
+
+from services import fanout
+
+'''services/fanout.py の BPF フィルタと受信プロセス（ループバックで実際に送受信する）'''
+
+
+DPORT_MIN = 47200
+DPORT_MAX = 47210
+LOOPBACK = "127.0.0.1"
+RECV_WINDOW = 0.5 # 送信後に受信を待つ時間（秒）
+
+requires_packet_socket = pytest.mark.skipif(
+    not hasattr(socket, "AF_PACKET") or os.geteuid() != 0,
+    reason="AF_PACKET sockets need Linux and root",
+)
+
+
+def _filtered_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM, socket.htons(fanout.ETH_P_IP))
+    fanout.attach_bpf(sock, fanout.tcp_reply_filter(DPORT_MIN, DPORT_MAX))
+    sock.bind(("lo", fanout.ETH_P_IP))
+    sock.settimeout(0.05)
+    return sock
+
+
+def _send_raw(packet):
+    """IPヘッダごと組み立てたパケットをループバックに送る"""
+    with socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW) as sock:
+        sock.sendto(bytes(packet), (LOOPBACK, 0))
+
+
+def _receive_all(sock: socket.socket) -> list[IP]:
+    frames = []
+    deadline = time.monotonic() + RECV_WINDOW
+    while time.monotonic() < deadline:
+        try:
+            frames.append(IP(sock.recv(65535)))
+        except socket.timeout:
+            continue
+    return frames
+
+
+def test_default_receiver_count():
+    assert fanout.default_receiver_count(1) == 1
+    assert 1 <= fanout.default_receiver_count(256) <= fanout.FANOUT_RECEIVERS_MAX
+
+
+@requires_packet_socket
+def test_bpf_accepts_tcp_in_range_once():
+    sock = _filtered_socket()
+    try:
+        _send_raw(IP(dst=LOOPBACK)/TCP(sport=80, dport=DPORT_MIN + 1, flags="SA", seq=1, ack=2))
+        frames = [frame for frame in _receive_all(sock) if frame.haslayer(TCP) and frame[TCP].sport == 80]
+    finally:
+        sock.close()
+    # ループバックでは送信側の複製（PACKET_OUTGOING）も見えるが、フィルタで1つだけになる
+    assert len(frames) == 1
+    assert frames[0][TCP].dport == DPORT_MIN + 1
+
+
+@requires_packet_socket
+@pytest.mark.parametrize("packet", [
+    IP(dst=LOOPBACK)/TCP(sport=81, dport=DPORT_MIN - 1, flags="SA"),
+    IP(dst=LOOPBACK)/TCP(sport=81, dport=DPORT_MAX, flags="SA"),
+    IP(dst=LOOPBACK, frag=8, proto=6)/(b"\x00" * 20),
+    IP(dst=LOOPBACK)/UDP(sport=81, dport=DPORT_MIN + 1)/b"x",
+], ids=["below-range", "at-max", "fragment", "udp"])
+def test_bpf_rejects(packet):
+    sock = _filtered_socket()
+    try:
+        _send_raw(packet)
+        frames = _receive_all(sock)
+    finally:
+        sock.close()
+    # UDP はポート到達不能の ICMP が返る（ICMP は通す）ので、ICMP 以外が来ないことを確認する
+    assert [frame for frame in frames if not frame.haslayer("ICMP")] == []
+
+
+@requires_packet_socket
+def test_bpf_accepts_icmp():
+    sock = _filtered_socket()
+    try:
+        # 待ち受けの無い UDP ポート宛て -> カーネルが ICMP ポート到達不能を返す
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp:
+            udp.sendto(b"x", (LOOPBACK, DPORT_MIN + 1))
+        frames = _receive_all(sock)
+    finally:
+        sock.close()
+    assert frames and all(frame.haslayer("ICMP") for frame in frames)
+
+
+@requires_packet_socket
+def test_fanout_receiver_delivers_classified_results():
+    results = []
+
+    def classify(raw):
+        packet = IP(bytes(raw))
+        if not packet.haslayer(TCP):
+            return None
+        return {'host': packet.src, 'port': packet[TCP].sport, 'status': 'open', 'type': 'tcp'}
+
+    receiver = fanout.open_fanout_receiver("lo", classify, results.append, 2,
+                                           fanout.tcp_reply_filter(DPORT_MIN, DPORT_MAX))
+    assert receiver is not None
+    try:
+        for sport in (1001, 1002, 1003):
+            _send_raw(IP(dst=LOOPBACK)/TCP(sport=sport, dport=DPORT_MIN, flags="SA"))
+        time.sleep(RECV_WINDOW)
+    finally:
+        receiver.stop()
+    assert sorted(result['port'] for result in results) == [1001, 1002, 1003]
+    assert receiver.dropped == 0
+
+
+def _l2_filtered_socket(local_ip: str) -> socket.socket:
+    # link._SocketPool の L2 ソケットと同じく Ethernet ヘッダ付きで受信する
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(fanout.ETH_P_IP))
+    fanout.attach_bpf(sock, fanout.l2_reply_filter(local_ip))
+    sock.bind(("lo", fanout.ETH_P_IP))
+    sock.settimeout(0.05)
+    return sock
+
+
+@requires_packet_socket
+@pytest.mark.parametrize("packet, local_ip, accepted", [
+    (IP(dst=LOOPBACK)/TCP(sport=82, dport=DPORT_MIN, flags="SA"), LOOPBACK, True),
+    (IP(dst=LOOPBACK)/UDP(sport=82, dport=DPORT_MIN)/b"x", LOOPBACK, True),
+    (IP(dst=LOOPBACK)/TCP(sport=82, dport=DPORT_MIN, flags="SA"), "127.0.0.2", False),
+    (IP(dst=LOOPBACK, proto=47)/(b"\x00" * 8), LOOPBACK, False),
+], ids=["tcp", "udp", "other-address", "gre"])
+def test_l2_reply_filter(packet, local_ip, accepted):
+    sock = _l2_filtered_socket(local_ip)
+    try:
+        _send_raw(packet)
+        deadline = time.monotonic() + RECV_WINDOW
+        frames = []
+        while time.monotonic() < deadline:
+            try:
+                frames.append(IP(sock.recv(65535)[fanout.ETH_HEADER_LEN:]))
+            except socket.timeout:
+                continue
+    finally:
+        sock.close()
+    # カーネルが返す RST / ICMP は除き、送ったパケットそのものを数える
+    matching = [frame for frame in frames if bytes(frame.payload) == bytes(packet.payload)]
+    # 送信側の複製（PACKET_OUTGOING）は通さないので、受理される場合も1つだけ
+    assert len(matching) == (1 if accepted else 0)
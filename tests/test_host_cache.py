@@ -0,0 +1,126 @@
+import json
+from unittest import mock
+
+import pytest
+
+from services import host_cache, scan_logic
+
+'''ホストキャッシュ（スキャン結果の逐次集計、エントリの更新、ファイルへのマージ保存）'''
+
+
+HOST = "192.0.2.10"
+
+
+def _result(port: int, status: str, protocol: str = 'tcp', rtt: float | None = None) -> dict:
+    result = {'host': HOST, 'port': port, 'status': status, 'type': protocol}
+    if rtt is not None:
+        result['rtt'] = rtt
+    return result
+
+
+@pytest.fixture
+def cache():
+    return host_cache.HostCache(filepath=None)
+
+
+# --- ScanObservation ---
+def test_observation_tracks_open_ports_and_rtt():
+    observation = host_cache.ScanObservation({'open_ports': {'tcp': [22, 80]}})
+    for result in [_result(22, 'open', rtt=0.01), _result(80, 'closed', rtt=0.02), _result(443, 'filtered'),
+                   _result(53, 'error')]:
+        observation.add(result)
+
+    assert observation.open_ports == {'tcp': {22}, 'udp': set()}
+    # 前回オープンで今回 closed のポート
+    assert observation.no_longer_open == {'tcp': {80}, 'udp': set()}
+    assert observation.observed == {'tcp'}
+    assert (observation.count, observation.answered, observation.rtt_samples) == (4, 2, 2)
+    assert observation.srtt == pytest.approx(0.01 * (1 - host_cache.RTT_ALPHA) + 0.02 * host_cache.RTT_ALPHA)
+
+
+def test_observation_counts_udp_silence():
+    observation = host_cache.ScanObservation()
+    for port, status in [(53, 'closed'), (123, 'open|filtered'), (161, 'open|filtered')]:
+        observation.add(_result(port, status, 'udp'))
+    assert (observation.udp_count, observation.udp_closed, observation.udp_silent) == (3, 1, 2)
+
+
+# --- record_observation ---
+def test_partial_scan_keeps_known_open_ports_outside_range(cache):
+    cache.update(HOST, open_ports={'tcp': [22, 80, 8080], 'udp': [53]})
+    entry = cache.record_scan(HOST, [_result(80, 'closed', rtt=0.01), _result(443, 'open', rtt=0.01),
+                                     _result(8080, 'error')])
+    # 8080 はエラーのため前回の情報を保ち、UDP はスキャンしていないため変えない
+    assert entry['open_ports'] == {'tcp': [22, 443, 8080], 'udp': [53]}
+    assert entry['alive'] is True
+    assert entry['rtt'] == pytest.approx(0.01)
+
+
+def test_silent_host_is_recorded_down(cache):
+    entry = cache.record_scan(HOST, [_result(port, 'filtered') for port in (22, 80)])
+    assert entry['alive'] is False
+    assert 'rtt' not in entry
+
+
+def test_silent_scan_keeps_host_with_known_open_ports_alive(cache):
+    cache.update(HOST, alive=True, open_ports={'tcp': [22]})
+    entry = cache.record_scan(HOST, [_result(80, 'filtered')])
+    assert entry['alive'] is True
+
+
+def test_icmp_rate_limit_detection(cache):
+    results = [_result(port, 'closed', 'udp') for port in range(2)]
+    results += [_result(port, 'open|filtered', 'udp') for port in range(2, host_cache.ICMP_RATE_LIMIT_MIN_PORTS)]
+    assert cache.record_scan(HOST, results)['icmp_rate_limited'] is True
+    results = [_result(port, 'closed', 'udp') for port in range(host_cache.ICMP_RATE_LIMIT_MIN_PORTS)]
+    assert cache.record_scan(HOST, results)['icmp_rate_limited'] is False
+
+
+# --- Down hosts ---
+def test_down_host_gets_short_timeouts():
+    with mock.patch.object(scan_logic, 'get_tuned_params', return_value={'tcp_timeout': 3, 'udp_timeout': 6}):
+        tuned, _ = scan_logic._tune_for_host(HOST, {'alive': False, 'open_ports': {}})
+        assert tuned['tcp_timeout'] == scan_logic.DOWN_HOST_TIMEOUT_TCP
+        assert tuned['udp_timeout'] == scan_logic.DOWN_HOST_TIMEOUT_UDP
+        tuned, _ = scan_logic._tune_for_host(HOST, {'alive': True, 'open_ports': {}})
+        assert tuned['tcp_timeout'] == 3
+
+
+# --- Persistence ---
+def test_save_merges_with_other_writers(tmp_path):
+    path = str(tmp_path / "host_cache.json")
+    mine = host_cache.HostCache(filepath=path)
+    other = host_cache.HostCache(filepath=path)
+
+    mine.update("192.0.2.1", alive=True)
+    other.update("192.0.2.2", alive=True)
+    other.update("192.0.2.1", alive=False)
+    # 先に保存した他のプロセスのエントリを残し、同じホストは新しい方を残す
+    other.save()
+    mine.save()
+
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    assert set(data) == {"192.0.2.1", "192.0.2.2"}
+    assert data["192.0.2.1"]['alive'] is False
+
+
+def test_save_drops_deleted_and_expired_entries(tmp_path):
+    path = str(tmp_path / "host_cache.json")
+    cache = host_cache.HostCache(filepath=path, ttl=60)
+    cache.update("192.0.2.1", alive=True)
+    cache.update("192.0.2.2", alive=True)
+    cache.save()
+
+    cache.delete("192.0.2.1")
+    with mock.patch.object(host_cache.time, 'time', return_value=cache.get("192.0.2.2")['updated_at'] + 30):
+        cache.update("192.0.2.3", alive=True)
+    cache.save()
+    with open(path, encoding='utf-8') as f:
+        assert set(json.load(f)) == {"192.0.2.2", "192.0.2.3"}
+
+    reloaded = host_cache.HostCache(filepath=path, ttl=60)
+    with mock.patch.object(host_cache.time, 'time', return_value=reloaded.get("192.0.2.3")['updated_at'] + 45):
+        # 192.0.2.2 は期限切れ
+        assert reloaded.get("192.0.2.2") is None
+        assert reloaded.get("192.0.2.3") is not None
@@ -0,0 +1,110 @@
+from unittest import mock
+
+import pytest
+
+from services import link
+
+'''送信路のキャッシュ（LinkCache の有効期限・解決できなかった宛先のキャッシュ・MACアドレスの共有）'''
+
+
+IFACE = "eth0"
+GATEWAY = "192.0.2.1"
+SRC_IP = "192.0.2.100"
+SRC_MAC = "02:00:00:00:00:01"
+GATEWAY_MAC = "02:00:00:00:00:fe"
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def env():
+    """経路・ARP・時刻を差し替える（route はゲートウェイ経由、getmacbyip は macs の値を返す）"""
+    clock = _Clock()
+    macs = {GATEWAY: GATEWAY_MAC}
+    route = mock.Mock(side_effect=lambda target: (IFACE, SRC_IP, GATEWAY))
+    getmacbyip = mock.Mock(side_effect=lambda ip: macs.get(ip))
+    with mock.patch.object(link.conf.route, 'route', route), \
+            mock.patch.object(link, 'getmacbyip', getmacbyip), \
+            mock.patch.object(link, 'get_if_hwaddr', return_value=SRC_MAC), \
+            mock.patch.object(link, '_is_loopback', return_value=False), \
+            mock.patch.object(link.time, 'monotonic', clock):
+        yield mock.Mock(clock=clock, macs=macs, route=route, getmacbyip=getmacbyip)
+
+
+def test_link_is_cached_until_ttl(env):
+    cache = link.LinkCache(ttl=60)
+    resolved = cache.resolve("198.51.100.7")
+    assert resolved == link.Link(IFACE, SRC_IP, GATEWAY, SRC_MAC, GATEWAY_MAC)
+    assert resolved.layer2
+
+    env.clock.now += 59
+    assert cache.resolve("198.51.100.7") == resolved
+    assert env.route.call_count == 1
+
+    env.clock.now += 2
+    cache.resolve("198.51.100.7")
+    assert env.route.call_count == 2
+    assert env.getmacbyip.call_count == 2
+
+
+def test_targets_behind_one_gateway_share_arp(env):
+    cache = link.LinkCache()
+    for target in ("198.51.100.7", "198.51.100.8", "203.0.113.9"):
+        assert cache.resolve(target).dst_mac == GATEWAY_MAC
+    assert env.route.call_count == 3
+    env.getmacbyip.assert_called_once_with(GATEWAY)
+
+
+def test_unresolvable_next_hop_is_cached_as_none(env):
+    env.macs.clear()
+    cache = link.LinkCache(ttl=60)
+    assert cache.resolve("198.51.100.7") is None
+    # ARPに応答しない宛先を期限まで再解決しない
+    assert cache.resolve("198.51.100.7") is None
+    assert env.route.call_count == 1
+    assert env.getmacbyip.call_count == 1
+
+    env.clock.now += 61
+    env.macs[GATEWAY] = GATEWAY_MAC
+    assert cache.resolve("198.51.100.7").dst_mac == GATEWAY_MAC
+    assert env.getmacbyip.call_count == 2
+
+
+def test_on_link_target_resolves_its_own_mac(env):
+    env.route.side_effect = lambda target: (IFACE, SRC_IP, link.NO_GATEWAY)
+    env.macs["192.0.2.50"] = "02:00:00:00:00:50"
+    cache = link.LinkCache()
+    resolved = cache.resolve("192.0.2.50")
+    assert resolved.next_hop == "192.0.2.50"
+    assert resolved.dst_mac == "02:00:00:00:00:50"
+
+
+def test_loopback_uses_layer3(env):
+    cache = link.LinkCache()
+    with mock.patch.object(link, '_is_loopback', return_value=True):
+        resolved = cache.resolve("127.0.0.1")
+    assert resolved is not None and not resolved.layer2
+    env.getmacbyip.assert_not_called()
+
+
+def test_invalidate(env):
+    cache = link.LinkCache()
+    cache.resolve("198.51.100.7")
+    cache.resolve("198.51.100.8")
+
+    # 宛先ごとの破棄は MACアドレスのキャッシュを残す
+    cache.invalidate("198.51.100.7")
+    cache.resolve("198.51.100.7")
+    assert env.route.call_count == 3
+    assert env.getmacbyip.call_count == 1
+
+    cache.invalidate()
+    cache.resolve("198.51.100.8")
+    assert env.route.call_count == 4
+    assert env.getmacbyip.call_count == 2
@@ -0,0 +1,60 @@
+import pytest
+
+from utils.ports import load_port_frequencies, parse_port_range, top_ports
+
+'''ポート指定のパース（parse_port_range / top_ports）'''
+
+
+FREQUENCIES = {'tcp': {'80': 0.5, '443': 0.4, '22': 0.3, '21': 0.3}, 'udp': {'53': 0.2}}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("80", [80]),
+    ("22, 80, 443", [22, 80, 443]),
+    ("1-5", [1, 2, 3, 4, 5]),
+    ("443, 80, 80, 1-3", [1, 2, 3, 80, 443]),
+    (" 8000-8002 ,22 ", [22, 8000, 8001, 8002]),
+])
+def test_parse_port_range(text, expected):
+    assert parse_port_range(text) == expected
+
+
+def test_parse_port_range_top_n():
+    tcp_top = top_ports(10, 'tcp')
+    assert parse_port_range("top-10") == sorted(tcp_top)
+    assert parse_port_range("top10") == sorted(tcp_top)
+    assert parse_port_range("top-10, 60000-60001") == sorted(tcp_top + [60000, 60001])
+    assert parse_port_range("top-5", protocol='udp') == sorted(top_ports(5, 'udp'))
+
+
+@pytest.mark.parametrize("text", ["top", "top-", "top-abc", "top-0", "http", "1-2-3"])
+def test_parse_port_range_rejects(text):
+    with pytest.raises(ValueError):
+        parse_port_range(text)
+
+
+def test_parse_port_range_clamps_top_n_beyond_table():
+    table_size = len(load_port_frequencies()['udp'])
+    notices = []
+    # UDP の頻度データは TCP より少ない 超える N は全ポートに切り詰めてお知らせする
+    ports = parse_port_range(f"top-{table_size + 10}", protocol='udp', notices=notices)
+    assert ports == sorted(top_ports(table_size, 'udp'))
+    assert len(notices) == 1 and f"only {table_size} ports" in notices[0]
+
+    notices = []
+    parse_port_range(f"top-{table_size}", protocol='udp', notices=notices)
+    assert notices == []
+
+
+def test_parse_port_range_prints_notice_by_default(capsys):
+    parse_port_range("top-100000")
+    assert "frequency table has only" in capsys.readouterr().out
+
+
+def test_top_ports_order():
+    # 頻度の降順、同じ頻度はポート番号順
+    assert top_ports(4, 'tcp', FREQUENCIES) == [80, 443, 21, 22]
+    assert top_ports(1, 'udp', FREQUENCIES) == [53]
+    assert top_ports(5, 'tcp', FREQUENCIES) == [80, 443, 21, 22]
+    with pytest.raises(ValueError):
+        top_ports(0, 'tcp', FREQUENCIES)
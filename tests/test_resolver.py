@@ -0,0 +1,108 @@
+import asyncio
+import socket
+import threading
+from unittest import mock
+
+import pytest
+
+from services import resolver
+
+'''名前解決のTTLキャッシュ（DnsCache）と解決失敗時の扱い'''
+
+
+NAME = "scan-target.example"
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    resolver.FORWARD_CACHE.clear()
+    resolver.REVERSE_CACHE.clear()
+    yield
+    resolver.FORWARD_CACHE.clear()
+    resolver.REVERSE_CACHE.clear()
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _resolve(name: str = NAME) -> list[str]:
+    return asyncio.run(resolver.resolve_host_async(name))
+
+
+def test_cache_expires_after_ttl():
+    clock = _Clock()
+    cache = resolver.DnsCache()
+    with mock.patch.object(resolver.time, 'monotonic', clock):
+        cache.put(NAME, ["192.0.2.1"], ttl=60)
+        clock.now += 59
+        assert cache.get(NAME) == ["192.0.2.1"]
+        clock.now += 2
+        assert cache.get(NAME) is None
+
+
+def test_answer_is_cached_with_record_ttl():
+    clock = _Clock()
+    query = mock.AsyncMock(return_value=(["2001:db8::1", "192.0.2.1"], 120))
+    with mock.patch.object(resolver, 'HAS_DNSPYTHON', False), \
+            mock.patch.object(resolver, '_query_getaddrinfo', query), \
+            mock.patch.object(resolver.time, 'monotonic', clock):
+        # IPv4 を先頭にする
+        assert _resolve() == ["192.0.2.1", "2001:db8::1"]
+        clock.now += 119
+        _resolve()
+        assert query.await_count == 1
+        clock.now += 2
+        _resolve()
+        assert query.await_count == 2
+
+
+def test_failure_is_cached_briefly():
+    clock = _Clock()
+    query = mock.AsyncMock(side_effect=socket.gaierror("Name or service not known"))
+    with mock.patch.object(resolver, 'HAS_DNSPYTHON', False), \
+            mock.patch.object(resolver, '_query_getaddrinfo', query), \
+            mock.patch.object(resolver.time, 'monotonic', clock):
+        assert _resolve() == []
+        assert _resolve() == []
+        assert query.await_count == 1
+        clock.now += resolver.NEGATIVE_DNS_TTL + 1
+        _resolve()
+        assert query.await_count == 2
+
+
+def test_one_record_type_failing_keeps_the_other():
+    dns_exception = pytest.importorskip("dns.exception")
+    pytest.importorskip("dns.asyncresolver")
+
+    class Answer(list):
+        rrset = mock.Mock(ttl=90)
+
+    async def resolve(name, rdtype):
+        if rdtype == "AAAA":
+            raise dns_exception.Timeout()
+        return Answer([mock.Mock(address="192.0.2.1")])
+
+    with mock.patch.object(resolver, 'HAS_DNSPYTHON', True), \
+            mock.patch("dns.asyncresolver.Resolver") as resolver_class:
+        resolver_class.return_value.resolve = resolve
+        assert _resolve() == ["192.0.2.1"]
+
+
+def test_resolve_in_background_reports_each_name_then_completes():
+    resolved = {}
+    done = threading.Event()
+
+    async def resolve_host(name):
+        return ["192.0.2.1"] if name == NAME else []
+
+    with mock.patch.object(resolver, 'resolve_host_async', resolve_host):
+        thread = resolver.resolve_in_background([NAME, "missing.example"], resolved.__setitem__,
+                                                on_complete=done.set)
+        thread.join(5)
+    assert done.is_set()
+    assert resolved == {NAME: ["192.0.2.1"], "missing.example": []}
@@ -0,0 +1,144 @@
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from services import scan_logic, scan_service
+from services.scan_client import ScanServiceClient
+from services.scan_service import JOB_FINISHED_STATES, JOB_STATE_COMPLETED, ScanService
+
+'''スキャンジョブサービス（終了済みジョブの破棄、結果の保持とストリームの offset）'''
+
+
+@pytest.fixture
+def instant_scan(monkeypatch):
+    """scan_ports を即座に完了する偽物に差し替える"""
+    def scan_ports(target_ip, tcp_ports=None, udp_ports=None, on_result=None, **kwargs):
+        for port in tcp_ports or []:
+            on_result({'host': target_ip, 'port': port, 'status': 'closed', 'type': 'tcp'})
+    monkeypatch.setattr(scan_logic, 'scan_ports', scan_ports)
+
+
+def _wait_finished(jobs, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not all(job.state in JOB_FINISHED_STATES for job in jobs):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_max_finished_jobs(instant_scan):
+    service = ScanService(max_pps=0, max_concurrent_jobs=1, max_finished_jobs=3)
+    jobs = [service.submit("10.0.0.1", tcp_ports=[80]) for _ in range(6)]
+    _wait_finished(jobs)
+    service._evict_finished()
+    kept = service.list_jobs()
+    # 新しい順に3件だけ残る
+    assert [job.id for job in kept] == [job.id for job in jobs[-3:]]
+    assert all(job.state == JOB_STATE_COMPLETED for job in kept)
+
+
+def test_job_ttl(instant_scan):
+    service = ScanService(max_pps=0, job_ttl=60)
+    old, recent = service.submit("10.0.0.1", tcp_ports=[80]), service.submit("10.0.0.2", tcp_ports=[80])
+    _wait_finished([old, recent])
+    old.finished -= 120
+    service._evict_finished()
+    assert [job.id for job in service.list_jobs()] == [recent.id]
+
+
+def test_unfinished_jobs_are_kept(instant_scan):
+    service = ScanService(max_pps=0, max_finished_jobs=0)
+    job = scan_service.ScanJob("10.0.0.1", [80], None)
+    service.jobs[job.id] = job
+    service._evict_finished()
+    assert service.jobs == {job.id: job}
+
+
+def _closed(port: int) -> dict:
+    return {'host': "10.0.0.1", 'port': port, 'status': 'closed', 'type': 'tcp', 'rtt': 0.001}
+
+
+def test_job_compacts_plain_results():
+    job = scan_service.ScanJob("10.0.0.1", list(range(1, 101)), None)
+    for port in range(1, 100):
+        job.add_result(_closed(port))
+    job.add_result({'host': "10.0.0.1", 'port': 100, 'status': 'open', 'type': 'tcp'})
+    job.add_result({'host': "10.0.0.1", 'port': 101, 'status': 'filtered', 'type': 'tcp', 'firewall': 'stateful'})
+    # 付加情報の無い closed はポート番号だけ、それ以外は dict のまま
+    assert [result['port'] for result in job.results] == [100, 101]
+    assert job.status_counts() == {'tcp/closed': 99}
+    assert job.summary()['result_count'] == 101
+
+
+def test_stream_offset_within_buffer():
+    job = scan_service.ScanJob("10.0.0.1", list(range(1, 11)), None)
+    for port in range(1, 11):
+        job.add_result(_closed(port))
+    job.set_state(JOB_STATE_COMPLETED)
+    assert [result['port'] for result in job.iter_results(offset=7)] == [8, 9, 10]
+    assert [result['port'] for result in job.iter_results()] == list(range(1, 11))
+
+
+def test_stream_offset_older_than_buffer_replays_retained(monkeypatch):
+    monkeypatch.setattr(scan_service, 'STREAM_BUFFER_SIZE', 4)
+    job = scan_service.ScanJob("10.0.0.1", list(range(1, 11)), None)
+    for port in range(1, 10):
+        job.add_result(_closed(port))
+    job.add_result({'host': "10.0.0.1", 'port': 10, 'status': 'open', 'type': 'tcp'})
+    job.set_state(JOB_STATE_COMPLETED)
+    results = list(job.iter_results(offset=0))
+    assert sorted(result['port'] for result in results) == list(range(1, 11))
+    assert {result['port']: result['status'] for result in results}[10] == 'open'
+
+
+def test_slow_stream_reports_dropped_results(monkeypatch):
+    monkeypatch.setattr(scan_service, 'STREAM_BUFFER_SIZE', 4)
+    job = scan_service.ScanJob("10.0.0.1", list(range(1, 21)), None)
+    job.add_result(_closed(1))
+    stream = job.iter_results()
+    assert next(stream)['port'] == 1
+    # 読み出しが止まっている間に 10 件届き、バッファ（4件）から 6 件がこぼれる
+    for port in range(2, 12):
+        job.add_result(_closed(port))
+    job.set_state(JOB_STATE_COMPLETED)
+    rest = list(stream)
+    assert rest[0] == {'event': 'dropped', 'count': 6}
+    assert [result['port'] for result in rest[1:]] == [8, 9, 10, 11]
+
+
+def test_http_stream_with_offset(instant_scan):
+    service = ScanService(max_pps=0)
+    service.serve("127.0.0.1", 0, background=True)
+    try:
+        client = ScanServiceClient(f"http://127.0.0.1:{service._server.server_address[1]}")
+        job = client.submit("10.0.0.1", tcp_ports=[21, 22, 23])
+        events = list(client.stream(job['id'], offset=1))
+        assert [event['port'] for event in events if event['event'] == 'result'] == [22, 23]
+        assert events[-1]['event'] == 'done'
+        detail = client.get_job(job['id'])
+        assert detail['results'] == [] and detail['status_counts'] == {'tcp/closed': 3}
+    finally:
+        service.shutdown()
+
+
+@pytest.mark.parametrize("body", [b"[]", b'"x"', b"1", b"null", b"{}", b'{"target": "10.0.0.1"}', b"not json"])
+def test_post_rejects_invalid_body(body):
+    service = ScanService(max_pps=0)
+    service.serve("127.0.0.1", 0, background=True)
+    try:
+        request = urllib.request.Request(f"http://127.0.0.1:{service._server.server_address[1]}/jobs",
+                                         data=body, method="POST")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request, timeout=5)
+        assert error.value.code == 400
+    finally:
+        service.shutdown()
+
+
+def test_parse_job_request_clamps_top_n_with_notice():
+    notices = []
+    request = scan_service._parse_job_request({'target': "10.0.0.1", 'ports': "top-100000", 'profile': 'udp'},
+                                              notices)
+    assert request['tcp_ports'] is None and request['udp_ports']
+    assert len(notices) == 1 and notices[0].startswith("top-100000")
@@ -0,0 +1,175 @@
+import threading
+import time
+
+import pytest
+
+from services import scan_logic
+from services.engines import ScanEngine
+from services.rate_limit import TokenBucket
+
+'''プローブの並列実行（_iter_scan_tasks の投入窓・キャンセル、チャンクの大きさ）'''
+
+
+TARGET = "192.0.2.10"
+
+
+class _Engine(ScanEngine):
+    """スレッドで実行する偽のエンジン（probe は delay 秒かかる）"""
+    name = "fake"
+    executor = "thread"
+    max_workers = 2
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.probed = []
+        self.lock = threading.Lock()
+
+    def probe(self, target_ip: str, port: int, timeout: float) -> dict:
+        time.sleep(self.delay)
+        with self.lock:
+            self.probed.append(port)
+        return {'port': port, 'status': 'closed'}
+
+
+class _ChunkedEngine(_Engine):
+    """ポートをまとめて受け取る偽のエンジン（受け取ったチャンクの大きさを記録する）"""
+    chunked = True
+    packets_per_port = 2
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__(delay)
+        self.chunks = []
+
+    def probe_many(self, target_ip: str, ports: list[int], timeout: float) -> list[dict]:
+        with self.lock:
+            self.chunks.append(len(ports))
+        return super().probe_many(target_ip, ports, timeout)
+
+
+class _Ports:
+    """取り出したポート数を数えるジェネレータ"""
+
+    def __init__(self, count: int):
+        self.count = count
+        self.pulled = 0
+
+    def __iter__(self):
+        for port in range(1, self.count + 1):
+            self.pulled += 1
+            yield port
+
+
+def test_window_bounds_ports_taken_ahead_of_consumer():
+    ports = _Ports(10000)
+    window = 4
+    results = scan_logic._iter_scan_tasks(_Engine(), TARGET, ports, 1, max_workers=2, window=window)
+    consumed = 0
+    for _ in range(50):
+        next(results)
+        consumed += 1
+        # 取り出したポートは、返した結果と投入済み（最大 window 個）の分だけ
+        assert ports.pulled - consumed <= window
+    results.close()
+    # 閉じた後は次のポートを取り出さない
+    pulled = ports.pulled
+    assert pulled <= consumed + window
+    time.sleep(0.05)
+    assert ports.pulled == pulled
+
+
+def test_default_window_scales_with_workers():
+    ports = _Ports(10000)
+    results = scan_logic._iter_scan_tasks(_Engine(), TARGET, ports, 1, max_workers=3)
+    next(results)
+    assert ports.pulled <= 1 + 3 * scan_logic.IN_FLIGHT_PER_WORKER
+    results.close()
+
+
+def test_all_ports_are_returned_once():
+    results = list(scan_logic._iter_scan_tasks(_Engine(), TARGET, range(1, 101), 1, max_workers=4, window=8))
+    assert sorted(result['port'] for result in results) == list(range(1, 101))
+
+
+def test_cancel_stops_submitting_and_finishes():
+    cancel_event = threading.Event()
+    ports = _Ports(1000)
+    engine = _Engine(delay=0.01)
+    results = []
+    for result in scan_logic._iter_scan_tasks(engine, TARGET, ports, 1, cancel_event=cancel_event,
+                                              max_workers=2, window=4):
+        results.append(result)
+        if len(results) == 10:
+            cancel_event.set()
+
+    # 実行中だったプローブの結果まで返し、以降は投入しない
+    assert 10 <= len(results) <= 10 + 4
+    assert ports.pulled <= 10 + 4
+    assert len(engine.probed) == len(results)
+
+
+def test_cancel_while_waiting_for_rate_tokens():
+    cancel_event = threading.Event()
+    # 1秒に1パケット 2ポート目以降はトークン待ちになる
+    rate_limiter = TokenBucket(1)
+    threading.Timer(0.2, cancel_event.set).start()
+    started = time.monotonic()
+    results = list(scan_logic._iter_scan_tasks(_Engine(), TARGET, range(1, 100), 1, rate_limiter=rate_limiter,
+                                               cancel_event=cancel_event, max_workers=2, window=4))
+    assert time.monotonic() - started < 1
+    assert [result['port'] for result in results] == [1]
+
+
+def test_executor_error_is_reported_per_port():
+    class Failing(_Engine):
+        def probe(self, target_ip, port, timeout):
+            raise RuntimeError("boom")
+
+    results = list(scan_logic._iter_scan_tasks(Failing(), TARGET, [1, 2], 1))
+    assert sorted(result['port'] for result in results) == [1, 2]
+    assert all(result['status'] == 'executor_error: boom' for result in results)
+
+
+# --- _ChunkSizer ---
+def test_chunk_sizer_starts_small():
+    sizer = scan_logic._ChunkSizer(ipc_cost=0.001)
+    assert sizer.size == scan_logic.CHUNK_SIZE_MIN
+    assert sizer.per_port is None
+
+
+def test_chunk_sizer_keeps_ipc_overhead_below_ratio():
+    sizer = scan_logic._ChunkSizer(ipc_cost=0.001)
+    # ポートあたり 10ms 通信コストが5%以下になるのは 0.001 / (0.05 * 0.01) = 2 ポート以上（最小値で切り上げ）
+    sizer.observe(elapsed=0.1, port_count=10)
+    assert sizer.size == scan_logic.CHUNK_SIZE_MIN
+    # ポートあたり 0.1ms -> 200 ポート
+    sizer = scan_logic._ChunkSizer(ipc_cost=0.001)
+    sizer.observe(elapsed=0.001, port_count=10)
+    assert sizer.size == 200
+
+
+def test_chunk_sizer_smooths_and_clamps():
+    sizer = scan_logic._ChunkSizer(ipc_cost=0.001, size_limit=64)
+    sizer.observe(elapsed=0.0, port_count=4)
+    # 所要時間 0 は上限まで大きくする
+    assert sizer.size == 64
+    sizer.observe(elapsed=0.0004, port_count=1)
+    sizer.observe(elapsed=0.0, port_count=1)
+    # 移動平均 0 -> 0.0002 -> 0.0001 ポートあたり 0.1ms は 200 ポートになり、上限の 64 に収める
+    assert sizer.per_port == pytest.approx(
+        scan_logic.CHUNK_LATENCY_SMOOTHING * 0.0004 * (1 - scan_logic.CHUNK_LATENCY_SMOOTHING))
+    assert sizer.size == 64
+    # 上限は CHUNK_SIZE_MIN 〜 CHUNK_SIZE_MAX に収める
+    assert scan_logic._ChunkSizer(0.001, size_limit=1).size_limit == scan_logic.CHUNK_SIZE_MIN
+    assert scan_logic._ChunkSizer(0.001, size_limit=10 ** 6).size_limit == scan_logic.CHUNK_SIZE_MAX
+
+
+def test_chunked_dispatch_respects_rate_bucket():
+    engine = _ChunkedEngine()
+    # バケット容量 40 パケット / 1ポート2パケット -> 1チャンク最大20ポート
+    rate_limiter = TokenBucket(100000, burst=40)
+    results = list(scan_logic._iter_scan_tasks(engine, TARGET, range(1, 501), 1, rate_limiter=rate_limiter,
+                                               max_workers=2))
+    assert sorted(result['port'] for result in results) == list(range(1, 501))
+    assert engine.chunks[0] == scan_logic.CHUNK_SIZE_MIN
+    assert max(engine.chunks) <= 20
+    assert sum(engine.chunks) == 500
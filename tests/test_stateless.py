@@ -0,0 +1,121 @@
+import ipaddress
+
+import pytest
+
+from services import replay
+from services.stateless import (
+    SOURCE_PORT_BASE, SOURCE_PORT_SPAN, TargetPermutation, make_scan_key, probe_cookie, source_port_conflict,
+    validate_quoted_probe, validate_reply, _classify_stateless_raw, _classify_stateless_reply,
+)
+
+'''ステートレススキャンのプローブ識別情報（probe_cookie / validate_reply）と送信順の置換（TargetPermutation）'''
+
+
+HOST = "198.51.100.7"
+PORT = 443
+
+
+def test_probe_cookie_is_deterministic_per_key():
+    key = make_scan_key()
+    assert probe_cookie(key, HOST, PORT) == probe_cookie(key, HOST, PORT)
+    assert probe_cookie(key, HOST, PORT) != probe_cookie(make_scan_key(), HOST, PORT)
+    assert probe_cookie(key, HOST, PORT) != probe_cookie(key, HOST, PORT + 1)
+
+
+def test_probe_cookie_source_port_range():
+    key = make_scan_key()
+    for port in range(1, 2000):
+        seq, sport = probe_cookie(key, HOST, port)
+        assert 0 <= seq <= 0xFFFFFFFF
+        assert SOURCE_PORT_BASE <= sport < SOURCE_PORT_BASE + SOURCE_PORT_SPAN
+
+
+def test_validate_reply():
+    key = make_scan_key()
+    seq, sport = probe_cookie(key, HOST, PORT)
+    assert validate_reply(key, HOST, PORT, sport, seq + 1)
+    assert not validate_reply(key, HOST, PORT, sport, seq)
+    assert not validate_reply(key, HOST, PORT, sport + 1, seq + 1)
+    assert not validate_reply(key, "198.51.100.8", PORT, sport, seq + 1)
+    assert not validate_reply(make_scan_key(), HOST, PORT, sport, seq + 1)
+
+
+def test_validate_quoted_probe():
+    key = make_scan_key()
+    seq, sport = probe_cookie(key, HOST, PORT)
+    assert validate_quoted_probe(key, HOST, sport, PORT, seq)
+    assert not validate_quoted_probe(key, HOST, sport, PORT, seq + 1)
+    assert not validate_quoted_probe(key, HOST, sport + 1, PORT, seq)
+
+
+STATELESS_CASES = [(name, expected) for name, _, expected in replay._stateless_cases()[0]]
+
+
+@pytest.mark.parametrize("name, expected", STATELESS_CASES, ids=[case[0] for case in STATELESS_CASES])
+@pytest.mark.parametrize("raw", [False, True], ids=["scapy", "raw"])
+def test_stateless_classification(name, expected, raw):
+    # _stateless_cases は呼び出しごとに鍵を作るため、鍵と応答はテストごとに作る
+    cases, key = replay._stateless_cases()
+    reply = {case[0]: case[1] for case in cases}[name]
+    result = _classify_stateless_raw(memoryview(bytes(reply)), key) if raw else _classify_stateless_reply(reply, key)
+    assert (result['status'] if result else None) == expected
+
+
+@pytest.mark.parametrize("hosts, ports", [
+    (["10.0.0.1"], [80]),
+    (["10.0.0.1", "10.0.0.2", "10.0.0.3"], [22, 80, 443, 8080, 8443]),
+    ("10.1.0.0/28", list(range(1, 8))),
+    ("10.2.0.0/24", [80, 443]),
+])
+def test_permutation_is_bijective(hosts, ports):
+    permutation = TargetPermutation(hosts, ports, seed=1234)
+    host_list = [str(host) for host in ipaddress.ip_network(hosts)] if isinstance(hosts, str) else hosts
+    expected = {(host, port) for host in host_list for port in ports}
+
+    visited = list(permutation.iter_range())
+    assert len(visited) == len(permutation) == len(expected)
+    assert set(visited) == expected
+    for index, (host, port) in enumerate(visited):
+        assert permutation.index_of(host, port) == index
+        assert permutation.unpermute(permutation.permute(index)) == index
+
+
+def test_permutation_depends_on_seed():
+    ports = list(range(1, 1025))
+    first = list(TargetPermutation(["10.0.0.1"], ports, seed=1).iter_range())
+    assert first == list(TargetPermutation(["10.0.0.1"], ports, seed=1).iter_range())
+    assert first != list(TargetPermutation(["10.0.0.1"], ports, seed=2).iter_range())
+
+
+@pytest.mark.parametrize("shard_count", [1, 3, 7])
+def test_permutation_shards_partition_the_space(shard_count):
+    permutation = TargetPermutation("10.3.0.0/29", [22, 80, 443], seed=b"shard-seed-bytes")
+    visited = []
+    for shard_index in range(shard_count):
+        visited.extend(permutation.iter_range(permutation.shard(shard_index, shard_count)))
+    assert len(visited) == len(set(visited)) == len(permutation)
+
+
+def test_permutation_rejects_out_of_range_index():
+    permutation = TargetPermutation(["10.0.0.1"], [80, 443], seed=1)
+    with pytest.raises(IndexError):
+        permutation.permute(len(permutation))
+    with pytest.raises(IndexError):
+        permutation.unpermute(-1)
+
+
+@pytest.mark.parametrize("local_range, reserved, expected", [
+    ("32768\t60999", "", None),
+    ("1024\t65535", "", (SOURCE_PORT_BASE, SOURCE_PORT_BASE + SOURCE_PORT_SPAN - 1)),
+    ("1024\t65535", f"{SOURCE_PORT_BASE}-{SOURCE_PORT_BASE + SOURCE_PORT_SPAN - 1}", None),
+    ("1024\t62000", f"22,{SOURCE_PORT_BASE}-61500", (61501, 62000)),
+    ("not a range", "", None),
+])
+def test_source_port_conflict(local_range, reserved, expected):
+    assert source_port_conflict(local_range, reserved) == expected
+
+
+def test_default_source_ports_avoid_ephemeral_range():
+    # Linux の既定の ip_local_port_range と重ならない
+    assert SOURCE_PORT_BASE > 60999
+    assert SOURCE_PORT_BASE + SOURCE_PORT_SPAN - 1 <= 65535
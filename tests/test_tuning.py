@@ -0,0 +1,115 @@
+import threading
+import time
+from unittest import mock
+
+from services import scan_logic, tuning
+
+'''自動調整（測定値からの調整値の決定、RTT・損失率の測定、キャリブレーションの実行条件）'''
+
+
+TARGET = "192.0.2.10"
+
+
+class _Engine:
+    """ポートごとの状態を返す偽のエンジン（probe は delay 秒かかる）"""
+    executor = "process"
+    packets_per_port = 1
+
+    def __init__(self, statuses: dict, rtt: float = 0.01, delay: float = 0.0):
+        self.statuses = statuses
+        self.rtt = rtt
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def probe(self, target_ip: str, port: int, timeout: float) -> dict:
+        with self.lock:
+            self.calls.append(port)
+        time.sleep(self.delay)
+        status = self.statuses[port]
+        if callable(status):
+            status = status()
+        if status in ('open', 'closed'):
+            return {'port': port, 'status': status, 'rtt': self.rtt}
+        return {'port': port, 'status': status}
+
+
+# --- choose_params ---
+def test_choose_params_from_rtt():
+    params = tuning.choose_params(cpu_count=4, craft_pps=2000, rtts=[0.01, 0.02, 0.03], loss=0.0, engine=_Engine({}))
+    # タイムアウトは最大RTTの倍数、レートは生成速度の半分
+    assert params['max_pps'] == 1000
+    assert params['tcp_timeout'] == round(tuning.timeouts_for_rtt(0.03 * tuning.TIMEOUT_RTT_MULTIPLIER)[0], 2)
+    # 同時実行数 レート × 中央値RTT（20並列）をCPU数で制限
+    assert params['tcp_workers'] == min(20, tuning.PROCESS_WORKERS_LIMIT, 4 * 2)
+    assert params['udp_workers'] == max(tuning.MIN_WORKERS, params['tcp_workers'] // 2)
+
+
+def test_choose_params_without_replies_uses_default_timeouts():
+    params = tuning.choose_params(cpu_count=4, craft_pps=2000, rtts=[], loss=None, engine=_Engine({}))
+    assert params['tcp_timeout'] == round(tuning.MAX_TIMEOUT_TCP / 2, 2)
+    assert params['udp_timeout'] <= tuning.MAX_TIMEOUT_UDP
+    assert params['max_pps'] == 1000
+
+
+def test_choose_params_lowers_rate_on_loss():
+    lossy = tuning.choose_params(cpu_count=4, craft_pps=2000, rtts=[0.01], loss=0.5, engine=_Engine({}))
+    assert lossy['max_pps'] == 500
+    tiny = tuning.choose_params(cpu_count=4, craft_pps=1, rtts=[0.01], loss=0.9, engine=_Engine({}))
+    assert tiny['max_pps'] == tuning.MIN_PPS
+
+
+def test_choose_params_thread_engine_limit():
+    engine = _Engine({})
+    engine.executor = "thread"
+    params = tuning.choose_params(cpu_count=1, craft_pps=100000, rtts=[1.0], loss=0.0, engine=engine)
+    assert params['tcp_workers'] == tuning.THREAD_WORKERS_LIMIT
+
+
+# --- _measure_rtt ---
+def test_measure_rtt_uses_packet_rtt_and_probes_in_parallel():
+    engine = _Engine({80: 'open', 443: 'closed', 22: 'filtered'}, rtt=0.004, delay=0.2)
+    started = time.monotonic()
+    rtts, loss = tuning._measure_rtt(TARGET, engine, [80, 443, 22], timeout=0.2, rounds=2, budget=5)
+    elapsed = time.monotonic() - started
+
+    # プローブ所要時間（delay）ではなくエンジンが返したパケットのRTTを使う
+    assert rtts == [0.004] * 4
+    assert loss == 0.0
+    # 2回目は応答したポートだけ再プローブする
+    assert sorted(engine.calls) == [22, 80, 80, 443, 443]
+    # 各回は並列（逐次なら 5 × 0.2 秒）
+    assert elapsed < 0.8
+
+
+def test_measure_rtt_counts_loss_on_reprobe():
+    replies = iter(['open', 'filtered', 'open'])
+    engine = _Engine({80: lambda: next(replies)})
+    rtts, loss = tuning._measure_rtt(TARGET, engine, [80], timeout=0.1, rounds=3, budget=5)
+    assert len(rtts) == 2
+    assert loss == 0.5
+
+
+def test_measure_rtt_stops_at_budget():
+    engine = _Engine({80: 'open'}, delay=0.1)
+    rtts, loss = tuning._measure_rtt(TARGET, engine, [80], timeout=1, rounds=3, budget=0.5)
+    # 次の回が上限に収まらないため1回目だけで打ち切る（損失率は不明）
+    assert engine.calls == [80]
+    assert loss is None
+
+
+def test_measure_rtt_without_replies():
+    engine = _Engine({80: 'filtered', 443: 'filtered'})
+    assert tuning._measure_rtt(TARGET, engine, [80, 443], timeout=0.1) == ([], None)
+    assert len(engine.calls) == 2
+
+
+# --- Calibration opt-in ---
+def test_scan_does_not_calibrate_unless_requested():
+    with mock.patch.object(scan_logic, 'get_tuned_params', return_value=None), \
+            mock.patch.object(scan_logic, 'calibrate', return_value={'tcp_timeout': 0.3}) as calibrate:
+        scan_logic.tune_for_host(TARGET, use_host_cache=False)
+        calibrate.assert_not_called()
+        tuned = scan_logic.tune_for_host(TARGET, use_host_cache=False, calibrate_untuned=True)
+        calibrate.assert_called_once()
+    assert tuned['tcp_timeout'] == 0.3
@@ -0,0 +1,71 @@
+from unittest import mock
+
+from services import scan_logic, watch
+
+'''継続監視（PortWatcher）の開始時の準備、変化検出、実行ループ'''
+
+
+ADDRESS = "192.0.2.10"
+TUNED = {'tcp_timeout': 0.5, 'udp_timeout': 1.0, 'tcp_workers': 4, 'max_pps': 100}
+
+
+def _fake_scan(statuses: dict):
+    """statuses[port] の状態を返す偽の scan_ports"""
+    def scan_ports(target_ip, tcp_ports=None, udp_ports=None, **kwargs):
+        return [{'host': target_ip, 'port': port, 'status': statuses[port], 'type': 'tcp'} for port in tcp_ports or []]
+    return mock.Mock(side_effect=scan_ports)
+
+
+def test_resolves_and_tunes_once():
+    scan = _fake_scan({22: 'open', 80: 'closed'})
+    watcher = watch.PortWatcher("watch.example", tcp_ports=[22, 80], interval=1, cycle=1)
+    with mock.patch.object(watch, 'resolve_hosts', return_value={"watch.example": [ADDRESS]}) as resolve, \
+            mock.patch.object(scan_logic, 'tune_for_host', return_value=dict(TUNED)) as tune, \
+            mock.patch.object(scan_logic, 'scan_ports', scan):
+        for _ in range(3):
+            watcher.tick()
+
+    assert resolve.call_count == 1
+    assert tune.call_count == 1
+    assert scan.call_count == 3
+    for call in scan.call_args_list:
+        assert call.args[0] == ADDRESS
+        assert call.kwargs['tuned'] == TUNED
+        assert call.kwargs['auto_tune'] is False
+        assert call.kwargs['use_host_cache'] is False
+    # 送信予算は開始時に1つだけ作り、全ての再スキャンで共有する
+    assert len({id(call.kwargs['rate_limiter']) for call in scan.call_args_list}) == 1
+
+
+def test_change_is_reported_after_confirmation():
+    statuses = {22: 'closed'}
+    events = []
+    watcher = watch.PortWatcher(ADDRESS, tcp_ports=[22], interval=1, cycle=1, on_change=events.append)
+    with mock.patch.object(scan_logic, 'tune_for_host', return_value={}), \
+            mock.patch.object(scan_logic, 'scan_ports', _fake_scan(statuses)):
+        watcher.tick()
+        statuses[22] = 'open'
+        assert watcher.tick() == []
+        watcher.tick()
+
+    assert [(event['port'], event['old'], event['new']) for event in events] == [(22, 'closed', 'open')]
+    assert events[0]['host'] == ADDRESS
+
+
+def test_run_stops_after_max_ticks():
+    scan = _fake_scan({22: 'open'})
+    watcher = watch.PortWatcher(ADDRESS, tcp_ports=[22], interval=0.01, cycle=1)
+    with mock.patch.object(scan_logic, 'tune_for_host', return_value={}), \
+            mock.patch.object(scan_logic, 'scan_ports', scan):
+        watcher.run(max_ticks=3)
+    assert watcher.stats['ticks'] == 3
+    assert scan.call_count == 3
+
+
+def test_run_keeps_going_after_a_failed_tick():
+    scan = mock.Mock(side_effect=[OSError("network is unreachable"), []])
+    watcher = watch.PortWatcher(ADDRESS, tcp_ports=[22], interval=0.01, cycle=1)
+    with mock.patch.object(scan_logic, 'tune_for_host', return_value={}), \
+            mock.patch.object(scan_logic, 'scan_ports', scan):
+        watcher.run(max_ticks=2)
+    assert scan.call_count == 2
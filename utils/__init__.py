@@ -1 +1,15 @@
-from .utils import load_port_services, parse_port_range, create_result_text_widget
+from .ports import (load_port_services, parse_port_range, lookup_service, load_port_frequencies, top_ports,
+                    order_ports_by_likelihood)
+
+# flet に依存するヘルパーは使われるときに読み込む（スキャンサービスやワーカーは flet 無しで動かす）
+_GUI_HELPERS = {
+    'create_result_text_widget': '.utils',
+    'ThrottledUpdater': '.ui_throttle',
+}
+
+
+def __getattr__(name: str):
+    if name in _GUI_HELPERS:
+        import importlib
+        return getattr(importlib.import_module(_GUI_HELPERS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
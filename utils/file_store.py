@@ -0,0 +1,60 @@
+from contextlib import contextmanager
+import json
+import os
+import tempfile
+import time
+
+'''JSON ファイルの保存ヘルパー（プロセス間で共有するファイル用）
+書き込みは同じディレクトリの一意な一時ファイルから os.replace で置き換え、
+読み込み→変更→保存は <ファイル>.lock のファイルロックで囲む（分散ワーカー・プールのプロセス・GUI の同時更新）。
+'''
+
+
+# --- Constants ---
+LOCK_SUFFIX = ".lock"
+LOCK_RETRY_INTERVAL = 0.05 # Windows でロックを再試行する間隔（秒）
+
+
+@contextmanager
+def file_lock(filepath: str):
+    """filepath に対する排他ロック（プロセス間・スレッド間） ロックは <filepath>.lock に取る"""
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with open(f"{filepath}{LOCK_SUFFIX}", 'a+b') as lock_file:
+        if os.name == "nt":
+            import msvcrt
+            while True:
+                try:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(LOCK_RETRY_INTERVAL)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def write_json_atomic(filepath: str, data):
+    """同じディレクトリの一意な一時ファイルに書き、os.replace で置き換える"""
+    directory = os.path.dirname(filepath) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(filepath)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
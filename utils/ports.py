@@ -0,0 +1,113 @@
+import functools
+import json
+
+'''ポート指定・ポート頻度・サービス定義のヘルパー
+GUI（flet）に依存しないため、スキャンサービスやワーカーなど画面を持たないモジュールからも使う。
+'''
+
+
+# --- Constants ---
+PORT_FREQUENCY_FILE_PATH = "data/port_frequency.json" # ポートがオープンである頻度（nmap-services 準拠の概算値）
+TOP_PORTS_PREFIX = "top"
+
+
+def load_port_services(filepath: str) -> dict:
+    """ 指定されたパスからポートサービス定義JSONファイルを読み込む """
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"定義ファイル '{filepath}' が見つかりません。")
+        return {}
+    except json.JSONDecodeError:
+        print(f"定義ファイル '{filepath}' の形式が正しくありません。")
+        return {}
+
+
+@functools.lru_cache(maxsize=4)
+def load_port_frequencies(filepath: str = PORT_FREQUENCY_FILE_PATH) -> dict:
+    ''' ポートのオープン頻度を読み込む {'tcp': {'80': 0.48, ...}, 'udp': {...}} '''
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"頻度ファイル '{filepath}' が見つかりません。")
+        return {}
+    except json.JSONDecodeError:
+        print(f"頻度ファイル '{filepath}' の形式が正しくありません。")
+        return {}
+
+
+def top_ports(count: int, protocol: str = 'tcp', port_frequencies: dict | None = None) -> list[int]:
+    ''' オープンである頻度の高い順に count 個のポートを返す
+    頻度データはプロトコルごとにポート数が異なる（UDPは少ない） count がそれを超える場合は頻度データの全ポートを返す
+    '''
+    frequencies = (port_frequencies if port_frequencies is not None else load_port_frequencies()).get(protocol.lower(), {})
+    if count <= 0:
+        raise ValueError(f"{TOP_PORTS_PREFIX}-N: N must be a positive integer (got {count})")
+    ranked = sorted(frequencies.items(), key=lambda item: (-item[1], int(item[0])))
+    return [int(port) for port, _ in ranked[:count]]
+
+
+def order_ports_by_likelihood(ports: list[int], protocol: str = 'tcp', port_frequencies: dict | None = None) -> list[int]:
+    ''' オープンである可能性の高いポートから順に並べ替える（頻度データに無いポートは元の順序で後ろ） '''
+    frequencies = (port_frequencies if port_frequencies is not None else load_port_frequencies()).get(protocol.lower(), {})
+    return sorted(ports, key=lambda port: -frequencies.get(str(port), 0.0))
+
+
+def parse_port_range(port_range_str: str, protocol: str = 'tcp', notices: list[str] | None = None) -> list[int]:
+    ''' ポート範囲文字列をパースしてポート番号のリストを返す
+    e.g.: "1-1024", "22, 80, 443", "top-100"（頻度上位100ポート）, "top-100, 8000-8100"
+    Args:
+        notices (list[str], optional): top-N が頻度データのポート数を超えて切り詰めた場合のお知らせを追加する
+            Noneの場合は標準出力に表示する
+    '''
+    ports = []
+    parts = port_range_str.split(',')
+    for part in parts:
+        part = part.strip()
+        # 頻度上位 N ポート（top-N / topN）
+        if part.lower().startswith(TOP_PORTS_PREFIX):
+            count_str = part[len(TOP_PORTS_PREFIX):].lstrip('- ')
+            if not count_str.isdigit():
+                raise ValueError(f"'{part}': specify the number of ports as {TOP_PORTS_PREFIX}-N (e.g. {TOP_PORTS_PREFIX}-100)")
+            top = top_ports(int(count_str), protocol)
+            if len(top) < int(count_str):
+                notice = (f"{part}: the {protocol.upper()} frequency table has only {len(top)} ports; "
+                          f"scanning those {len(top)}")
+                if notices is None:
+                    print(notice)
+                else:
+                    notices.append(notice)
+            ports.extend(top)
+        elif '-' in part:
+            start, end = map(int, part.split('-'))
+            ports.extend(range(start, end + 1))
+        else:
+            ports.append(int(part))
+    return sorted(list(set(ports)))
+
+
+
+def lookup_service(port_services_data: dict, port: int, scan_type: str) -> tuple[str, str]:
+    ''' ポート番号とスキャンタイプに対応するサービス名と詳細情報を返す
+    Returns:
+        tuple: (サービス名文字列, 詳細情報文字列) 見つからない場合は空文字列
+    '''
+    scan_type = scan_type.upper()
+    service_entry = port_services_data.get(str(port))
+    if isinstance(service_entry, list):
+        for item in service_entry:
+            # .get()を呼び出す前にitemが辞書であることを確認
+            if isinstance(item, dict):
+                protocol_from_json = item.get("protocol", "").upper()
+                # スキャンタイプが一致するか、JSON側でプロトコル指定がないか、TCP/UDP許容の場合
+                if scan_type in protocol_from_json or "TCP/UDP" in protocol_from_json or not protocol_from_json:
+                    # 一致するプロトコルが見つかった
+                    return item.get("service_name", ""), item.get("description", "")
+    elif isinstance(service_entry, dict):
+        protocol_from_json = service_entry.get("protocol", "").upper()
+        # スキャンタイプが一致するか、JSON側でプロトコル指定がないか、TCP/UDP許容の場合
+        if scan_type in protocol_from_json or "TCP/UDP" in protocol_from_json or not protocol_from_json:
+            return service_entry.get("service_name", ""), service_entry.get("description", "")
+    return "", ""
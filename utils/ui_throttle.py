@@ -0,0 +1,56 @@
+import flet as ft
+import threading
+
+
+# --- Constants ---
+UI_REFRESH_HZ = 8 # 画面更新の頻度（回/秒）
+
+
+class ThrottledUpdater:
+    """一定間隔の単一タイマーで画面を更新するヘルパー
+    ワーカースレッドは add_control() でコントロールをバッファに積むだけで、page.update() は呼ばない。
+    タイマーがバッファを反映し、on_tick（進捗表示の更新など）を呼んでから1回だけ page.update() する。
+    結果の到着速度に関わらず、UIスレッドの更新回数は UI_REFRESH_HZ 回/秒で一定。
+    """
+
+    def __init__(self, page: ft.Page, on_tick=None, refresh_hz: float = UI_REFRESH_HZ):
+        self.page = page
+        self.on_tick = on_tick
+        self.interval = 1 / refresh_hz
+        self._pending = [] # (追加先のcontrolsリスト, コントロール)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_control(self, controls: list, control: ft.Control):
+        """次のタイマー更新で controls に control を追加する（スレッドセーフ）"""
+        with self._lock:
+            self._pending.append((controls, control))
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """タイマーを止め、残りのバッファを反映して最終更新する"""
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for controls, control in pending:
+            controls.append(control)
+        if self.on_tick:
+            self.on_tick()
+        self.page.update()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._flush()
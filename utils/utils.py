@@ -1,33 +1,5 @@
 import flet as ft
-import json
-
-
-def load_port_services(filepath: str) -> dict:
-    """ 指定されたパスからポートサービス定義JSONファイルを読み込む """
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print(f"定義ファイル '{filepath}' が見つかりません。")
-        return {}
-    except json.JSONDecodeError:
-        print(f"定義ファイル '{filepath}' の形式が正しくありません。")
-        return {}
-
-
-def parse_port_range(port_range_str: str) -> list[int]:
-    ''' ポート範囲文字列をパースしてポート番号のリストを返す '''
-    ports = []
-    parts = port_range_str.split(',')
-    for part in parts:
-        part = part.strip()
-        if '-' in part:
-            start, end = map(int, part.split('-'))
-            ports.extend(range(start, end + 1))
-        else:
-            ports.append(int(part))
-    return sorted(list(set(ports)))
-
+from .ports import lookup_service
 
 
 def create_result_text_widget(res_item: dict, port_services_data: dict) -> tuple[ft.Text | None, bool, str, str]:
@@ -45,31 +17,10 @@ def create_result_text_widget(res_item: dict, port_services_data: dict) -> tuple
         return None, False, "", ""
     
     # ポート番号とスキャンタイプ
-    port_num_str = str(res_item['port'])
     scan_type = res_item.get('type', 'N/A').upper()
-    service_name_for_col = ""
-    description_for_col = ""
     
     # ポート番号がサービス定義に存在するか
-    if port_num_str in port_services_data:
-        service_entry = port_services_data.get(port_num_str)
-        if isinstance(service_entry, list):
-            for item in service_entry:
-                # .get()を呼び出す前にitemが辞書であることを確認
-                if isinstance(item, dict):
-                    protocol_from_json = item.get("protocol", "").upper()
-                    # スキャンタイプが一致するか、JSON側でプロトコル指定がないか、TCP/UDP許容の場合
-                    if scan_type in protocol_from_json or "TCP/UDP" in protocol_from_json or not protocol_from_json:
-                        service_name_for_col = item.get("service_name", "")
-                        description_for_col = item.get("description", "")
-                        # 一致するプロトコルが見つかった
-                        break
-        elif isinstance(service_entry, dict):
-            protocol_from_json = service_entry.get("protocol", "").upper()
-            # スキャンタイプが一致するか、JSON側でプロトコル指定がないか、TCP/UDP許容の場合
-            if scan_type in protocol_from_json or "TCP/UDP" in protocol_from_json or not protocol_from_json:
-                service_name_for_col = service_entry.get("service_name", "")
-                description_for_col = service_entry.get("description", "")
+    service_name_for_col, description_for_col = lookup_service(port_services_data, res_item['port'], scan_type)
     
     # 表示用テキストの成型
     display_text = f"{res_item['port']}/{res_item.get('type','n/a')} - {status}"
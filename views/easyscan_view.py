@@ -1,7 +1,10 @@
 import flet as ft
 import threading
-from services import scan_logic
-from utils import load_port_services, parse_port_range, create_result_text_widget
+from services import resolver, engines
+from services.exporters import open_exporter, EXPORT_FORMATS
+from services.scan_client import ScanServiceClient
+from services.progress import ScanProgress, format_progress
+from utils import load_port_services, parse_port_range, create_result_text_widget, ThrottledUpdater
 
 # --- Constants ---
 TARGET_IP_DEFAULT = "127.0.0.1" # localhost
@@ -17,13 +20,17 @@ SCANNING_STATUS_COMPLETED = "Completed"
 SCANNING_STATUS_VALUE_ERROR = "Value Error"
 SCANNING_STATUS_PORTS_DONT_EXIST = "Ports dont exist"
 
+# --- Export ---
+EXPORT_FILE_NAME_DEFAULT = "easyscan.xml"
+
 
 
 
 class EasyScanView(ft.Container):
-    def __init__(self, page: ft.Page):
+    def __init__(self, page: ft.Page, service_url: str):
         super().__init__()
         self.page = page
+        self.scan_client = ScanServiceClient(service_url)
         self.port_services = load_port_services(SERVICES_FILE_PATH)
 
         # --- Input Area Elements ---
@@ -41,10 +48,42 @@ class EasyScanView(ft.Container):
             expand=True
         )
 
+        # --- Engine Selector ---
+        # スキャンを実行するサービス側の権限で利用可能なエンジンを取得
+        try:
+            engine_infos = self.scan_client.list_engines()
+        except OSError:
+            engine_infos = [dict(engine.info(), available=True) for engine in engines.available_engines()]
+        self.engine_protocols = {info['name']: info['protocol'] for info in engine_infos}
+        auto_choice = ", ".join(
+            f"{protocol}: {next((i['name'] for i in engine_infos if i['protocol'] == protocol and i['available']), '-')}"
+            for protocol in ('tcp', 'udp')
+        )
+        engine_options = [ft.dropdown.Option(key=engines.ENGINE_AUTO, text=f"Auto ({auto_choice})")]
+        engine_options += [
+            ft.dropdown.Option(key=info['name'], text=f"{info['name']} - {info['description']}", disabled=not info['available'])
+            for info in engine_infos
+        ]
+        self.engine_dropdown = ft.Dropdown(
+            label="Engine",
+            options=engine_options,
+            value=engines.ENGINE_AUTO,
+            expand=True
+        )
+
         self.port_range_input = ft.TextField(label="Port Range (e.g. 1-1024)", value=f"{PORT_RANGE_DEFAULT}", expand=True)
         self.scan_button = ft.ElevatedButton(f"Scan", on_click=self.start_scan)
+        self.export_button = ft.ElevatedButton("Export", on_click=self.open_export_dialog)
+        self.export_picker = ft.FilePicker(on_result=self.on_export_path_selected)
+        self.page.overlay.append(self.export_picker)
         self.status_text = ft.Text(f"{SCANNING_STATUS_PREPARING}", size=16, color="blue")
 
+        # --- Progress Elements ---
+        self.progress_bar = ft.ProgressBar(value=0, expand=True)
+        self.progress_stats_text = ft.Text("", size=12)
+        self.scan_progress = None
+        self.ui_updater = ThrottledUpdater(page, on_tick=self.refresh_progress)
+
         # --- Output Area Elements ---
         self.scan_output_log_area = ft.Column([], expand=True, scroll="always")
 
@@ -70,7 +109,10 @@ class EasyScanView(ft.Container):
             ],
             expand=True,
         )
-        
+
+        # --- Export State ---
+        self.last_job_id = None # 直近（実行中）のスキャンジョブ 結果はスキャンサービス側が保持する
+
         self.content = self.build()
     
     # build メソッドでUIレイアウトを定義
@@ -81,7 +123,8 @@ class EasyScanView(ft.Container):
                 ft.ResponsiveRow(
                     [
                         ft.Container(content=self.target_input, padding=5, col={'xs': 12, 'sm': 6, 'md': 6}),
-                        ft.Container(content=self.profile_dropdown, padding=5, col={'xs': 12, 'sm': 6, 'md': 6}),
+                        ft.Container(content=self.profile_dropdown, padding=5, col={'xs': 12, 'sm': 3, 'md': 3}),
+                        ft.Container(content=self.engine_dropdown, padding=5, col={'xs': 12, 'sm': 3, 'md': 3}),
                     ],
                     alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
                 ),
@@ -119,11 +162,13 @@ class EasyScanView(ft.Container):
                                 [
                                     ft.Text("Status:"),
                                     self.status_text,
+                                    self.export_button,
                                 ],
                             ),
                         ],
                         alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
                     ),
+                    ft.Row([self.progress_bar, self.progress_stats_text]),
                     self.output_tabs,
                 ],
                 expand=True,
@@ -162,26 +207,33 @@ class EasyScanView(ft.Container):
 
         # パース呼び出し
         try:
-            ports_to_scan = parse_port_range(port_range_str)
+            # top-N 指定はプロトコルごとに頻度上位のポートが異なる（使わないプロトコルはパースしない）
+            # 頻度データより大きい top-N は切り詰めて、そのことを表示する
+            notices = []
+            ports_to_scan = parse_port_range(port_range_str, notices=notices) if selected_profile != "UDP Only" else []
+            udp_ports_to_scan = parse_port_range(port_range_str, protocol='udp', notices=notices) \
+                if selected_profile != "TCP Only" else []
             print(f"\n--- {selected_profile} Scan (via scan_logic) started for: {target_ip} on ports: {port_range_str} ---")
         # 不正値の場合は終了
-        except ValueError:
-            self.scan_output_log_area.controls.append(ft.Text(f"{SCANNING_STATUS_VALUE_ERROR}", color="red"))
+        except ValueError as ve:
+            self.scan_output_log_area.controls.append(ft.Text(f"{SCANNING_STATUS_VALUE_ERROR}: {ve}", color="red"))
             self.scan_button.disabled = False
             self.page.update()
             return
         # 存在しない場合は終了
-        if not ports_to_scan:
+        if not ports_to_scan and not udp_ports_to_scan:
             self.scan_output_log_area.controls.append(ft.Text(f"{SCANNING_STATUS_PORTS_DONT_EXIST}", color="red"))
             self.scan_button.disabled = False
             self.page.update()
             return
+        for notice in notices:
+            self.scan_output_log_area.controls.append(ft.Text(notice, color="orange"))
         
-        threading.Thread(target=self.scan_worker, args=(target_ip, ports_to_scan), daemon=True).start()
+        threading.Thread(target=self.scan_worker, args=(target_ip, ports_to_scan, udp_ports_to_scan), daemon=True).start()
         
     # --- Worker Function ---
     # 実行ワーカースレッド
-    def scan_worker(self, target_ip: str, ports_to_scan: list[int]):
+    def scan_worker(self, target_ip: str, ports_to_scan: list[int], udp_port_list: list[int]):
         selected_profile = self.profile_dropdown.value
         tcp_ports_to_scan = None
         udp_ports_to_scan = None
@@ -189,21 +241,53 @@ class EasyScanView(ft.Container):
         # Scan Profile
         if selected_profile == "Default (TCP & UDP)":
             tcp_ports_to_scan = ports_to_scan
-            udp_ports_to_scan = ports_to_scan
+            udp_ports_to_scan = udp_port_list
         elif selected_profile == "TCP Only":
             tcp_ports_to_scan = ports_to_scan
         elif selected_profile == "UDP Only":
-            udp_ports_to_scan = ports_to_scan
+            udp_ports_to_scan = udp_port_list
 
-        scan_results = scan_logic.scan_ports(
-            target_ip=target_ip,
-            tcp_ports=tcp_ports_to_scan,
-            udp_ports=udp_ports_to_scan
-        )
+        # Engine 選択したエンジンのプロトコルにのみ適用し、他方は自動選択
+        selected_engine = self.engine_dropdown.value
+        tcp_engine = selected_engine if self.engine_protocols.get(selected_engine) == 'tcp' else engines.ENGINE_AUTO
+        udp_engine = selected_engine if self.engine_protocols.get(selected_engine) == 'udp' else engines.ENGINE_AUTO
+
+        # スキャンサービスにジョブを投入し、結果をストリームで受信
+        # 画面に出すのは closed 以外の結果だけなので、closed は件数と応答ホストのみ保持する
+        scan_results = []
+        result_count = 0
+        responding_hosts = set()
+        self.last_job_id = None
+        self.scan_progress = ScanProgress(len(tcp_ports_to_scan or []) + len(udp_ports_to_scan or []))
+        # 画面更新はタイマーに任せる（結果ごとに page.update() しない）
+        self.ui_updater.start()
+        try:
+            job = self.scan_client.submit(target_ip, tcp_ports_to_scan, udp_ports_to_scan, submitter="gui",
+                                          tcp_engine=tcp_engine, udp_engine=udp_engine)
+            self.last_job_id = job['id']
+            for event in self.scan_client.stream(job['id']):
+                if event.get('event') == 'result':
+                    event.pop('event')
+                    self.scan_progress.advance(event)
+                    if event['status'] == 'open':
+                        self.ui_updater.add_control(
+                            self.scan_output_log_area.controls,
+                            ft.Text(f"Discovered open port {event['port']}/{event['type']} on {event['host']}", color="green"),
+                        )
+                    result_count += 1
+                    if event['status'] in ('open', 'closed') and 'host' in event:
+                        responding_hosts.add(event['host'])
+                    if event['status'] != 'closed':
+                        scan_results.append(event)
+        except OSError as e:
+            self.ui_updater.add_control(self.scan_output_log_area.controls, ft.Text(f"スキャンサービスに接続できません: {e}", color="red"))
+        finally:
+            self.ui_updater.stop()
+        scan_results.sort(key=lambda x: x['port'])
 
         open_ports_count = 0
         # スキャン結果無しの場合
-        if not scan_results:
+        if not result_count:
             self.scan_output_log_area.controls.append(ft.Text("スキャン結果がありませんでした。", color="orange"))
         # エラーの場合
         elif any(res.get('status', '').startswith('invalid_ip') for res in scan_results):
@@ -221,20 +305,26 @@ class EasyScanView(ft.Container):
             )
         # スキャン結果が存在する場合
         else:
+            # 応答のあったホストをまとめて逆引き
+            host_names = resolver.reverse_lookup_many(responding_hosts) if responding_hosts else {}
+
             for res_item in scan_results:
                 text_widget, is_open, service_name, description = create_result_text_widget(res_item, self.port_services)
-                if text_widget:
+                # オープンポートはスキャン中に "Discovered open port" として表示済みのため再表示しない
+                if text_widget and not is_open:
                     self.scan_output_log_area.controls.append(text_widget)
                 if is_open:
                     open_ports_count += 1
                 
                 if res_item['status'] != 'closed':
+                    host = res_item.get('host', target_ip)
+                    host_display = f"{host} ({host_names[host]})" if host_names.get(host) else host
                     self.ports_hosts_table.rows.append(
                         ft.DataRow(cells=[
-                            ft.DataCell(ft.Text(target_ip)),
+                            ft.DataCell(ft.Text(host_display)),
                             ft.DataCell(ft.Text(str(res_item['port']))),
                             ft.DataCell(ft.Text(res_item.get('type', 'N/A').upper())),
-                            ft.DataCell(ft.Text(res_item['status'], color=text_widget.color if text_widget else "default")),
+                            ft.DataCell(ft.Text(res_item.get('verdict', res_item['status']), color=text_widget.color if text_widget else "default")),
                             ft.DataCell(ft.Text(service_name if service_name else "N/A")),
                             ft.DataCell(ft.Text(description if description else "N/A")),
                         ])
@@ -246,3 +336,53 @@ class EasyScanView(ft.Container):
         self.status_text.value = f"{SCANNING_STATUS_COMPLETED}"
         self.scan_button.disabled = False
         self.page.update()
+
+    # --- Progress ---
+    # タイマーから呼ばれる 進捗バーと統計行を更新
+    def refresh_progress(self):
+        if self.scan_progress is None:
+            return
+        snapshot = self.scan_progress.snapshot()
+        self.progress_bar.value = snapshot['done'] / snapshot['total'] if snapshot['total'] else 0
+        self.progress_stats_text.value = format_progress(snapshot)
+
+    # --- Export ---
+    # エクスポートボタンのクリックイベントハンドラ 保存先を選択
+    def open_export_dialog(self, e):
+        self.export_picker.save_file(
+            dialog_title="Export scan results",
+            file_name=EXPORT_FILE_NAME_DEFAULT,
+            allowed_extensions=list(EXPORT_FORMATS) + ["gz"],
+        )
+
+    # 保存先の選択結果 直近のジョブの結果をスキャンサービスから先頭（offset=0）からストリームで読み出して書き込む
+    # スキャン中の場合は以降の結果もジョブの終了まで逐次書き込む（GUI側では結果を保持しない）
+    def on_export_path_selected(self, e: ft.FilePickerResultEvent):
+        if not e.path:
+            return
+        if self.last_job_id is None:
+            self.scan_output_log_area.controls.append(ft.Text("エクスポートするスキャン結果がありません。", color="orange"))
+            self.page.update()
+            return
+        try:
+            exporter = open_exporter(e.path, port_services=self.port_services)
+        except (ValueError, OSError) as ex:
+            self.scan_output_log_area.controls.append(ft.Text(f"エクスポートエラー: {ex}", color="red"))
+            self.page.update()
+            return
+        threading.Thread(target=self.export_worker, args=(self.last_job_id, exporter), daemon=True).start()
+
+    # エクスポート用ワーカースレッド
+    def export_worker(self, job_id: str, exporter):
+        try:
+            for event in self.scan_client.stream(job_id, offset=0):
+                if event.get('event') == 'result':
+                    event.pop('event')
+                    exporter.write(event)
+            message = ft.Text(f"Exported {exporter.count} results to {exporter.path}", color="blue")
+        except OSError as ex:
+            message = ft.Text(f"エクスポートエラー: {ex}", color="red")
+        finally:
+            exporter.close()
+        self.scan_output_log_area.controls.append(message)
+        self.page.update()
@@ -1,18 +1,163 @@
 import flet as ft
+import threading
+from services import tuning, resolver
+
+# --- Constants ---
+CALIBRATION_TARGET_DEFAULT = "127.0.0.1"
+
+# --- Calibration statuses ---
+CALIBRATION_STATUS_READY = "Ready"
+CALIBRATION_STATUS_RUNNING = "Calibrating..."
+CALIBRATION_STATUS_SAVED = "Saved"
+CALIBRATION_STATUS_VALUE_ERROR = "Value Error"
+
+# --- Editable fields ---
+# (キー, 表示名, 型)
+TUNING_FIELD_TYPES = {
+    'tcp_workers': ("TCP workers", int),
+    'udp_workers': ("UDP workers", int),
+    'tcp_timeout': ("TCP timeout (s)", float),
+    'udp_timeout': ("UDP timeout (s)", float),
+    'max_pps': ("Max pps", int),
+}
+
 
 class SettingsView(ft.Container):
+    """スキャンパラメータの自動調整（キャリブレーション）と、ネットワーク単位の調整値の編集"""
+
     def __init__(self, page: ft.Page):
         super().__init__()
         self.page = page
+
+        # --- Calibration Elements ---
+        self.target_input = ft.TextField(label="Target IP/Host", value=f"{CALIBRATION_TARGET_DEFAULT}", expand=True)
+        self.calibrate_button = ft.ElevatedButton("Calibrate", on_click=self.start_calibration)
+        self.status_text = ft.Text(f"{CALIBRATION_STATUS_READY}", size=16, color="blue")
+
+        # --- Tuned Parameters Table ---
+        self.tuning_table = ft.DataTable(
+            columns=[ft.DataColumn(ft.Text("Network"))]
+                    + [ft.DataColumn(ft.Text(label)) for label, _ in TUNING_FIELD_TYPES.values()]
+                    + [ft.DataColumn(ft.Text("RTT / Loss")), ft.DataColumn(ft.Text(""))],
+            rows=[],
+        )
+        self.field_inputs = {} # {network: {field: TextField}}
+
+        self.refresh_table()
         self.content = self.build()
 
     def build(self):
-        return ft.Column(
-            [
-                ft.Text("Settings", size=30, weight=ft.FontWeight.BOLD),
-                ft.Text("This is the settings page. More features will be added here."),
-            ],
-            alignment=ft.MainAxisAlignment.CENTER,
-            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        calibration_container = ft.Container(
+            content=ft.Column(
+                [
+                    ft.Text("Auto Tuning", style=ft.TextThemeStyle.TITLE_LARGE),
+                    ft.Text("Measure RTT, loss and local packet rate against a target to tune workers, rate and timeouts "
+                            "for its network.", size=12),
+                    ft.Row([self.target_input, self.calibrate_button]),
+                    ft.Row([ft.Text("Status:"), self.status_text]),
+                ]
+            ),
+            padding=15,
+            border=ft.border.all(1, ft.Colors.OUTLINE),
+            border_radius=ft.border_radius.all(10),
+            margin=ft.margin.only(bottom=20)
         )
-        
\ No newline at end of file
+
+        tuning_container = ft.Container(
+            content=ft.Column(
+                [
+                    ft.Row(
+                        [
+                            ft.Text("Tuned Networks", style=ft.TextThemeStyle.TITLE_LARGE),
+                            ft.ElevatedButton("Save", on_click=self.save_changes),
+                        ],
+                        alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+                    ),
+                    ft.Row([self.tuning_table], scroll="always"),
+                ],
+                scroll="always",
+                expand=True,
+            ),
+            padding=15,
+            border=ft.border.all(1, ft.Colors.OUTLINE),
+            border_radius=ft.border_radius.all(10),
+            expand=True,
+        )
+
+        return ft.Column([calibration_container, tuning_container], expand=True)
+
+    # --- Table ---
+    def refresh_table(self):
+        """保存済みの調整値で表を作り直す"""
+        self.tuning_table.rows.clear()
+        self.field_inputs = {}
+        for network, params in sorted(tuning.load_tuning().items()):
+            inputs = {
+                field: ft.TextField(value=str(params.get(field, "")), width=90, dense=True)
+                for field in TUNING_FIELD_TYPES
+            }
+            self.field_inputs[network] = inputs
+            rtt = params.get('rtt')
+            rtt_text = f"{rtt * 1000:.1f} ms" if rtt is not None else "-"
+            loss = params.get('loss')
+            loss_text = f"{loss * 100:.0f}%" if loss is not None else "-"
+            self.tuning_table.rows.append(
+                ft.DataRow(cells=[ft.DataCell(ft.Text(network))]
+                                 + [ft.DataCell(inputs[field]) for field in TUNING_FIELD_TYPES]
+                                 + [ft.DataCell(ft.Text(f"{rtt_text} / {loss_text}")),
+                                    ft.DataCell(ft.IconButton(icon=ft.Icons.DELETE, tooltip="Delete",
+                                                              on_click=lambda e, n=network: self.delete_network(n)))])
+            )
+
+    def save_changes(self, e):
+        """編集した調整値を検証して保存する"""
+        updates = {}
+        for network, inputs in self.field_inputs.items():
+            params = {}
+            for field, (label, value_type) in TUNING_FIELD_TYPES.items():
+                try:
+                    value = value_type(inputs[field].value)
+                except (TypeError, ValueError):
+                    value = None
+                if value is None or value <= 0:
+                    self.set_status(f"{CALIBRATION_STATUS_VALUE_ERROR}: {network} {label}", "red")
+                    return
+                params[field] = value
+            updates[network] = params
+
+        for network, params in updates.items():
+            tuning.update_tuned_params(network, params)
+        self.set_status(f"{CALIBRATION_STATUS_SAVED}", "green")
+
+    def delete_network(self, network: str):
+        tuning.delete_tuned_params(network)
+        self.refresh_table()
+        self.page.update()
+
+    def set_status(self, text: str, color: str):
+        self.status_text.value = text
+        self.status_text.color = color
+        self.page.update()
+
+    # --- Calibration ---
+    def start_calibration(self, e):
+        self.calibrate_button.disabled = True
+        self.set_status(f"{CALIBRATION_STATUS_RUNNING}", "orange")
+        threading.Thread(target=self.calibration_worker, args=(self.target_input.value.strip(),), daemon=True).start()
+
+    def calibration_worker(self, target: str):
+        try:
+            addresses = resolver.resolve_hosts([target]).get(target)
+            if not addresses:
+                self.set_status(f"{CALIBRATION_STATUS_VALUE_ERROR}: Cannot resolve {target}", "red")
+                return
+            target_ip = addresses[0]
+            params = tuning.calibrate(target_ip)
+            self.refresh_table()
+            self.set_status(f"{tuning.network_key(target_ip)}: {params['tcp_workers']} TCP workers, "
+                            f"{params['max_pps']} pps, timeout {params['tcp_timeout']}s", "green")
+        except Exception as ex:
+            self.set_status(f"Calibration error: {ex}", "red")
+        finally:
+            self.calibrate_button.disabled = False
+            self.page.update()